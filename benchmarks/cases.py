@@ -0,0 +1,146 @@
+"""
+The benchmarks, in groups that each create the images they need before yielding their benchmarks.
+"""
+from functools import partial
+from io import BytesIO, StringIO
+
+from django.core.management import call_command
+from django.template import Context, Template
+
+from benchmarks.originals import FORMATS, create_image
+
+# a spec for each operation, and the format conversions
+OPERATION_SPECS = [
+    'original',
+    'width-400',
+    'height-400',
+    'min-400x400',
+    'max-400x400',
+    'fill-400x300',
+    'crop-320x240x400x300',
+    'bgcolor-fff',
+    'jpegquality-60',
+    'webpquality-60|format-webp',
+    'format-png',
+    'format-jpeg',
+    'format-webp',
+]
+
+TEMPLATE_IMAGE_COUNT = 50
+
+REGENERATE_IMAGE_COUNT = 20
+REGENERATE_SPECS = ['width-400', 'fill-200x200', 'width-100']
+
+
+class Benchmark:
+    """
+    A function to time. setup runs before each repeat without being timed, number is how many times
+    the function is called each repeat and items how many things, such as images, each call handles.
+    The settings are overridden while it runs.
+    """
+
+    def __init__(self, name, func, setup=None, number=1, items=1, settings=None):
+        self.name = name
+        self.func = func
+        self.setup = setup
+        self.number = number
+        self.items = items
+        self.settings = settings or {}
+
+
+def filter_benchmarks(size_names):
+    """ Filter.run of each operation on each original, which includes opening and decoding it """
+    from images.filter import Filter
+
+    def run(filter, image):
+        filter.run(image, BytesIO())
+
+    for size_name in size_names:
+        for format_name in FORMATS:
+            image = create_image(size_name, format_name)
+
+            for spec in OPERATION_SPECS:
+                yield Benchmark(
+                    'filter.run[{}][{}-{}]'.format(spec, format_name, size_name),
+                    partial(run, Filter(spec), image)
+                )
+
+
+def rendition_benchmarks(size_names):
+    """ get_rendition of a rendition that exists, from the database and the rendition cache, and one that does not """
+    image = create_image('small', 'jpeg')
+    spec = 'width-400'
+    image.get_rendition(spec)
+
+    yield Benchmark('get_rendition.hit', partial(image.get_rendition, spec), number=100)
+    yield Benchmark(
+        'get_rendition.hit[lru-cache]', partial(image.get_rendition, spec), number=100,
+        settings={'IMAGES_RENDITION_CACHE': {'BACKEND': 'images.cache.LRURenditionCache'}}
+    )
+
+    for size_name in size_names:
+        for format_name in FORMATS:
+            image = create_image(size_name, format_name)
+
+            yield Benchmark(
+                'get_rendition.miss[{}-{}]'.format(format_name, size_name),
+                partial(image.get_rendition, spec),
+                setup=partial(image.renditions.all().delete)
+            )
+
+
+def template_benchmarks(size_names):
+    """ Rendering a template of {% image %} tags, including the query for the images """
+    from images.models import Image
+
+    spec = 'width-100'
+    pks = []
+    for i in range(TEMPLATE_IMAGE_COUNT):
+        image = create_image('small', 'jpeg')
+        image.get_rendition(spec)
+        pks.append(image.pk)
+
+    template = Template('{% load images_tags %}{% for image in images %}{% image image ' + spec + ' %}{% endfor %}')
+
+    def render(prefetch):
+        images = Image.objects.filter(pk__in=pks)
+        if prefetch:
+            images = images.prefetch_renditions(spec)
+
+        template.render(Context({'images': images}))
+
+    yield Benchmark(
+        'template.image_tags[{}]'.format(TEMPLATE_IMAGE_COUNT),
+        partial(render, False),
+        items=TEMPLATE_IMAGE_COUNT
+    )
+    yield Benchmark(
+        'template.image_tags[{}][prefetch]'.format(TEMPLATE_IMAGE_COUNT),
+        partial(render, True),
+        items=TEMPLATE_IMAGE_COUNT
+    )
+
+
+def regenerate_benchmarks(size_names):
+    """ The regenerate_renditions command creating a few renditions of each image, in this process """
+    for size_name in size_names:
+        pks = [create_image(size_name, 'jpeg').pk for i in range(REGENERATE_IMAGE_COUNT)]
+
+        yield Benchmark(
+            'regenerate_renditions[jpeg-{}]'.format(size_name),
+            partial(
+                call_command, 'regenerate_renditions',
+                '--ids', ','.join(str(pk) for pk in pks),
+                '--specs', ','.join(REGENERATE_SPECS),
+                stdout=StringIO()
+            ),
+            items=REGENERATE_IMAGE_COUNT
+        )
+
+
+GROUPS = [
+    ('filter', filter_benchmarks),
+    ('rendition', rendition_benchmarks),
+    ('template', template_benchmarks),
+    ('regenerate', regenerate_benchmarks),
+]
@@ -0,0 +1,62 @@
+"""
+Synthetic originals for the benchmarks.
+
+The pixels are drawn from a mandelbrot set rather than random noise so every run encodes and decodes
+exactly the same images, with enough detail that they compress like photos rather than flat colour.
+"""
+from io import BytesIO
+
+import PIL.Image
+from django.core.files.images import ImageFile
+
+SIZES = {
+    'small': (640, 480),
+    'medium': (1920, 1280),
+    'large': (6000, 4000),
+}
+
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg'),
+    'png': ('PNG', 'png'),
+    'gif': ('GIF', 'gif'),
+}
+
+
+def draw(size):
+    """ An RGB image of size """
+    mandelbrot = PIL.Image.effect_mandelbrot(size, (-2.2, -1.2, 0.8, 1.2), 100)
+
+    return PIL.Image.merge('RGB', (
+        mandelbrot,
+        mandelbrot.point(lambda value: 255 - value),
+        mandelbrot.transpose(PIL.Image.FLIP_LEFT_RIGHT),
+    ))
+
+
+_encoded = {}
+
+
+def get_original(size_name, format_name):
+    """ The file of an original of one of the SIZES saved in one of the FORMATS """
+    pil_format, extension = FORMATS[format_name]
+    key = (size_name, format_name)
+
+    if key not in _encoded:
+        pil_image = draw(SIZES[size_name])
+
+        if pil_format == 'GIF':
+            pil_image = pil_image.convert('P', palette=PIL.Image.ADAPTIVE)
+
+        f = BytesIO()
+        pil_image.save(f, pil_format)
+        _encoded[key] = f.getvalue()
+
+    return ImageFile(BytesIO(_encoded[key]), name='{}.{}'.format(size_name, extension))
+
+
+def create_image(size_name, format_name, **kwargs):
+    """ Creates an Image of an original """
+    from images.models import Image
+
+    kwargs.setdefault('title', '{} {}'.format(size_name, format_name))
+    return Image.objects.create(file=get_original(size_name, format_name), **kwargs)
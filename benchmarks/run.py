@@ -0,0 +1,219 @@
+"""
+Runs the benchmarks and writes the results as JSON, optionally comparing them to the results of an earlier run.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --group filter --only 'width|fill' --compare results.json
+
+The benchmarks run against a test database created for the run, sqlite unless ``BENCHMARK_DB_ENGINE`` is set,
+see ``benchmarks/settings.py``.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+
+def get_git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_meta(repeat):
+    import django
+    import PIL
+    import willow
+    from django.db import connection
+
+    return {
+        'created': datetime.utcnow().isoformat() + 'Z',
+        'git_revision': get_git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'django': django.get_version(),
+        'pillow': PIL.__version__,
+        'willow': getattr(willow, '__version__', None),
+        'database': connection.vendor,
+        'repeat': repeat,
+    }
+
+
+def measure(benchmark, repeat):
+    """ Times the benchmark repeat times, returns the stats of the seconds a call took """
+    from django.test.utils import override_settings
+
+    with override_settings(**benchmark.settings):
+        # the first call warms up anything compiled or cached, such as the filter
+        if benchmark.setup is not None:
+            benchmark.setup()
+        benchmark.func()
+
+        times = []
+        for i in range(repeat):
+            if benchmark.setup is not None:
+                benchmark.setup()
+
+            # collecting garbage part way through would add to whichever benchmark it happened in
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                started = time.perf_counter()
+                for j in range(benchmark.number):
+                    benchmark.func()
+                times.append((time.perf_counter() - started) / benchmark.number)
+            finally:
+                if gc_enabled:
+                    gc.enable()
+
+    median = statistics.median(times)
+    return {
+        'min': min(times),
+        'median': median,
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'repeat': repeat,
+        'number': benchmark.number,
+        'items': benchmark.items,
+        'items_per_second': benchmark.items / median if median else None,
+    }
+
+
+def run_benchmarks(groups, size_names, only, repeat, out):
+    from benchmarks.cases import GROUPS
+
+    results = {}
+
+    for group_name, group in GROUPS:
+        if group_name not in groups:
+            continue
+
+        for benchmark in group(size_names):
+            if only is not None and not only.search(benchmark.name):
+                continue
+
+            stats = measure(benchmark, repeat)
+            results[benchmark.name] = stats
+            out.write('{:<60} {:>10.3f} ms {:>10.1f} items/s\n'.format(
+                benchmark.name, stats['median'] * 1000, stats['items_per_second'] or 0))
+            out.flush()
+
+    return results
+
+
+def compare(results, baseline, threshold, out):
+    """ Writes the change in median of each benchmark in both runs, returns the names of those slower by threshold """
+    regressions = []
+
+    for name, stats in results.items():
+        if name not in baseline or not baseline[name]['median']:
+            continue
+
+        ratio = stats['median'] / baseline[name]['median']
+        slower = ratio > 1 + threshold
+        if slower:
+            regressions.append(name)
+
+        out.write('{:<60} {:>+8.1f}%{}\n'.format(name, (ratio - 1) * 100, '  REGRESSION' if slower else ''))
+
+    return regressions
+
+
+def get_parser():
+    from benchmarks.cases import GROUPS
+    from benchmarks.originals import SIZES
+
+    group_names = [name for name, group in GROUPS]
+
+    parser = argparse.ArgumentParser(description='Benchmark the filter pipeline and rendition lookups')
+    parser.add_argument(
+        '--output',
+        help='File to write the results to as JSON'
+    )
+    parser.add_argument(
+        '--compare',
+        help='JSON results of an earlier run to compare to, exits with status 1 if anything got slower'
+    )
+    parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='How much slower a benchmark can get before it is a regression, 0.1 being 10%%'
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='Number of times each benchmark is timed'
+    )
+    parser.add_argument(
+        '--group', action='append', choices=group_names,
+        help='Only run this group of benchmarks, can be given more than once'
+    )
+    parser.add_argument(
+        '--only',
+        help='Only run benchmarks with names matching this regular expression'
+    )
+    parser.add_argument(
+        '--sizes', default='small,medium',
+        help='Comma separated sizes of originals to benchmark, of {}'.format(', '.join(SIZES))
+    )
+    return parser
+
+
+def main(argv=None):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.test.utils import setup_databases, teardown_databases
+    from benchmarks.cases import GROUPS
+    from benchmarks.originals import SIZES
+
+    parser = get_parser()
+    args = parser.parse_args(argv)
+
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+
+    size_names = [name.strip() for name in args.sizes.split(',') if name.strip()]
+    for name in size_names:
+        if name not in SIZES:
+            parser.error('unknown size {}'.format(name))
+
+    groups = args.group or [name for name, group in GROUPS]
+    only = re.compile(args.only) if args.only else None
+
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        meta = get_meta(args.repeat)
+        results = run_benchmarks(groups, size_names, only, args.repeat, sys.stdout)
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': meta, 'benchmarks': results}, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['benchmarks']
+
+        sys.stdout.write('\nCompared to {}\n'.format(args.compare))
+        if compare(results, baseline, args.threshold, sys.stdout):
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
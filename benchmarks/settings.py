@@ -0,0 +1,28 @@
+"""
+Settings the benchmarks run with, the test settings using a temporary media root.
+
+The database is sqlite unless ``BENCHMARK_DB_ENGINE`` is set, for example to ``django.db.backends.postgresql_psycopg2``
+with the ``RDS_*`` variables the example project uses for the connection.
+"""
+import tempfile
+from os import environ
+
+from tests.settings import *  # noqa: F403
+
+if environ.get('BENCHMARK_DB_ENGINE'):
+    DATABASES = {
+        'default': {
+            'ENGINE': environ['BENCHMARK_DB_ENGINE'],
+            'HOST': environ.get('RDS_HOSTNAME'),
+            'PORT': environ.get('RDS_PORT'),
+            'NAME': environ.get('RDS_DB_NAME'),
+            'USER': environ.get('RDS_USERNAME'),
+            'PASSWORD': environ.get('RDS_PASSWORD'),
+        }
+    }
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='images-benchmarks-')
+
+# images are created without renditions so each benchmark decides which exist
+IMAGES_DEFAULT_FILTER_SPECS = []
+IMAGES_THUMBNAIL_FILTER_SPEC = None
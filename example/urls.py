@@ -1,12 +1,13 @@
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 
 from example.views import ImageList
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('images/', include('images.urls')),
     path('', ImageList.as_view())
 ]
 
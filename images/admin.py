@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.safestring import mark_safe
 
 from images.forms import ImageForm
-from images.models import Image, Rendition
+from images.models import Image, Rendition, RenditionJob
 from images.shortcuts import get_rendition_or_not_found
 
 
@@ -26,5 +26,14 @@ class RenditionAdmin(admin.ModelAdmin):
         return False
 
 
+class RenditionJobAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'filter_spec', 'created_at', 'started_at', 'attempts']
+    readonly_fields = ['image', 'filter_spec', 'created_at', 'started_at', 'attempts', 'error']
+
+    def has_add_permission(self, request):
+        return False
+
+
 admin.site.register(Image, ImageAdmin)
 admin.site.register(Rendition, RenditionAdmin)
+admin.site.register(RenditionJob, RenditionJobAdmin)
@@ -0,0 +1,148 @@
+"""
+Animated GIF renditions, with ``IMAGES_ANIMATED_RENDITIONS``.
+
+The frames of an animation are decoded and run through the operations one at a time, so however many
+frames it has only one frame of the original is ever held decoded. Before anything is decoded the frames
+are counted from the file's block headers, and an animation with more than ``IMAGES_ANIMATION_MAX_FRAMES``
+frames, or more than ``IMAGES_ANIMATION_MAX_PIXELS`` pixels over all of its frames, is rendered as a
+still of its first frame instead.
+"""
+import logging
+
+from PIL import Image as PIL_Image
+from willow.plugins.pillow import PillowImage
+
+from images.conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+# the output formats that can be animated
+ANIMATED_FORMATS = ('gif', 'webp')
+
+GIF_EXTENSION = b'\x21'
+GIF_IMAGE = b'\x2c'
+GIF_TRAILER = b'\x3b'
+
+
+def skip_sub_blocks(f):
+    """ Skips the data sub blocks at the position of f, up to and including the terminator """
+    while True:
+        length = f.read(1)
+        if not length or length == b'\x00':
+            return
+        f.seek(ord(length), 1)
+
+
+def count_gif_frames(f, limit=None):
+    """
+    Counts the frames of the gif file f from its block headers, without decoding any of them.
+    Stops counting once there are more than limit.
+    """
+    f.seek(0)
+    header = f.read(13)
+    if len(header) < 13 or header[:3] != b'GIF':
+        return 0
+
+    # the global color table follows the logical screen descriptor
+    flags = header[10]
+    if flags & 0x80:
+        f.seek(3 * 2 ** ((flags & 0x07) + 1), 1)
+
+    frames = 0
+    while limit is None or frames <= limit:
+        introducer = f.read(1)
+
+        if introducer == GIF_EXTENSION:
+            f.seek(1, 1)
+            skip_sub_blocks(f)
+
+        elif introducer == GIF_IMAGE:
+            descriptor = f.read(9)
+            if len(descriptor) < 9:
+                break
+
+            frames += 1
+
+            # the local color table and the lzw minimum code size come before the image data
+            flags = descriptor[8]
+            if flags & 0x80:
+                f.seek(3 * 2 ** ((flags & 0x07) + 1), 1)
+            f.seek(1, 1)
+            skip_sub_blocks(f)
+
+        else:
+            # the trailer, or the end of a truncated file
+            break
+
+    return frames
+
+
+def quantize_frame(pil_image):
+    """
+    Converts a processed frame to a palette of at most 256 colours, a byte a pixel rather than the four of RGBA.
+    Pixels under half opaque become transparent, as gif has no partial transparency.
+    """
+    if pil_image.mode == 'P':
+        return pil_image
+
+    frame = pil_image.convert('RGB').quantize(colors=255, method=PIL_Image.FASTOCTREE)
+
+    if pil_image.mode == 'RGBA':
+        transparent = pil_image.getchannel('A').point(lambda alpha: 255 if alpha < 128 else 0, '1')
+
+        if transparent.getbbox():
+            # the last colour of the palette is kept free for the transparent pixels
+            palette = frame.getpalette()[:255 * 3]
+            frame.putpalette(palette + [0] * (256 * 3 - len(palette)))
+            frame.paste(255, mask=transparent)
+            frame.info['transparency'] = 255
+
+    return frame
+
+
+class Animation:
+    """ An animated original, whose frames are decoded one at a time as they are iterated over """
+
+    def __init__(self, pil_image, frame_count):
+        self.image = pil_image
+        self.frame_count = frame_count
+        self.size = pil_image.size
+
+        # without a loop count the animation plays once
+        self.loop = pil_image.info.get('loop')
+
+    def frames(self):
+        """ Yields each frame as a willow image and how many milliseconds it is shown for """
+        for index in range(self.frame_count):
+            try:
+                self.image.seek(index)
+            except EOFError:
+                # counted from a damaged block Pillow could not read
+                return
+
+            yield PillowImage(self.image.convert('RGBA')), self.image.info.get('duration', 0)
+
+
+def open_animation(willow):
+    """
+    Opens the original of a willow image as an Animation when it is an animated gif within the limits,
+    returns None when it should be rendered as a still. Only the header of the file is read.
+    """
+    if not get_setting('ANIMATED_RENDITIONS') or willow.format_name != 'gif':
+        return None
+
+    max_frames = get_setting('ANIMATION_MAX_FRAMES')
+    frame_count = count_gif_frames(willow.f, max_frames)
+    if frame_count < 2:
+        return None
+
+    willow.f.seek(0)
+    pil_image = PIL_Image.open(willow.f)
+    width, height = pil_image.size
+
+    if frame_count > max_frames or width * height * frame_count > get_setting('ANIMATION_MAX_PIXELS'):
+        logger.info('Rendering a still of an animation over the limits, {} frames of {}x{}'.format(
+            '{}+'.format(frame_count) if frame_count > max_frames else frame_count, width, height))
+        return None
+
+    return Animation(pil_image, frame_count)
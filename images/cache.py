@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from images.conf import load_backend
+
+logger = logging.getLogger(__name__)
+
+# whether the per process cache has been warned about, so the warning is logged once per process
+_warned_lru_cache = False
+
+
+class BaseRenditionCache:
+    """
+    Base class for rendition lookup caches.
+
+    Keys are ``(image_id, filter_spec, focal_point_key)`` tuples and values are
+    ``(rendition_id, file_name, width, height)`` tuples. The rendition url cache uses the
+    same backends with ``(file_name,)`` keys and urls as values.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRURenditionCache(BaseRenditionCache):
+    """
+    In-process cache bounded by ``max_size`` entries, each living for ``timeout`` seconds.
+    Renditions deleted or changed by another process stay in it until they time out, use ``DjangoRenditionCache``
+    with a shared cache when renditions are served by more than one process.
+    """
+
+    def __init__(self, max_size=1000, timeout=300):
+        global _warned_lru_cache
+
+        if not _warned_lru_cache:
+            _warned_lru_cache = True
+            logger.warning(
+                'LRURenditionCache is kept in each process, renditions deleted by another process are served from '
+                'it for up to {} seconds. Use DjangoRenditionCache with a shared cache when running more than one '
+                'process.'.format(timeout)
+            )
+
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return None
+
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.timeout if self.timeout is not None else None
+
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+
+            # evict the least recently used entries
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoRenditionCache(BaseRenditionCache):
+    """
+    Cache backed by one of the caches configured in the ``CACHES`` setting.
+
+    Entries are stored with the generation of the cache, a token under ``<key_prefix>:generation``. Clearing it
+    replaces the token rather than clearing the django cache, which other apps and sessions may share.
+    """
+
+    def __init__(self, alias=DEFAULT_CACHE_ALIAS, timeout=DEFAULT_TIMEOUT, key_prefix='images-rendition'):
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self.generation_key = '{}:generation'.format(key_prefix)
+
+    def make_key(self, key):
+        # specs and file names can be long and contain characters some backends don't allow in keys
+        digest = hashlib.md5(':'.join(str(part) for part in key).encode('utf-8')).hexdigest()
+        return '{}:{}'.format(self.key_prefix, digest)
+
+    def get(self, key):
+        key = self.make_key(key)
+
+        # the entry and the generation are read together, an entry of an earlier generation was cleared
+        values = self.cache.get_many([key, self.generation_key])
+        if key not in values:
+            return None
+
+        generation, value = values[key]
+        if generation != values.get(self.generation_key):
+            return None
+
+        return value
+
+    def set(self, key, value):
+        generation = self.cache.get(self.generation_key)
+        self.cache.set(self.make_key(key), (generation, value), self.timeout)
+
+    def delete(self, key):
+        self.cache.delete(self.make_key(key))
+
+    def clear(self):
+        self.cache.set(self.generation_key, uuid.uuid4().hex, None)
+
+
+def get_rendition_cache():
+    """
+    Returns the rendition cache configured in the ``IMAGES_RENDITION_CACHE`` setting,
+    or None when the cache is disabled.
+    """
+    return load_backend('RENDITION_CACHE')
+
+
+def get_rendition_url_cache():
+    """
+    Returns the cache of rendition urls configured in the ``IMAGES_RENDITION_URL_CACHE`` setting,
+    or None when the cache is disabled.
+    """
+    return load_backend('RENDITION_URL_CACHE')
+
+
+def get_rendition_cache_key(image_id, filter_spec, focal_point_key):
+    return image_id, filter_spec, focal_point_key
+
+
+def get_rendition_cache_value(rendition):
+    return rendition.pk, rendition.file.name, rendition.width, rendition.height
+
+
+def get_rendition_url_cache_key(file_name):
+    return file_name,
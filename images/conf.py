@@ -1,14 +1,38 @@
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
 
 
 SETTINGS_PREFIX = 'IMAGES'
 
 SETTINGS_DEFAULTS = {
+    'ANIMATED_RENDITIONS': False,
+    'ANIMATION_MAX_FRAMES': 300,
+    'ANIMATION_MAX_PIXELS': 100 * 1000 * 1000,
+    'ASYNC_DEFAULT_RENDITIONS': False,
+    'ASYNC_RENDITIONS': False,
+    'AVIF_QUALITY': 80,
+    'CASCADE_RENDITIONS': False,
     'CLEAR_RENDITIONS_ON_SAVE': True,
+    'CONTENT_ADDRESSED_RENDITIONS': False,
+    'DEDUPLICATE_UPLOADS': False,
     'DEFAULT_FILTER_SPECS': [
         'original',
     ],
+    'FILTER_CACHE_SIZE': 1000,
     'JPG_QUALITY': 85,
+    'METRICS': None,
+    'RENDITION_CACHE': None,
+    'RENDITION_JOB_MAX_ATTEMPTS': 3,
+    'RENDITION_JOB_TIMEOUT': 600,
+    'RENDITION_LOCK_CACHE': 'default',
+    'RENDITION_LOCK_DIR': None,
+    'RENDITION_LOCK_TIMEOUT': 30,
+    'RENDITION_SPOOL_MAX_SIZE': 1024 * 1024,
+    'RENDITION_URL_CACHE': None,
+    'SERVE_CACHE_MAX_AGE': 60 * 60 * 24 * 30,
+    'SINGLE_FLIGHT_RENDITIONS': False,
+    'SKIP_DIMENSION_UPDATE': False,
     'ALLOWED_FILE_EXTENSIONS': [
         '.jpeg',
         '.jpg',
@@ -16,9 +40,40 @@ SETTINGS_DEFAULTS = {
         '.gif'
     ],
     'THUMBNAIL_FILTER_SPEC': 'width-100',
+    'WEBP_QUALITY': 80,
 }
 
 
 def get_setting(name):
     setting_key = '{}_{}'.format(SETTINGS_PREFIX, name)
     return getattr(settings, setting_key, SETTINGS_DEFAULTS[name])
+
+
+_backends = {}
+
+
+def load_backend(name):
+    """
+    Returns the backend configured in the ``IMAGES_<name>`` setting, created once from the ``BACKEND`` class path
+    and its ``OPTIONS``, or None when the setting is empty. Used for the rendition caches and the metrics.
+    """
+    if name not in _backends:
+        config = get_setting(name)
+
+        if config:
+            backend = import_string(config['BACKEND'])
+            _backends[name] = backend(**config.get('OPTIONS', {}))
+        else:
+            _backends[name] = None
+
+    return _backends[name]
+
+
+def reset_backends(setting, **kwargs):
+    prefix = '{}_'.format(SETTINGS_PREFIX)
+
+    if setting.startswith(prefix):
+        _backends.pop(setting[len(prefix):], None)
+
+
+setting_changed.connect(reset_backends)
@@ -0,0 +1,69 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import models
+from django.db.models.fields.files import ImageFieldFile as BaseImageFieldFile
+
+from images.conf import get_setting
+
+
+_local = threading.local()
+
+
+class StorageReads:
+    """ The number of files opened from storage inside a ``count_storage_reads`` block """
+
+    def __init__(self):
+        self.count = 0
+
+
+@contextmanager
+def count_storage_reads():
+    """ Counts the image files opened from storage inside the block, on this thread """
+    counters = _local.__dict__.setdefault('counters', [])
+    counter = StorageReads()
+    counters.append(counter)
+
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+
+def record_storage_read():
+    for counter in getattr(_local, 'counters', ()):
+        counter.count += 1
+
+
+class ImageFieldFile(BaseImageFieldFile):
+
+    def open(self, mode='rb'):
+        # an uncommitted file is an upload still in memory or on local disk
+        if self._committed and self.closed:
+            record_storage_read()
+
+        return super().open(mode)
+
+
+class ImageField(models.ImageField):
+    """
+    An image field that can keep the dimensions it is given.
+
+    Django reads the dimensions of the file again whenever a file is assigned, including the name of
+    the file just written to storage on save. With ``IMAGES_SKIP_DIMENSION_UPDATE`` the width and height
+    already set are kept for files that are in storage, only files not yet stored are read.
+    """
+
+    attr_class = ImageFieldFile
+
+    def update_dimension_fields(self, instance, force=False, *args, **kwargs):
+        if force and get_setting('SKIP_DIMENSION_UPDATE') and self.attname in instance.__dict__:
+            file = getattr(instance, self.attname)
+
+            dimension_fields_filled = all(
+                getattr(instance, field) for field in (self.width_field, self.height_field) if field)
+
+            if file and file._committed and dimension_fields_filled:
+                return
+
+        super().update_dimension_fields(instance, force, *args, **kwargs)
@@ -1,10 +1,200 @@
 import hashlib
+import math
+import tempfile
+import threading
+from collections import OrderedDict
 
 from django.utils.functional import cached_property
+from PIL import Image as PIL_Image
+from willow.image import GIFImageFile, WebPImageFile
+from willow.plugins.pillow import PillowImage
 
+from images import metrics
 from images import operations as image_operations
+from images.animation import ANIMATED_FORMATS, open_animation, quantize_frame
 from images.conf import get_setting
 from images.exceptions import InvalidFilterSpecError
+from images.operations.format import has_avif_encoder
+
+
+class SizeOnlyImage:
+    """
+    Stands in for a willow image but only tracks its size and how much it has been scaled,
+    so the operations can be run to work out how small the original could be decoded.
+    """
+
+    def __init__(self, size, scale=1):
+        self.size = tuple(size)
+
+        # how much the image has been scaled down from the size it started at
+        self.scale = scale
+
+    def get_size(self):
+        return self.size
+
+    def crop(self, rect):
+        left, top, right, bottom = rect
+        width, height = self.size
+
+        # clamp to the image boundaries in the same way as willow does
+        left, top = max(0, left), max(0, top)
+        right, bottom = min(right, width), min(bottom, height)
+
+        return SizeOnlyImage((right - left, bottom - top), self.scale)
+
+    def resize(self, size):
+        width, height = self.size
+        scale = max(size[0] / max(width, 1), size[1] / max(height, 1))
+        return SizeOnlyImage(size, self.scale * scale)
+
+    def set_background_color_rgb(self, color):
+        return self
+
+
+# the reduced decode is kept at least this many times larger than needed so the final resize still
+# has enough pixels to filter, the same as Pillow's thumbnail does
+DRAFT_REDUCING_GAP = 2
+
+# exif orientations that swap the width and height
+EXIF_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def is_transposed(willow):
+    """ True if the opened original is a photo whose exif orientation swaps its width and height """
+    if willow.format_name != 'jpeg':
+        return False
+
+    # only reads the header
+    willow.f.seek(0)
+    exif = PIL_Image.open(willow.f)._getexif() or {}
+    return exif.get(0x0112) in EXIF_TRANSPOSED_ORIENTATIONS
+
+
+def open_reduced(willow, filters, image):
+    """
+    Decodes a jpeg at the smallest of its 1/2, 1/4 or 1/8 scales that is still large enough for every filter.
+    Returns the willow image and its (x, y) scale against a full size decode, or None when it is full size.
+    """
+    if willow.format_name != 'jpeg':
+        return willow, None
+
+    # only reads the header
+    willow.f.seek(0)
+    pil_image = PIL_Image.open(willow.f)
+    width, height = pil_image.size
+
+    exif = pil_image._getexif() or {}
+    transposed = exif.get(0x0112) in EXIF_TRANSPOSED_ORIENTATIONS
+    oriented_size = (height, width) if transposed else (width, height)
+
+    decode_scale = max(filter.get_decode_scale(oriented_size, image) for filter in filters) * DRAFT_REDUCING_GAP
+    if decode_scale > 0.5:
+        return willow, None
+
+    pil_image.draft(None, (int(math.ceil(width * decode_scale)), int(math.ceil(height * decode_scale))))
+    if pil_image.size == (width, height):
+        # the decoder could not reduce it
+        return willow, None
+
+    pil_image.load()
+
+    scale_x, scale_y = pil_image.size[0] / width, pil_image.size[1] / height
+    return PillowImage(pil_image), (scale_y, scale_x) if transposed else (scale_x, scale_y)
+
+
+def get_output_file():
+    """
+    A file to write a rendition to before it is stored, kept in memory until it
+    grows past ``RENDITION_SPOOL_MAX_SIZE`` bytes and then moved to a temporary file.
+    """
+    return tempfile.SpooledTemporaryFile(max_size=get_setting('RENDITION_SPOOL_MAX_SIZE'))
+
+
+def expand_spec(spec):
+    """ Replaces the aliases in a filter spec with the spec they stand for """
+    if 'thumbnail' in spec:
+        spec = spec.replace('thumbnail', get_setting('THUMBNAIL_FILTER_SPEC'))
+
+    return spec
+
+
+def canonicalize_spec(spec):
+    """
+    Returns the canonical form of a filter spec so that equivalent specs share a rendition.
+    Aliases are expanded, 'original' is dropped when combined with other operations and the
+    operations that only change how the result is saved are moved to the end in name order,
+    keeping the last of each as that is the one that takes effect. An unresolved format-auto is
+    dropped as it keeps the format the spec would have without it.
+    """
+    Filter._search_for_operations()
+
+    op_specs = []
+    output_op_specs = {}
+
+    for op_spec in expand_spec(spec).split('|'):
+        op_name = op_spec.split('-')[0]
+        op_class = Filter._registered_operations.get(op_name)
+
+        if op_spec == 'format-auto':
+            continue
+        elif op_class is not None and op_class.output_only:
+            output_op_specs[op_name] = op_spec
+        elif op_spec != 'original':
+            op_specs.append(op_spec)
+
+    op_specs += [output_op_specs[op_name] for op_name in sorted(output_op_specs)]
+
+    return '|'.join(op_specs or ['original'])
+
+
+def get_accepted_types(accept):
+    """ the media types an Accept header allows, leaving out any given a quality of 0 """
+    accepted = set()
+
+    for part in accept.split(','):
+        media_type, _, params = part.partition(';')
+        quality = 1
+
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    pass
+
+        if quality > 0:
+            accepted.add(media_type.strip().lower())
+
+    return accepted
+
+
+def has_auto_format(spec):
+    """ True if the output format of a filter spec is negotiated, its last format operation being format-auto """
+    format_op_specs = [op_spec for op_spec in expand_spec(spec).split('|') if op_spec.split('-')[0] == 'format']
+    return bool(format_op_specs) and format_op_specs[-1] == 'format-auto'
+
+
+def resolve_auto_format(spec, accept):
+    """
+    Replaces format-auto in a filter spec with the best format the request's Accept header allows,
+    avif then webp. When neither is accepted it is removed so the rendition keeps the original format.
+    """
+    op_specs = spec.split('|')
+    if 'format-auto' not in op_specs:
+        return spec
+
+    accepted = get_accepted_types(accept)
+
+    if 'image/avif' in accepted and has_avif_encoder():
+        output_format = 'format-avif'
+    elif 'image/webp' in accepted:
+        output_format = 'format-webp'
+    else:
+        output_format = None
+
+    op_specs = [output_format if op_spec == 'format-auto' else op_spec for op_spec in op_specs]
+    return '|'.join(op_spec for op_spec in op_specs if op_spec) or 'original'
 
 
 class Filter:
@@ -19,9 +209,8 @@ class Filter:
         # Build list of operation objects
         operations = []
 
-        # if a thumbnail is requested replace the spec with the deftault spec for a thumbnail
-        if 'thumbnail' in self.spec:
-            self.spec = self.spec.replace('thumbnail', get_setting('THUMBNAIL_FILTER_SPEC'))
+        # expand aliases such as the thumbnail and put the spec in its canonical form
+        self.spec = canonicalize_spec(self.spec)
 
         # ensure all requested specs are valid and build the list of operations
         for op_spec in self.spec.split('|'):
@@ -32,52 +221,220 @@ class Filter:
 
             op_class = self._registered_operations[op_spec_parts[0]]
             operations.append(op_class(*op_spec_parts))
-        return operations
+        return tuple(operations)
 
     def run(self, image, output):
         with image.get_willow_image() as willow:
             original_format = willow.format_name
 
+            animation = open_animation(willow)
+            if self.animates(animation, willow, image):
+                generated_image, size = self.process_animation(animation, image, output)
+                return generated_image
+
+            # Decode large jpegs at a reduced size where the operations shrink them
+            willow, scale = open_reduced(willow, [self], image)
+
             # Fix orientation of image
             willow = willow.auto_orient()
 
+            generated_image, size = self.process(willow, image, output, original_format, scale)
+            return generated_image
+
+    def process(self, willow, image, output, original_format, scale=None):
+        """
+        Runs the operations on an already opened and oriented willow image and saves the result to output.
+        The willow image is left untouched so it can be shared between filters.
+        scale is the (x, y) scale of an image decoded at a reduced size by open_reduced.
+        Returns the saved willow image and its (width, height).
+        """
+        env = {
+            'original-format': original_format,
+        }
+
+        if scale is not None:
+            env['scale'] = scale
+
+        for operation in self.operations:
+            with metrics.timer('operation', operation=operation.method):
+                willow = operation.run(willow, image, env) or willow
+
+        if 'scale' in env:
+            # nothing resized the reduced image, bring it to the size a full size decode would give
+            width, height = willow.get_size()
+            scale_x, scale_y = env['scale']
+            willow = willow.resize((int(round(width / scale_x)), int(round(height / scale_y))))
+
+        with metrics.timer('encode') as tags:
+            generated_image = self.save(willow, output, env)
+            tags['format'] = generated_image.format_name
+
+        return generated_image, willow.get_size()
+
+    def animates(self, animation, willow, image):
+        """ True if the rendition of an original opened as an animation by open_animation is animated too """
+        if animation is None or self.is_poster:
+            return False
+
+        return self.predict_output_format(willow, image, 'gif', animated=True) in ANIMATED_FORMATS
+
+    def process_animation(self, animation, image, output):
+        """
+        Runs the operations on each frame of an animation in turn and saves them as an animated image to output,
+        so only one frame of the original is decoded at a time.
+        Returns the saved willow image and its (width, height).
+        """
+        frames = []
+        durations = []
+
+        for willow, duration in animation.frames():
             env = {
-                'original-format': original_format,
+                'original-format': 'gif',
+                'animated': True,
             }
 
             for operation in self.operations:
-                willow = operation.run(willow, image, env) or willow
+                with metrics.timer('operation', operation=operation.method):
+                    willow = operation.run(willow, image, env) or willow
+
+            # the processed frames are kept to be saved together, in a palette as the gif would be, so at a byte a
+            # pixel they take up to IMAGES_ANIMATION_MAX_PIXELS bytes when the frames are not made smaller
+            frames.append(quantize_frame(willow.image))
+            durations.append(duration)
+
+        output_format = self.get_output_format(willow, env)
+        options = {
+            'save_all': True,
+            'append_images': frames[1:],
+            'duration': durations,
+        }
+
+        if animation.loop is not None:
+            options['loop'] = animation.loop
+
+        with metrics.timer('encode', format=output_format):
+            if output_format == 'webp':
+                frames[0].save(output, 'WEBP', quality=env.get('webp-quality', get_setting('WEBP_QUALITY')), **options)
+                generated_image = WebPImageFile(output)
+            else:
+                # the frames are whole, each one replaces the last
+                frames[0].save(output, 'GIF', disposal=2, **options)
+                generated_image = GIFImageFile(output)
+
+        return generated_image, frames[0].size
+
+    def get_output_format(self, willow, env):
+        """ The format the operations asked for, otherwise one based on the original format """
+        if 'output-format' in env:
+            # Developer specified an output format
+            return env['output-format']
+
+        # Default to outputting in original format
+        output_format = env['original-format']
+
+        # Convert unanimated GIFs to PNG as well
+        if output_format == 'gif' and not (env.get('animated') or willow.has_animation()):
+            output_format = 'png'
+
+        return output_format
+
+    def predict_output_format(self, willow, image, original_format, animated=False):
+        """
+        The format the filter will save the opened original willow image in, without processing it.
+        animated is True when the original is being rendered as an animation.
+        """
+        env = {
+            'original-format': original_format,
+            'animated': animated,
+        }
+
+        for operation in self.operations:
+            if operation.output_only:
+                operation.run(willow, image, env)
+
+        return self.get_output_format(willow, env)
 
-            if 'output-format' in env:
-                # Developer specified an output format
-                output_format = env['output-format']
+    def save(self, willow, output, env):
+        """ Saves the processed willow image to output in the format the operations asked for """
+        output_format = self.get_output_format(willow, env)
 
+        if output_format == 'jpeg':
+            # set the quality
+            if 'jpeg-quality' in env:
+                quality = env['jpeg-quality']
             else:
-                # Default to outputting in original format
-                output_format = original_format
+                quality = get_setting('JPG_QUALITY')
 
-                # Convert unanimated GIFs to PNG as well
-                if original_format == 'gif' and not willow.has_animation():
-                    output_format = 'png'
+            # If the image has an alpha channel, give it a white background
+            if willow.has_alpha():
+                willow = willow.set_background_color_rgb((255, 255, 255))
 
-            if output_format == 'jpeg':
-                # set the quality
-                if 'jpeg-quality' in env:
-                    quality = env['jpeg-quality']
-                else:
-                    quality = get_setting('JPG_QUALITY')
+            return willow.save_as_jpeg(output, quality=quality, progressive=True, optimize=True)
 
-                # If the image has an alpha channel, give it a white background
-                if willow.has_alpha():
-                    willow = willow.set_background_color_rgb((255, 255, 255))
+        elif output_format == 'png':
+            return willow.save_as_png(output)
 
-                return willow.save_as_jpeg(output, quality=quality, progressive=True, optimize=True)
+        elif output_format == 'gif':
+            return willow.save_as_gif(output)
 
-            elif output_format == 'png':
-                return willow.save_as_png(output)
+        elif output_format == 'webp':
+            quality = env.get('webp-quality', get_setting('WEBP_QUALITY'))
+            return willow.save_as_webp(output, quality=quality)
 
-            elif output_format == 'gif':
-                return willow.save_as_gif(output)
+        elif output_format == 'avif':
+            quality = env.get('avif-quality', get_setting('AVIF_QUALITY'))
+            return willow.save_as_avif(output, quality=quality)
+
+    @property
+    def is_resize_only(self):
+        """ True if the filter only scales the whole image, ignoring operations that only change how it is saved """
+        return all(operation.resize_only or operation.output_only for operation in self.operations)
+
+    @property
+    def is_poster(self):
+        """ True if the filter renders animated originals as a still """
+        return any(isinstance(operation, image_operations.PosterOperation) for operation in self.operations)
+
+    @property
+    def is_cascade_source(self):
+        """ True if the filter's renditions can be used in place of the original by resize only filters """
+        return all(operation.resize_only for operation in self.operations)
+
+    def get_decode_scale(self, size, image):
+        """
+        Returns the smallest scale an image of size could be decoded at and still give the same rendition,
+        1 if the operations need it at full size.
+        """
+        willow = SizeOnlyImage(size)
+        env = {}
+
+        for operation in self.operations:
+            willow = operation.run(willow, image, env) or willow
+
+        return min(willow.scale, 1)
+
+    def predict_size(self, image):
+        """
+        Returns the (width, height) the rendition of the image will have without generating it,
+        using only the image's stored dimensions and focal point. Photos with an exif orientation
+        that swaps their width and height are stored unrotated, so the prediction is for that size.
+        """
+        size = (image.width, image.height)
+
+        for operation in self.operations:
+            size = operation.get_output_size(size, image)
+
+        return size
+
+    def predict_sizes(self, sizes, focal_points):
+        """
+        predict_size for many images at once, given arrays of their sizes and focal point rects as made by
+        ``images.geometry.get_image_arrays``. Returns an integer array of a (width, height) row for each image.
+        """
+        for operation in self.operations:
+            sizes = operation.get_output_sizes(sizes, focal_points)
+
+        return sizes.astype(int)
 
     def get_cache_key(self, image):
         vary_parts = []
@@ -110,9 +467,51 @@ class Filter:
             ('max', image_operations.MinMaxOperation),
             ('fill', image_operations.FillOperation),
             ('jpegquality', image_operations.JPEGQualityOperation),
+            ('webpquality', image_operations.WebPQualityOperation),
+            ('avifquality', image_operations.AVIFQualityOperation),
             ('format', image_operations.FormatOperation),
             ('bgcolor', image_operations.BackgroundColorOperation),
             ('crop', image_operations.CropOperation),
+            ('poster', image_operations.PosterOperation),
         ]
 
         cls._registered_operations = dict(operations)
+
+
+_compiled_filters = OrderedDict()
+_compiled_filters_lock = threading.Lock()
+
+
+def get_filter(spec):
+    """
+    Returns a compiled filter for the canonical form of the spec, shared by everything asking for an equivalent spec.
+    The filters are kept in a cache bounded by ``FILTER_CACHE_SIZE``. Invalid specs are kept too,
+    so asking for one again raises InvalidFilterSpecError without parsing it again.
+    """
+    spec = canonicalize_spec(spec)
+
+    with _compiled_filters_lock:
+        filter = _compiled_filters.get(spec)
+        if filter is not None:
+            _compiled_filters.move_to_end(spec)
+
+    if filter is None:
+        filter = Filter(spec=spec)
+
+        try:
+            # compile the operations now so callers never do
+            filter.operations
+        except InvalidFilterSpecError as e:
+            filter = InvalidFilterSpecError(*e.args)
+
+        with _compiled_filters_lock:
+            _compiled_filters[spec] = filter
+
+            # evict the least recently used filters
+            while len(_compiled_filters) > get_setting('FILTER_CACHE_SIZE'):
+                _compiled_filters.popitem(last=False)
+
+    if isinstance(filter, InvalidFilterSpecError):
+        raise InvalidFilterSpecError(*filter.args)
+
+    return filter
@@ -0,0 +1,269 @@
+"""
+Crop rects and output sizes of many images at once with NumPy, for planning and predicting the sizes of renditions
+of thousands of images without building a Rect for each. These give exactly the results of the ``Rect`` methods
+and ``get_output_size`` of the operations, one row per image.
+
+Sizes are arrays of (width, height) rows, rects arrays of (left, top, right, bottom) rows. Images without a focal
+point have a row of NaN in the focal point rects.
+
+NumPy is optional, everything here raises ImportError when it is not installed.
+"""
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def require_numpy():
+    if numpy is None:
+        raise ImportError('NumPy is required for batched geometry, install numpy')
+
+
+def get_image_arrays(images):
+    """ The sizes and focal point rects of images """
+    require_numpy()
+
+    sizes = numpy.array([(image.width, image.height) for image in images], dtype=float).reshape(-1, 2)
+    points = numpy.array([
+        (image.focal_point_x, image.focal_point_y, image.focal_point_width, image.focal_point_height)
+        for image in images
+    ], dtype=float).reshape(-1, 4)
+
+    # like get_focal_point, an image only has one when all four fields are set
+    has_focal_point = ~numpy.isnan(points).any(axis=1)
+    focal_points = from_points(points[:, 0], points[:, 1], points[:, 2], points[:, 3])
+    focal_points[~has_focal_point] = numpy.nan
+
+    return sizes, focal_points
+
+
+def has_rect(rects):
+    """ Which rows are rects rather than NaN """
+    return ~numpy.isnan(rects[:, 0])
+
+
+def from_points(x, y, width, height):
+    """ Rects of the given centres and sizes, as ``Rect.from_point`` """
+    require_numpy()
+    return numpy.stack((x - width / 2, y - height / 2, x + width / 2, y + height / 2), axis=1)
+
+
+def move_to_cover(rects, others):
+    """ Moves each rect to cover the other, as ``Rect.move_to_cover`` """
+    left, top, right, bottom = (rects[:, i].copy() for i in range(4))
+    other_left, other_top, other_right, other_bottom = (others[:, i] for i in range(4))
+
+    # each step has to see the edges the previous one moved, the same as the rect method
+    move = left > other_left
+    right = numpy.where(move, right - (left - other_left), right)
+    left = numpy.where(move, other_left, left)
+
+    move = top > other_top
+    bottom = numpy.where(move, bottom - (top - other_top), bottom)
+    top = numpy.where(move, other_top, top)
+
+    move = right < other_right
+    left = numpy.where(move, left + (other_right - right), left)
+    right = numpy.where(move, other_right, right)
+
+    move = bottom < other_bottom
+    top = numpy.where(move, top + (other_bottom - bottom), top)
+    bottom = numpy.where(move, other_bottom, bottom)
+
+    return numpy.stack((left, top, right, bottom), axis=1)
+
+
+def move_to_clamp(rects, others):
+    """ Moves each rect inside the other, as ``Rect.move_to_clamp`` """
+    left, top, right, bottom = (rects[:, i].copy() for i in range(4))
+    other_left, other_top, other_right, other_bottom = (others[:, i] for i in range(4))
+
+    move = left < other_left
+    right = numpy.where(move, right - (left - other_left), right)
+    left = numpy.where(move, other_left, left)
+
+    move = top < other_top
+    bottom = numpy.where(move, bottom - (top - other_top), bottom)
+    top = numpy.where(move, other_top, top)
+
+    move = right > other_right
+    left = numpy.where(move, left - (right - other_right), left)
+    right = numpy.where(move, other_right, right)
+
+    move = bottom > other_bottom
+    top = numpy.where(move, top - (bottom - other_bottom), top)
+    bottom = numpy.where(move, other_bottom, bottom)
+
+    return numpy.stack((left, top, right, bottom), axis=1)
+
+
+def round_rects(rects):
+    """ Rounds left and top down and right and bottom up, as ``Rect.round`` """
+    return numpy.concatenate((numpy.floor(rects[:, :2]), numpy.ceil(rects[:, 2:])), axis=1)
+
+
+def get_crop_sizes(rects, sizes):
+    """ The sizes cropping images of sizes to rects gives, as ``Operation.get_crop_size`` """
+    left = numpy.maximum(0, rects[:, 0])
+    top = numpy.maximum(0, rects[:, 1])
+    right = numpy.minimum(rects[:, 2], sizes[:, 0])
+    bottom = numpy.minimum(rects[:, 3], sizes[:, 1])
+
+    # numpy rounds halves to even the same as python's round
+    return numpy.stack((
+        numpy.round(right) - numpy.round(left),
+        numpy.round(bottom) - numpy.round(top),
+    ), axis=1)
+
+
+def get_resized_sizes(sizes, method, size):
+    """ The sizes the width and height operations give """
+    widths, heights = sizes[:, 0], sizes[:, 1]
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        if method == 'width':
+            resize = widths > size
+            widths, heights = numpy.full_like(widths, size), numpy.trunc(heights * (size / widths))
+        elif method == 'height':
+            resize = heights > size
+            widths, heights = numpy.trunc(widths * (size / heights)), numpy.full_like(heights, size)
+        else:
+            return sizes
+
+    return numpy.where(resize[:, None], numpy.stack((widths, heights), axis=1), sizes)
+
+
+def get_min_max_sizes(sizes, method, width, height):
+    """ The sizes the min and max operations give """
+    image_widths, image_heights = sizes[:, 0], sizes[:, 1]
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        horz_scale = width / image_widths
+        vert_scale = height / image_heights
+
+    if method == 'min':
+        resize = (image_widths > width) & (image_heights > height)
+        by_width = horz_scale > vert_scale
+    elif method == 'max':
+        resize = (image_widths > width) | (image_heights > height)
+        by_width = horz_scale < vert_scale
+    else:
+        return sizes
+
+    with numpy.errstate(invalid='ignore'):
+        widths = numpy.where(by_width, width, numpy.trunc(image_widths * vert_scale))
+        heights = numpy.where(by_width, numpy.trunc(image_heights * horz_scale), height)
+
+    return numpy.where(resize[:, None], numpy.stack((widths, heights), axis=1), sizes)
+
+
+def get_fill_crop_rects(sizes, focal_points, width, height, crop_closeness):
+    """ The rects the fill operation crops images to before resizing them, as ``FillOperation.get_crop_rect`` """
+    image_widths, image_heights = sizes[:, 0], sizes[:, 1]
+    has_focal_point = has_rect(focal_points)
+
+    crop_aspect_ratio = width / height
+
+    crop_max_scale = numpy.minimum(image_widths, image_heights * crop_aspect_ratio)
+    crop_max_width = crop_max_scale
+    crop_max_height = crop_max_scale / crop_aspect_ratio
+
+    # zoom in towards the focal point by the crop closeness, without upscaling
+    focal_widths = focal_points[:, 2] - focal_points[:, 0]
+    focal_heights = focal_points[:, 3] - focal_points[:, 1]
+
+    crop_min_scale = numpy.maximum(focal_widths, focal_heights * crop_aspect_ratio)
+    crop_min_width = crop_min_scale
+    crop_min_height = crop_min_scale / crop_aspect_ratio
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        max_crop_closeness = numpy.maximum(
+            1 - (width - crop_min_width) / (crop_max_width - crop_min_width),
+            1 - (height - crop_min_height) / (crop_max_height - crop_min_height)
+        )
+        closeness = numpy.minimum(crop_closeness, max_crop_closeness)
+
+        zoom = has_focal_point & (crop_min_scale < crop_max_scale) & (closeness >= 0) & (closeness <= 1)
+
+    crop_widths = numpy.where(zoom, crop_max_width + (crop_min_width - crop_max_width) * closeness, crop_max_width)
+    crop_heights = numpy.where(zoom, crop_max_height + (crop_min_height - crop_max_height) * closeness, crop_max_height)
+
+    # position the crop box by the focal point, falling back to the centre
+    fp_x = numpy.where(has_focal_point, (focal_points[:, 0] + focal_points[:, 2]) / 2, image_widths / 2)
+    fp_y = numpy.where(has_focal_point, (focal_points[:, 1] + focal_points[:, 3]) / 2, image_heights / 2)
+
+    fp_u = fp_x / image_widths
+    fp_v = fp_y / image_heights
+
+    crop_x = fp_x - (fp_u - 0.5) * crop_widths
+    crop_y = fp_y - (fp_v - 0.5) * crop_heights
+
+    rects = from_points(crop_x, crop_y, crop_widths, crop_heights)
+
+    # the entire focal point is in the crop box, which stays inside the image
+    rects[has_focal_point] = move_to_cover(rects[has_focal_point], focal_points[has_focal_point])
+
+    bounds = numpy.zeros_like(rects)
+    bounds[:, 2:] = sizes
+    return round_rects(move_to_clamp(rects, bounds))
+
+
+def get_fill_sizes(sizes, focal_points, width, height, crop_closeness):
+    """ The sizes the fill operation gives """
+    crop_sizes = get_crop_sizes(get_fill_crop_rects(sizes, focal_points, width, height, crop_closeness), sizes)
+
+    # only resized if the image is too big
+    with numpy.errstate(divide='ignore'):
+        resize = width / crop_sizes[:, 0] < 1.0
+
+    return numpy.where(resize[:, None], numpy.array([width, height], dtype=float), crop_sizes)
+
+
+def get_crop_rects(sizes, focal_points, rect=None):
+    """
+    The rects the crop operation crops images to, as ``CropOperation.get_crop_rect``.
+    rect is the (left, top, width, height) of the spec, without it images are cropped to their focal point.
+    Images left uncropped have a row of NaN.
+    """
+    if rect is None:
+        return focal_points.copy()
+
+    left, top, width, height = rect
+    image_widths, image_heights = sizes[:, 0], sizes[:, 1]
+
+    crop_x = numpy.minimum(left, image_widths - 1)
+    crop_y = numpy.minimum(top, image_heights - 1)
+
+    remaining_after_x = image_widths - crop_x
+    remaining_after_y = image_heights - crop_y
+
+    max_crop_width = numpy.minimum(numpy.minimum(width, crop_x * 2), remaining_after_x * 2)
+    max_crop_height = numpy.minimum(numpy.minimum(height, crop_y * 2), remaining_after_y * 2)
+
+    return from_points(crop_x, crop_y, max_crop_width, max_crop_height)
+
+
+def get_cropped_sizes(sizes, focal_points, rect=None):
+    """ The sizes the crop operation gives """
+    rects = get_crop_rects(sizes, focal_points, rect)
+    cropped = has_rect(rects)
+
+    output_sizes = sizes.copy()
+    output_sizes[cropped] = get_crop_sizes(rects[cropped], sizes[cropped])
+    return output_sizes
+
+
+def predict_sizes(images, filter_specs):
+    """
+    The (width, height) the rendition of each filter spec will have for each image, as ``Filter.predict_size``.
+    Returns a dict of integer arrays keyed by filter spec, with a row for each image in order.
+    """
+    from images.filter import get_filter
+
+    sizes, focal_points = get_image_arrays(images)
+
+    return OrderedDict(
+        (filter_spec, get_filter(filter_spec).predict_sizes(sizes, focal_points)) for filter_spec in filter_specs
+    )
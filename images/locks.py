@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from images.conf import get_setting
+
+try:
+    import fcntl
+except ImportError:  # not available on windows
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# local storage locks are spread over this many files rather than one per rendition
+LOCK_FILE_STRIPES = 256
+
+# the lock caches already warned about, so the warning is logged once per process
+_warned_lock_caches = set()
+
+
+class CacheLock:
+    """
+    A lock held by adding a key to a django cache, shared by every process using the cache.
+    The key expires after timeout seconds so a crashed holder never keeps it.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self, cache, key, timeout):
+        self.cache = cache
+        self.key = key
+        self.timeout = timeout
+        self.token = uuid.uuid4().hex
+
+    def acquire(self, wait=None):
+        """ Returns True once the lock is held, False if it was not within wait seconds """
+        deadline = time.monotonic() + (wait or 0)
+
+        while not self.cache.add(self.key, self.token, self.timeout):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+
+        return True
+
+    def release(self):
+        # only release the lock when it has not expired and been taken by another
+        if self.cache.get(self.key) == self.token:
+            self.cache.delete(self.key)
+
+
+class FileLock:
+    """ An flock on a file, shared by every process and thread using the same local file system """
+
+    poll_interval = 0.05
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def acquire(self, wait=None):
+        """ Returns True once the lock is held, False if it was not within wait seconds """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        deadline = time.monotonic() + (wait or 0)
+
+        while True:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    os.close(self.fd)
+                    self.fd = None
+                    return False
+                time.sleep(self.poll_interval)
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+def get_lock_key(image, lookup):
+    filter_spec, focal_point_key = lookup
+    value = '{}:{}:{}'.format(image.pk, filter_spec, focal_point_key)
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+def get_lock_dir(storage):
+    """
+    The directory of the file locks of renditions in local storage, or None when the storage is not local.
+    It is under ``IMAGES_RENDITION_LOCK_DIR``, by default the system temporary directory, rather than in the
+    storage where it could be served.
+    """
+    try:
+        location = storage.path('')
+    except NotImplementedError:
+        return None
+
+    # a directory for each storage so sites on the same host do not share lock files
+    storage_key = hashlib.md5(location.encode('utf-8')).hexdigest()[:12]
+    lock_dir = get_setting('RENDITION_LOCK_DIR') or tempfile.gettempdir()
+    return os.path.join(lock_dir, 'images-rendition-locks', storage_key)
+
+
+def get_lock_cache():
+    """
+    The django cache in ``IMAGES_RENDITION_LOCK_CACHE`` that holds the locks of renditions not in local storage.
+    Only a cache shared by every process, such as memcached, redis or the database, keeps two processes from
+    generating the same rendition. A local memory cache, the backend of the default cache unless it is configured,
+    only covers the threads of one process.
+    """
+    alias = get_setting('RENDITION_LOCK_CACHE')
+    cache = caches[alias]
+
+    if isinstance(cache, LocMemCache) and alias not in _warned_lock_caches:
+        _warned_lock_caches.add(alias)
+        logger.warning(
+            'Rendition locks are held in the local memory cache "{}", which is not shared between processes. '
+            'Set IMAGES_RENDITION_LOCK_CACHE to a shared cache.'.format(alias)
+        )
+
+    return cache
+
+
+def get_rendition_locks(image, lookups):
+    """ The locks of the (filter_spec, focal_point_key) renditions of an image, in the order to take them """
+    storage = image.renditions.model._meta.get_field('file').storage
+    keys = sorted(set(get_lock_key(image, lookup) for lookup in lookups))
+    lock_dir = get_lock_dir(storage)
+
+    if lock_dir is not None and fcntl is not None:
+        stripes = sorted(set(int(key, 16) % LOCK_FILE_STRIPES for key in keys))
+        return [FileLock(os.path.join(lock_dir, '{}.lock'.format(stripe))) for stripe in stripes]
+
+    cache = get_lock_cache()
+    timeout = get_setting('RENDITION_LOCK_TIMEOUT')
+    return [CacheLock(cache, 'images-rendition-lock:{}'.format(key), timeout) for key in keys]
+
+
+@contextmanager
+def lock_renditions(image, lookups):
+    """
+    Holds the locks of the (filter_spec, focal_point_key) renditions of an image so only one worker generates
+    them, with ``IMAGES_SINGLE_FLIGHT_RENDITIONS``. Yields True if another worker held a lock first, in which case
+    it may have created the renditions. After waiting ``IMAGES_RENDITION_LOCK_TIMEOUT`` seconds for a lock the
+    block runs without it.
+    """
+    if not get_setting('SINGLE_FLIGHT_RENDITIONS') or not lookups:
+        yield False
+        return
+
+    # locks are always taken in the same order so two workers can never wait on each other
+    locks = get_rendition_locks(image, lookups)
+    held = []
+    waited = False
+
+    try:
+        for lock in locks:
+            if not lock.acquire():
+                waited = True
+
+                if not lock.acquire(get_setting('RENDITION_LOCK_TIMEOUT')):
+                    logger.warning('Timed out waiting for a rendition lock of {}'.format(image))
+                    continue
+
+            held.append(lock)
+
+        yield waited
+
+    finally:
+        for lock in reversed(held):
+            lock.release()
@@ -0,0 +1,64 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from images.filter import canonicalize_spec
+from images.models import Rendition
+
+
+class Command(BaseCommand):
+    help = 'Merge renditions whose filter specs are equivalent and store their canonical spec'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Report what would change without changing anything'
+        )
+
+    def get_duplicates(self, renditions):
+        """
+        Groups one image's (pk, filter_spec, focal_point_key) rows by canonical spec, yields the canonical spec,
+        the pk of the rendition to keep and the pks of its duplicates for each group that needs changing.
+        """
+        groups = {}
+        for pk, filter_spec, focal_point_key in renditions:
+            key = (canonicalize_spec(filter_spec), focal_point_key)
+            groups.setdefault(key, []).append((pk, filter_spec))
+
+        for (canonical_spec, focal_point_key), rows in groups.items():
+            # keep the one already stored under the canonical spec, otherwise the oldest
+            keep = next((row for row in rows if row[1] == canonical_spec), rows[0])
+
+            if len(rows) > 1 or keep[1] != canonical_spec:
+                yield canonical_spec, keep, [pk for pk, filter_spec in rows if pk != keep[0]]
+
+    def handle(self, *args, **options):
+        removed = renamed = 0
+
+        renditions = Rendition.objects.order_by('image_id', 'pk').values_list(
+            'image_id', 'pk', 'filter_spec', 'focal_point_key')
+
+        for image_id, rows in groupby(renditions.iterator(), key=lambda row: row[0]):
+            duplicates = list(self.get_duplicates(row[1:] for row in rows))
+
+            for canonical_spec, (pk, filter_spec), duplicate_pks in duplicates:
+                removed += len(duplicate_pks)
+                renamed += filter_spec != canonical_spec
+
+                if options['dry_run']:
+                    continue
+
+                with transaction.atomic():
+                    # the files are removed by the post_delete signal once committed
+                    for rendition in Rendition.objects.filter(pk__in=duplicate_pks):
+                        rendition.delete()
+
+                    if filter_spec != canonical_spec:
+                        rendition = Rendition.objects.get(pk=pk)
+                        rendition.filter_spec = canonical_spec
+                        rendition.save(update_fields=['filter_spec'])
+
+        self.stdout.write(self.style.SUCCESS('%s %s duplicate Rendition(s) and %s %s Rendition(s)' % (
+            'Would remove' if options['dry_run'] else 'Removed', removed,
+            'would rename' if options['dry_run'] else 'renamed', renamed)))
@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from images.models import Rendition
+
+
+class Command(BaseCommand):
+    help = 'Delete rendition files in storage that no rendition uses, such as those left by a lost race'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Only files last modified at least this many seconds ago, newer ones may be about to be used'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Report what would be deleted without deleting anything'
+        )
+
+    def walk(self, storage, path):
+        """ Yields the names of the files under path in storage """
+        dirs, files = storage.listdir(path)
+
+        for name in files:
+            yield '{}/{}'.format(path, name)
+
+        for name in dirs:
+            yield from self.walk(storage, '{}/{}'.format(path, name))
+
+    def handle(self, *args, **options):
+        file_field = Rendition._meta.get_field('file')
+        storage = file_field.storage
+
+        if callable(file_field.upload_to):
+            raise CommandError('Rendition files must be uploaded to a directory')
+
+        path = file_field.upload_to.rstrip('/')
+        if not storage.exists(path):
+            self.stdout.write(self.style.SUCCESS('No rendition files'))
+            return
+
+        used = set(Rendition.objects.values_list('file', flat=True).iterator())
+        modified_before = timezone.now() - timedelta(seconds=options['min_age'])
+        deleted = 0
+
+        for name in self.walk(storage, path):
+            if name in used or storage.get_modified_time(name) > modified_before:
+                continue
+
+            deleted += 1
+            if not options['dry_run']:
+                storage.delete(name)
+
+        self.stdout.write(self.style.SUCCESS('%s %s orphaned rendition file(s)' % (
+            'Would delete' if options['dry_run'] else 'Deleted', deleted)))
@@ -0,0 +1,247 @@
+import csv
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import PIL.Image
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from images.conf import get_setting
+from images.models import Image
+from images.utils import get_file_hash
+from images.workers import map_in_workers, regenerate_batch
+
+
+def read_header(path):
+    """
+    Reads the (width, height) of an image file from its header without decoding it, and the hash of its content.
+    Returns (path, width, height, file_hash, error).
+    """
+    try:
+        with open(path, 'rb') as f:
+            with PIL.Image.open(f) as image:
+                width, height = image.size
+
+            file_hash = get_file_hash(File(f))
+
+    except (IOError, SyntaxError) as e:
+        return path, None, None, None, str(e)
+
+    return path, width, height, file_hash, None
+
+
+def link_or_copy(path, target, link):
+    """ Hardlinks, or copies, the file at path to target. Raises FileExistsError if target exists """
+    if link:
+        try:
+            os.link(path, target)
+            return
+        except FileExistsError:
+            raise
+        except OSError:
+            # on another filesystem
+            pass
+
+    # exclusive creation so a file stored at the same time elsewhere is never overwritten
+    with open(path, 'rb') as src, open(target, 'xb') as dst:
+        shutil.copyfileobj(src, dst)
+
+
+def create_renditions(pks):
+    # the images are new, any renditions they have are copies shared with a duplicate and are kept
+    return regenerate_batch(pks, clear=False)
+
+
+class Command(BaseCommand):
+    help = (
+        'Import image files from a directory or manifest without creating renditions one save at a time. '
+        'With IMAGES_DEDUPLICATE_UPLOADS files matching an existing image share its stored file and renditions'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'source',
+            help='A directory to import the images in, or a csv manifest of path and optional title rows'
+        )
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='Number of threads to read image headers in'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of processes to generate the default renditions in'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of images inserted, and handed to a rendition worker, at a time'
+        )
+        parser.add_argument(
+            '--link', action='store_true', default=False,
+            help='Hardlink the files into local storage rather than copying them'
+        )
+        parser.add_argument(
+            '--no-renditions', action='store_false', dest='renditions', default=True,
+            help='Leave the default renditions to be created later'
+        )
+
+    def get_sources(self, source):
+        """
+        Yields (path, title) for each image to import, the title defaulting to the file name.
+        Files without one of the ``IMAGES_ALLOWED_FILE_EXTENSIONS`` are left out.
+        """
+        allowed = get_setting('ALLOWED_FILE_EXTENSIONS')
+
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in allowed:
+                        yield os.path.join(root, name), name
+
+        elif os.path.isfile(source):
+            base = os.path.dirname(os.path.abspath(source))
+            with open(source, newline='') as f:
+                for row in csv.reader(f):
+                    if not row or not row[0].strip():
+                        continue
+
+                    path = os.path.join(base, row[0].strip())
+                    if os.path.splitext(path)[1].lower() not in allowed:
+                        self.stderr.write('Skipped %s: not an allowed file extension' % path)
+                        continue
+
+                    title = row[1].strip() if len(row) > 1 and row[1].strip() else os.path.basename(path)
+                    yield path, title
+
+        else:
+            raise CommandError('%s is not a directory or manifest' % source)
+
+    def store_file(self, path, link):
+        """ Stores the file at path as an original image, returns the name it is stored under """
+        file_field = Image._meta.get_field('file')
+        storage = file_field.storage
+        name = file_field.generate_filename(Image(), os.path.basename(path))
+
+        try:
+            storage.path(name)
+        except NotImplementedError:
+            # remote storage, the file has to be uploaded
+            with open(path, 'rb') as f:
+                return storage.save(name, File(f))
+
+        while True:
+            name = storage.get_available_name(name)
+            target = storage.path(name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+
+            try:
+                link_or_copy(path, target, link)
+            except FileExistsError:
+                continue
+
+            return name
+
+    def find_duplicates(self, rows, stored):
+        """
+        Returns a dict of file hash to the image the file of each row is a duplicate of, the same image
+        Image.find_duplicate would, and adds the names of their files to stored.
+        """
+        hashes = set(file_hash for path, title, width, height, file_hash in rows) - set(stored)
+        duplicates = {}
+
+        # in descending order so the earliest image with each hash is the one kept
+        for image in Image.objects.filter(file_hash__in=hashes).order_by('-pk'):
+            duplicates[image.file_hash] = image
+            stored[image.file_hash] = image.file.name
+
+        return duplicates
+
+    def create_images(self, rows, link, stored=None):
+        """
+        Stores the files and inserts rows of (path, title, width, height, file_hash), returns their pks.
+        With stored, a dict of file hash to the name of a stored file, a file already stored is shared
+        rather than stored again, along with the renditions of the image it was first stored for.
+        """
+        duplicates = self.find_duplicates(rows, stored) if stored is not None else {}
+
+        images = []
+        for path, title, width, height, file_hash in rows:
+            if stored is not None and file_hash in stored:
+                name = stored[file_hash]
+            else:
+                name = self.store_file(path, link)
+                if stored is not None:
+                    stored[file_hash] = name
+
+            images.append(Image(
+                title=title[:255],
+                file=name,
+                width=width,
+                height=height,
+                file_hash=file_hash
+            ))
+
+        last_pk = Image.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        Image.objects.bulk_create(images)
+
+        # not every database returns the pks of bulk inserted rows
+        created = Image.objects.filter(file__in=[image.file.name for image in images], pk__gt=last_pk)
+
+        if duplicates:
+            for image in created.filter(file_hash__in=duplicates):
+                image.copy_renditions(duplicates[image.file_hash])
+
+        return list(created.values_list('pk', flat=True))
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1:
+            raise CommandError('--threads must be at least 1')
+
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        started = time.time()
+        sources = list(self.get_sources(options['source']))
+        titles = dict(sources)
+
+        # headers are read in threads as the work is mostly waiting on the disk
+        with ThreadPoolExecutor(options['threads']) as executor:
+            headers = list(executor.map(read_header, [path for path, title in sources]))
+
+        rows = []
+        failures = 0
+        for path, width, height, file_hash, error in headers:
+            if error is not None:
+                self.stderr.write('Skipped %s: %s' % (path, error))
+                failures += 1
+            else:
+                rows.append((path, titles[path], width, height, file_hash))
+
+        pks = []
+        batch_size = options['batch_size']
+        stored = {} if get_setting('DEDUPLICATE_UPLOADS') else None
+        for i in range(0, len(rows), batch_size):
+            pks.extend(self.create_images(rows[i:i + batch_size], options['link'], stored))
+            self.stdout.write('%s of %s Image(s) imported' % (len(pks), len(rows)))
+
+        done = 0
+        if options['renditions'] and pks:
+            batches = [pks[i:i + batch_size] for i in range(0, len(pks), batch_size)]
+
+            with map_in_workers(create_renditions, batches, options['workers']) as results:
+                for batch_done, batch_bytes, batch_failures in results:
+                    done += batch_done
+                    failures += batch_failures
+                    self.stdout.write('Renditions created for %s of %s Image(s)' % (done, len(pks)))
+
+        elapsed = time.time() - started
+        self.stdout.write(self.style.SUCCESS(
+            'Imported %s Image(s) in %.1fs, renditions created for %s, %s failure(s)' % (
+                len(pks), elapsed, done, failures)
+        ))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from images.queue import process_queue, requeue_failed_jobs
+
+
+class Command(BaseCommand):
+    help = 'Generate the renditions queued by the async rendition mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Stop after processing this many jobs'
+        )
+        parser.add_argument(
+            '--forever', action='store_true', default=False,
+            help='Keep polling the queue for new jobs instead of exiting once it is empty'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=5,
+            help='Seconds to wait between polls when running forever'
+        )
+        parser.add_argument(
+            '--retry-failed', action='store_true', default=False,
+            help='Queue the jobs that used up their attempts again before processing the queue'
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            requeued = requeue_failed_jobs()
+            self.stdout.write('Queued %s failed rendition job(s) again' % requeued)
+
+        while True:
+            processed = process_queue(limit=options['limit'])
+            if processed:
+                self.stdout.write(self.style.SUCCESS('Processed %s rendition job(s)' % processed))
+
+            if not options['forever']:
+                break
+
+            if not processed:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS('Completed'))
@@ -1,18 +1,154 @@
-from django.core.management.base import BaseCommand
+import json
+import os
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
 from images.models import Image
-from images.utils import create_default_image_renditions
+from images.workers import map_in_workers, regenerate_batch
+
+
+def parse_since(value):
+    since = parse_datetime(value)
+
+    if since is None:
+        date = parse_date(value)
+        if date is None:
+            raise CommandError('--since must be a date or datetime, got %s' % value)
+        since = datetime(date.year, date.month, date.day)
+
+    if settings.USE_TZ and timezone.is_naive(since):
+        since = timezone.make_aware(since)
+
+    return since
+
+
+def parse_list(value):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def run_batch(args):
+    pks, filter_specs = args
+    return pks, regenerate_batch(pks, filter_specs)
 
 
 class Command(BaseCommand):
     help = 'Regenerate all default image renditions'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of processes to generate renditions in'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of images handed to a worker at a time'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='File to record progress in, a run given the same file resumes after the last completed batch'
+        )
+        parser.add_argument(
+            '--since',
+            help='Only images created on or after this date or datetime'
+        )
+        parser.add_argument(
+            '--ids', type=parse_list,
+            help='Comma separated ids of the images to regenerate'
+        )
+        parser.add_argument(
+            '--specs', type=parse_list,
+            help='Comma separated filter specs to regenerate instead of the default renditions'
+        )
+
+    def get_queryset(self, options):
+        queryset = Image.objects.all()
+
+        if options['since']:
+            queryset = queryset.filter(created_at__gte=parse_since(options['since']))
+
+        if options['ids']:
+            queryset = queryset.filter(pk__in=options['ids'])
+
+        return queryset
+
+    def iter_batches(self, queryset, batch_size, last_pk):
+        """ Yields lists of primary keys, walking the table by primary key rather than with offsets """
+        while True:
+            batch = queryset.order_by('pk')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+
+            pks = list(batch.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return
+
+            yield pks
+            last_pk = pks[-1]
+
+    def read_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return None
+
+        with open(path) as f:
+            return json.load(f)['last_pk']
+
+    def write_checkpoint(self, path, last_pk):
+        # write then rename so an interrupted run never leaves a half written file
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'last_pk': last_pk}, f)
+        os.replace(tmp_path, path)
+
     def handle(self, *args, **options):
-        done = 1
-        image_count = Image.objects.count()
-        for image in Image.objects.all():
-            create_default_image_renditions(instance=image)
-            self.stdout.write(self.style.SUCCESS('%s of %s Image(s)' % (done, image_count)))
-            done += 1
-
-        self.stdout.write(self.style.SUCCESS('Completed'))
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        queryset = self.get_queryset(options)
+        checkpoint = options['checkpoint']
+        last_pk = self.read_checkpoint(checkpoint)
+
+        image_count = queryset.count()
+        processed = 0
+
+        if last_pk is not None:
+            processed = queryset.filter(pk__lte=last_pk).count()
+            self.stdout.write('Resuming after image %s, %s of %s Image(s) already done' % (
+                last_pk, processed, image_count))
+
+        started = time.time()
+        done = bytes_written = failures = 0
+
+        # the batches are listed up front in this process, a pool would read them from its task handler thread
+        # which would open a database connection of its own and never close it
+        batches = list(self.iter_batches(queryset, options['batch_size'], last_pk))
+        args = [(pks, options['specs']) for pks in batches]
+
+        with map_in_workers(run_batch, args, options['workers']) as results:
+            # results come back in order so the checkpoint never skips an unfinished batch
+            for pks, (batch_done, batch_bytes, batch_failures) in results:
+                done += batch_done
+                bytes_written += batch_bytes
+                failures += batch_failures
+                processed += len(pks)
+
+                if checkpoint:
+                    self.write_checkpoint(checkpoint, pks[-1])
+
+                self.stdout.write(self.style.SUCCESS('%s of %s Image(s)' % (processed, image_count)))
+
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        elapsed = time.time() - started
+        self.stdout.write(self.style.SUCCESS(
+            'Completed %s Image(s) in %.1fs (%.1f images/sec), %s bytes written, %s failure(s)' % (
+                done, elapsed, done / elapsed if elapsed else 0, bytes_written, failures)
+        ))
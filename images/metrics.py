@@ -0,0 +1,217 @@
+"""
+Metrics of where the time rendering images goes, reported to the backend in the ``IMAGES_METRICS`` setting.
+
+The metrics reported are:
+
+* ``rendition.hit`` and ``rendition.miss`` counts of renditions found or generated by ``generate_renditions``
+* ``open`` seconds opening a file and reading its header in ``get_willow_image``
+* ``decode`` seconds decoding and orienting an original, tagged with the ``format``
+* ``operation`` seconds running each operation of a filter, tagged with the ``operation``
+* ``encode`` seconds saving a rendition, tagged with the ``format``
+* ``storage.write`` seconds writing a rendition to storage and ``storage.write.bytes`` bytes written
+* ``template.image.queries`` database queries made rendering an ``{% image %}`` tag
+
+Nothing is measured while the setting is None.
+"""
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.utils.module_loading import import_string
+
+from images.conf import load_backend
+
+
+class BaseMetrics:
+    """ Base class for metrics backends, tags are a dict of strings or None """
+
+    def incr(self, name, value=1, tags=None):
+        """ Adds value to a counter """
+        raise NotImplementedError
+
+    def timing(self, name, seconds, tags=None):
+        """ Records how long something took """
+        raise NotImplementedError
+
+    def observe(self, name, value, tags=None):
+        """ Records a value from a distribution such as a size or count """
+        raise NotImplementedError
+
+
+class CallbackMetrics(BaseMetrics):
+    """ Calls ``callback(kind, name, value, tags)`` for every metric, kind being 'incr', 'timing' or 'observe' """
+
+    def __init__(self, callback):
+        self.callback = import_string(callback) if isinstance(callback, str) else callback
+
+    def incr(self, name, value=1, tags=None):
+        self.callback('incr', name, value, tags)
+
+    def timing(self, name, seconds, tags=None):
+        self.callback('timing', name, seconds, tags)
+
+    def observe(self, name, value, tags=None):
+        self.callback('observe', name, value, tags)
+
+
+class StatsDMetrics(BaseMetrics):
+    """ Sends metrics to a StatsD server over UDP, tag values are added to the metric names """
+
+    def __init__(self, host='localhost', port=8125, prefix='images'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def get_name(self, name, tags):
+        parts = [self.prefix, name] if self.prefix else [name]
+        if tags:
+            parts.extend(str(tags[key]) for key in sorted(tags))
+        return '.'.join(parts)
+
+    def send(self, name, value, kind, tags):
+        data = '{}:{}|{}'.format(self.get_name(name, tags), value, kind).encode('utf-8')
+        try:
+            self.socket.sendto(data, self.address)
+        except OSError:
+            # metrics are never worth failing a request for
+            pass
+
+    def incr(self, name, value=1, tags=None):
+        self.send(name, value, 'c', tags)
+
+    def timing(self, name, seconds, tags=None):
+        self.send(name, round(seconds * 1000, 3), 'ms', tags)
+
+    def observe(self, name, value, tags=None):
+        self.send(name, value, 'h', tags)
+
+
+class PrometheusTextMetrics(BaseMetrics):
+    """
+    Keeps counters and summaries in memory and writes them in the Prometheus text format to path, for a
+    textfile collector, at most every interval seconds. ``{pid}`` in path is replaced with the process id
+    so processes do not overwrite each other.
+    """
+
+    def __init__(self, path, interval=10, prefix='images'):
+        self.path = path
+        self.interval = interval
+        self.prefix = prefix
+        self.counters = OrderedDict()
+        self.summaries = OrderedDict()
+        self.written = None
+        self._lock = threading.Lock()
+
+    def get_key(self, name, suffix, tags):
+        metric = '_'.join(part for part in (self.prefix, name.replace('.', '_'), suffix) if part)
+        labels = tuple(sorted(tags.items())) if tags else ()
+        return metric, labels
+
+    def incr(self, name, value=1, tags=None):
+        key = self.get_key(name, 'total', tags)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self.maybe_write()
+
+    def add_to_summary(self, key, value):
+        with self._lock:
+            count, total = self.summaries.get(key, (0, 0))
+            self.summaries[key] = (count + 1, total + value)
+        self.maybe_write()
+
+    def timing(self, name, seconds, tags=None):
+        self.add_to_summary(self.get_key(name, 'seconds', tags), seconds)
+
+    def observe(self, name, value, tags=None):
+        self.add_to_summary(self.get_key(name, '', tags), value)
+
+    def format_metric(self, metric, labels, value):
+        if labels:
+            metric += '{' + ','.join('{}="{}"'.format(label, str(label_value).replace('"', '\\"'))
+                                     for label, label_value in labels) + '}'
+        return '{} {}'.format(metric, value)
+
+    def render(self):
+        """ The metrics in the Prometheus text format """
+        lines = []
+        with self._lock:
+            types = OrderedDict()
+            for metric, labels in self.counters:
+                types.setdefault(metric, 'counter')
+            for metric, labels in self.summaries:
+                types.setdefault(metric, 'summary')
+
+            for metric, metric_type in types.items():
+                lines.append('# TYPE {} {}'.format(metric, metric_type))
+
+                for (counter, labels), value in self.counters.items():
+                    if counter == metric:
+                        lines.append(self.format_metric(metric, labels, value))
+
+                for (summary, labels), (count, total) in self.summaries.items():
+                    if summary == metric:
+                        lines.append(self.format_metric(metric + '_count', labels, count))
+                        lines.append(self.format_metric(metric + '_sum', labels, total))
+
+        return '\n'.join(lines) + '\n'
+
+    def maybe_write(self):
+        now = time.monotonic()
+        if self.written is None or now - self.written >= self.interval:
+            self.written = now
+            self.write()
+
+    def write(self):
+        path = self.path.format(pid=os.getpid())
+
+        # write then rename so a collector never reads a half written file
+        tmp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+def get_metrics():
+    """ Returns the metrics backend configured in the ``IMAGES_METRICS`` setting, or None when disabled """
+    return load_backend('METRICS')
+
+
+def incr(name, value=1, **tags):
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.incr(name, value, tags or None)
+
+
+def observe(name, value, **tags):
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.observe(name, value, tags or None)
+
+
+@contextmanager
+def timer(name, **tags):
+    """ Records the seconds the block took, yields the dict of tags so the block can add to them """
+    metrics = get_metrics()
+    if metrics is None:
+        yield tags
+        return
+
+    started = time.perf_counter()
+    try:
+        yield tags
+    finally:
+        metrics.timing(name, time.perf_counter() - started, tags or None)
+
+
+class QueryCounter:
+    """ A database execute wrapper counting the queries made """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
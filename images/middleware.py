@@ -0,0 +1,16 @@
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+
+class VaryOnAcceptMiddleware(MiddlewareMixin):
+    """
+    Adds ``Vary: Accept`` to responses whose content was negotiated from the request's Accept header, such as pages
+    with an ``{% image %}`` tag using ``format-auto``, so caches do not send a page of webp or avif urls to browsers
+    that cannot show them.
+    """
+
+    def process_response(self, request, response):
+        if getattr(request, 'images_vary_on_accept', False):
+            patch_vary_headers(response, ['Accept'])
+
+        return response
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.28 on 2026-10-18 15:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0003_auto_20180407_2058'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenditionJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filter_spec', models.CharField(max_length=255)),
+                ('focal_point_key', models.CharField(blank=True, default='', editable=False, max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='started at')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rendition_jobs', to='images.Image')),
+            ],
+            options={
+                'abstract': False,
+                'unique_together': {('image', 'filter_spec', 'focal_point_key')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:10
+
+from django.db import migrations
+import images.fields
+import images.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0004_renditionjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='file',
+            field=images.fields.ImageField(height_field='height', upload_to='original_images/', validators=[images.validators.validate_image_file_extension], verbose_name='file', width_field='width'),
+        ),
+        migrations.AlterField(
+            model_name='rendition',
+            name='file',
+            field=images.fields.ImageField(height_field='height', upload_to='images_renditions/', verbose_name='file', width_field='width'),
+        ),
+    ]
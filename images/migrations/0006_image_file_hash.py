@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0005_image_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='file_hash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=64, verbose_name='file hash'),
+        ),
+    ]
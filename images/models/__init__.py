@@ -1,2 +1,3 @@
 from .image import Image
 from .rendition import Rendition
+from .rendition_job import RenditionJob
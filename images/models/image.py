@@ -1,28 +1,40 @@
-from contextlib import contextmanager
-from io import BytesIO
+import hashlib
+import logging
 import os
 
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.files import File
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import ugettext_lazy as _
+from PIL import Image as PIL_Image
+from willow.plugins.pillow import PillowImage
 
-from willow.image import Image as WillowImage
-
-from images.exceptions import SourceImageIOError
-from images.filter import Filter
+from images import metrics
+from images.animation import open_animation
+from images.cache import get_rendition_cache, get_rendition_cache_key, get_rendition_cache_value
+from images.conf import get_setting
+from images.exceptions import InvalidFilterSpecError
+from images.fields import ImageField, count_storage_reads, record_storage_read
+from images.filter import get_filter, get_output_file, is_transposed, open_reduced
+from images.locks import lock_renditions
+from images.operations import FormatOperation
+from images.models.mixins import WillowImageMixin
+from images.query import ImageQuerySet
 from images.rect import Rect
+from images.utils import get_file_hash
 from images.validators import validate_image_file_extension
 
 
-class AbstractImage(models.Model):
+logger = logging.getLogger(__name__)
+
+
+class AbstractImage(WillowImageMixin, models.Model):
     """ abstract base image model to hold images and which to create renditions from. """
 
     title = models.CharField(
         max_length=255,
         verbose_name=_('title')
     )
-    file = models.ImageField(
+    file = ImageField(
         verbose_name=_('file'),
         upload_to='original_images/',
         width_field='width',
@@ -37,6 +49,14 @@ class AbstractImage(models.Model):
         verbose_name=_('height'),
         editable=False
     )
+    file_hash = models.CharField(
+        verbose_name=_('file hash'),
+        max_length=64,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False
+    )
     created_at = models.DateTimeField(
         verbose_name=_('created at'),
         auto_now_add=True,
@@ -59,49 +79,107 @@ class AbstractImage(models.Model):
         blank=True
     )
 
+    objects = ImageQuerySet.as_manager()
+
+    # the fields renditions are made from, saving an image without changing them leaves its renditions alone
+    rendition_fields = ('file', 'focal_point_x', 'focal_point_y', 'focal_point_width', 'focal_point_height')
+
     class Meta:
         abstract = True
 
-    def is_stored_locally(self):
-        """ Returns True if the image is hosted on the local filesystem """
-        try:
-            self.file.path
-
-            return True
-        except NotImplementedError:
-            return False
-
-    @contextmanager
-    def get_willow_image(self):
-        # Open file if it is closed
-        close_file = False
-        try:
-            image_file = self.file
-
-            if self.file.closed:
-                # Reopen the file
-                if self.is_stored_locally():
-                    self.file.open('rb')
-                else:
-                    # Some external storage backends don't allow reopening
-                    # the file. Get a fresh file instance. #1397
-                    storage = self._meta.get_field('file').storage
-                    image_file = storage.open(self.file.name, 'rb')
-
-                close_file = True
-        except IOError as e:
-            # re-throw this as a SourceImageIOError so that calling code can distinguish
-            # these from IOErrors elsewhere in the process
-            raise SourceImageIOError(str(e))
-
-        # Seek to beginning
-        image_file.seek(0)
-
-        try:
-            yield WillowImage.open(image_file)
-        finally:
-            if close_file:
-                image_file.close()
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._get_rendition_field_values()
+        return instance
+
+    def _get_rendition_field_values(self):
+        deferred = self.get_deferred_fields()
+        values = {}
+
+        for name in self.rendition_fields:
+            if name not in deferred:
+                value = getattr(self, name)
+                values[name] = value.name if name == 'file' else value
+
+        return values
+
+    def get_changed_fields(self):
+        """
+        Returns the set of rendition_fields changed since the image was loaded or last saved,
+        or None if it was neither.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+
+        current = self._get_rendition_field_values()
+        return set(name for name in self.rendition_fields if name not in loaded or loaded[name] != current.get(name))
+
+    def save(self, *args, **kwargs):
+        if self.file and not self.file._committed:
+            # a new upload
+            self.file_hash = get_file_hash(self.file)
+
+            if get_setting('DEDUPLICATE_UPLOADS'):
+                duplicate = self.find_duplicate()
+                if duplicate is not None:
+                    self.share_file(duplicate)
+
+        super().save(*args, **kwargs)
+
+        # the renditions are up to date with the saved values
+        self._loaded_values = self._get_rendition_field_values()
+
+    def find_duplicate(self):
+        """ Returns another image with the same file content as this one, or None """
+        if not self.file_hash:
+            return None
+
+        return type(self).objects.filter(file_hash=self.file_hash).exclude(pk=self.pk).order_by('pk').first()
+
+    def share_file(self, source):
+        """
+        Points this image at the stored file of source, an image with the same content, rather than
+        storing the upload again. The renditions of source are copied when the default renditions are created.
+        """
+        self.file.close()
+        del self.file.file
+        self.file.name = source.file.name
+        self.file._committed = True
+
+        self.width = source.width
+        self.height = source.height
+        self._shared_file_source = source
+
+    def copy_renditions(self, source):
+        """
+        Gives this image copies of the renditions of source, an image with the same content.
+        The copies share the files of the source renditions rather than generating them again.
+        Renditions that depend on a focal point this image does not share are left out.
+        """
+        existing = set(self.renditions.values_list('filter_spec', 'focal_point_key'))
+        copies = []
+
+        for rendition in source.renditions.all():
+            try:
+                cache_key = get_filter(rendition.filter_spec).get_cache_key(self)
+            except InvalidFilterSpecError:
+                continue
+
+            if cache_key != rendition.focal_point_key or (rendition.filter_spec, cache_key) in existing:
+                continue
+
+            copies.append(self.renditions.model(
+                image=self,
+                filter_spec=rendition.filter_spec,
+                focal_point_key=rendition.focal_point_key,
+                file=rendition.file.name,
+                width=rendition.width,
+                height=rendition.height
+            ))
+
+        return self.renditions.model.objects.bulk_create(copies)
 
     def get_rect(self):
         return Rect(0, 0, self.width, self.height)
@@ -131,46 +209,389 @@ class AbstractImage(models.Model):
             self.focal_point_width = None
             self.focal_point_height = None
 
-    def get_rendition(self, filter):
-        if isinstance(filter, str):
-            filter = Filter(spec=filter)
+    def _find_renditions(self, lookups):
+        """
+        Looks up existing renditions by (filter_spec, focal_point_key), checking the renditions fetched
+        by prefetch_renditions and the rendition cache before making a single database query.
+        Returns a dict of the renditions found keyed by their lookup.
+        """
+        found = {}
+        remaining = []
 
-        cache_key = filter.get_cache_key(self)
+        prefetched = getattr(self, '_prefetched_renditions', None)
+        rendition_cache = get_rendition_cache()
 
-        try:
-            rendition = self.renditions.get(
-                filter_spec=filter.spec,
-                focal_point_key=cache_key
-            )
-        except ObjectDoesNotExist:
-            # Generate the rendition image
-            generated_image = filter.run(self, BytesIO())
-
-            # Generate filename
-            input_filename = os.path.basename(self.file.name)
-            input_filename_without_extension, input_extension = os.path.splitext(input_filename)
-
-            format_mapping = {
-                'jpeg': '.jpg',
-                'png': '.png',
-                'gif': '.gif',
-            }
-
-            # Get the file extension to output
-            output_extension = filter.spec.replace('|', '.') + format_mapping[generated_image.format_name]
-
-            # Truncate filename to prevent it going over 60 chars
-            output_filename_without_extension = input_filename_without_extension[:(59 - len(output_extension))]
-            output_filename = output_filename_without_extension + '.' + output_extension
-
-            rendition, created = self.renditions.get_or_create(
-                filter_spec=filter.spec,
-                focal_point_key=cache_key,
-                defaults={'file': File(generated_image.f, name=output_filename)}
+        for lookup in lookups:
+            filter_spec, cache_key = lookup
+
+            if prefetched is not None and lookup in prefetched:
+                # already looked up by prefetch_renditions, None means it did not exist
+                if prefetched[lookup] is not None:
+                    found[lookup] = prefetched[lookup]
+                continue
+
+            if rendition_cache is not None:
+                cached = rendition_cache.get(get_rendition_cache_key(self.pk, filter_spec, cache_key))
+                if cached is not None:
+                    rendition_id, file_name, width, height = cached
+                    found[lookup] = self.renditions.model(
+                        id=rendition_id,
+                        image=self,
+                        filter_spec=filter_spec,
+                        focal_point_key=cache_key,
+                        file=file_name,
+                        width=width,
+                        height=height
+                    )
+                    continue
+
+            remaining.append(lookup)
+
+        if remaining:
+            renditions = self.renditions.filter(filter_spec__in=set(filter_spec for filter_spec, _ in remaining))
+
+            for rendition in renditions:
+                lookup = (rendition.filter_spec, rendition.focal_point_key)
+                if lookup not in remaining:
+                    continue
+
+                found[lookup] = rendition
+
+                if rendition_cache is not None:
+                    rendition_cache.set(
+                        get_rendition_cache_key(self.pk, rendition.filter_spec, rendition.focal_point_key),
+                        get_rendition_cache_value(rendition)
+                    )
+
+        return found
+
+    def _refind_renditions(self, lookups, missing, renditions):
+        """
+        Looks up the missing renditions again, adding those found to renditions.
+        Returns the indexes of the renditions that are still missing.
+        """
+        prefetched = getattr(self, '_prefetched_renditions', None)
+        if prefetched is not None:
+            # prefetch_renditions recorded them as missing
+            for i in missing:
+                prefetched.pop(lookups[i], None)
+
+        renditions.update(self._find_renditions([lookups[i] for i in missing]))
+        return [i for i in missing if lookups[i] not in renditions]
+
+    def _find_rendition(self, filter_spec, cache_key):
+        """ Looks up an existing rendition, returns None if it does not exist """
+        return self._find_renditions([(filter_spec, cache_key)]).get((filter_spec, cache_key))
+
+    def get_content_addressed_name(self, filter_spec, cache_key, output_format):
+        """
+        The name of a rendition file derived from the content of the original, the spec and the focal point key,
+        so identical renditions of the same content share a file. Returns None if the image has no file hash.
+        """
+        if not self.file_hash:
+            return None
+
+        value = '{}:{}:{}'.format(self.file_hash, filter_spec, cache_key)
+        digest = hashlib.sha256(value.encode('utf-8')).hexdigest()
+        return '{}/{}{}'.format(digest[:2], digest, FormatOperation.extensions[output_format])
+
+    def _get_rendition_filename(self, filter, cache_key, output_format):
+        if get_setting('CONTENT_ADDRESSED_RENDITIONS'):
+            content_addressed_name = self.get_content_addressed_name(filter.spec, cache_key, output_format)
+            if content_addressed_name is not None:
+                return content_addressed_name
+
+        # Generate filename
+        input_filename = os.path.basename(self.file.name)
+        input_filename_without_extension, input_extension = os.path.splitext(input_filename)
+
+        # Get the file extension to output
+        output_extension = filter.spec.replace('|', '.') + FormatOperation.extensions[output_format]
+
+        # Truncate filename to prevent it going over 60 chars
+        output_filename_without_extension = input_filename_without_extension[:(59 - len(output_extension))]
+        return output_filename_without_extension + '.' + output_extension
+
+    def _save_rendition(self, filter, cache_key, generated_image, size):
+        """
+        Stores a generated rendition image of size, returns the rendition.
+        The file is written to storage before the rendition is created with its known dimensions,
+        so the image field never has to open the stored file again to read them.
+        The number of bytes written is kept on the rendition as ``_bytes_written``.
+        """
+        output_filename = self._get_rendition_filename(filter, cache_key, generated_image.format_name)
+
+        file_field = self.renditions.model._meta.get_field('file')
+        output_file = File(generated_image.f, name=output_filename)
+
+        with metrics.timer('storage.write'):
+            file_name = file_field.storage.save(
+                file_field.generate_filename(self.renditions.model(image=self), output_filename),
+                output_file
             )
 
+        metrics.incr('storage.write.bytes', output_file.size)
+
+        rendition = self._create_rendition(filter, cache_key, file_name, size)
+
+        if rendition.file.name != file_name:
+            # generated at the same time elsewhere, the one stored first wins
+            file_field.storage.delete(file_name)
+
+        rendition._bytes_written = output_file.size
         return rendition
 
+    def _create_rendition(self, filter, cache_key, file_name, size):
+        """ Creates the rendition for a file already in storage, returns the rendition """
+        width, height = size
+        rendition, created = self.renditions.get_or_create(
+            filter_spec=filter.spec,
+            focal_point_key=cache_key,
+            defaults={'file': file_name, 'width': width, 'height': height}
+        )
+
+        prefetched = getattr(self, '_prefetched_renditions', None)
+        if prefetched is not None:
+            prefetched[(filter.spec, cache_key)] = rendition
+
+        rendition_cache = get_rendition_cache()
+        if rendition_cache is not None:
+            # only cache once committed so a rolled back rendition is never served
+            rendition_cache_key = get_rendition_cache_key(self.pk, filter.spec, cache_key)
+            rendition_cache_value = get_rendition_cache_value(rendition)
+            transaction.on_commit(lambda: rendition_cache.set(rendition_cache_key, rendition_cache_value))
+
+        return rendition
+
+    def _find_stored_renditions(self, filters, cache_keys, lookups, missing, renditions, willow, original_format,
+                                animation=None):
+        """
+        Creates the missing renditions whose content addressed files are already stored, for this
+        or another image with the same content, adding them to renditions. animation is the original
+        opened by open_animation, if it is rendered as one.
+        Returns the indexes of the renditions that are still missing.
+        """
+        file_field = self.renditions.model._meta.get_field('file')
+        still_missing = []
+
+        # the sizes predicted from the stored dimensions are not those of an exif rotated photo
+        transposed = is_transposed(willow)
+
+        for i in missing:
+            if lookups[i] in renditions:
+                continue
+
+            output_format = filters[i].predict_output_format(
+                willow, self, original_format, animated=filters[i].animates(animation, willow, self))
+            output_filename = self.get_content_addressed_name(filters[i].spec, cache_keys[i], output_format)
+            file_name = file_field.generate_filename(self.renditions.model(image=self), output_filename)
+
+            if file_field.storage.exists(file_name):
+                if transposed:
+                    # only the header of the stored file is read
+                    with file_field.storage.open(file_name) as f:
+                        record_storage_read()
+                        size = PIL_Image.open(f).size
+                else:
+                    size = filters[i].predict_size(self)
+
+                renditions[lookups[i]] = self._create_rendition(filters[i], cache_keys[i], file_name, size)
+            else:
+                still_missing.append(i)
+
+        return still_missing
+
+    def find_rendition(self, filter):
+        """ Returns the existing rendition for the filter without generating it, or None """
+        if isinstance(filter, str):
+            filter = get_filter(filter)
+
+        return self._find_rendition(filter.spec, filter.get_cache_key(self))
+
+    def find_renditions(self, filters):
+        """ Returns the existing renditions for many filters in one query, None for those that do not exist """
+        filters = [get_filter(filter) if isinstance(filter, str) else filter for filter in filters]
+        lookups = [(filter.spec, filter.get_cache_key(self)) for filter in filters]
+
+        renditions = self._find_renditions(lookups)
+        return [renditions.get(lookup) for lookup in lookups]
+
+    def enqueue_rendition(self, filter):
+        """ Queues the rendition for the filter to be generated by a worker """
+        if isinstance(filter, str):
+            filter = get_filter(filter)
+
+        cache_key = filter.get_cache_key(self)
+        job, created = self.rendition_jobs.get_or_create(
+            filter_spec=filter.spec,
+            focal_point_key=cache_key
+        )
+        return job
+
+    def _cascade_renditions(self, filters, cache_keys, lookups, missing, renditions):
+        """
+        Generates the missing resize only renditions from the smallest stored rendition that is at least as large,
+        rather than from the original. Adds them to renditions and returns the indexes still missing.
+        """
+        cascadable = [i for i in missing if filters[i].is_resize_only]
+        if not cascadable:
+            return missing
+
+        if get_setting('ANIMATED_RENDITIONS') and os.path.splitext(self.file.name)[1].lower() == '.gif':
+            # the stored renditions may be stills of an animation
+            return missing
+
+        sources = []
+        for rendition in self.renditions.filter(focal_point_key=''):
+            try:
+                source_filter = get_filter(rendition.filter_spec)
+            except InvalidFilterSpecError:
+                # left by an operation that was removed or is not available here
+                continue
+
+            # gifs may be animated and are left to the original
+            if not source_filter.is_cascade_source or rendition.file.name.endswith('.gif'):
+                continue
+
+            # the stored size of the image does not match the oriented original, eg an exif rotated photo
+            if source_filter.predict_size(self) != (rendition.width, rendition.height):
+                return missing
+
+            sources.append(rendition)
+
+        # the largest first so they can be the source of the smaller ones
+        sizes = dict((i, filters[i].predict_size(self)) for i in cascadable)
+        cascadable.sort(key=lambda i: sizes[i][0] * sizes[i][1], reverse=True)
+
+        cascaded = set()
+        for i in cascadable:
+            if lookups[i] in renditions:
+                continue
+
+            width, height = sizes[i]
+            candidates = [source for source in sources if source.width >= width and source.height >= height]
+            if not candidates:
+                continue
+
+            source = min(candidates, key=lambda source: source.width * source.height)
+
+            with source.get_willow_image() as willow:
+                original_format = willow.format_name
+
+                if willow.get_size() != (width, height):
+                    willow = willow.resize((width, height))
+
+                with get_output_file() as output:
+                    generated_image, size = filters[i].process(willow, self, output, original_format)
+                    rendition = self._save_rendition(filters[i], cache_keys[i], generated_image, size)
+
+            renditions[lookups[i]] = rendition
+            cascaded.add(i)
+
+            if filters[i].is_cascade_source:
+                sources.append(rendition)
+
+        return [i for i in missing if i not in cascaded]
+
+    def _generate_animated_renditions(self, filters, cache_keys, lookups, missing, renditions, willow, animation):
+        """
+        Generates the missing renditions that are animated from an original opened by open_animation,
+        a frame at a time, adding them to renditions. Returns the indexes of the renditions still missing.
+        """
+        still_missing = []
+
+        for i in missing:
+            if lookups[i] in renditions:
+                # the same spec was asked for twice
+                continue
+
+            if not filters[i].animates(animation, willow, self):
+                still_missing.append(i)
+                continue
+
+            with get_output_file() as output:
+                generated_image, size = filters[i].process_animation(animation, self, output)
+                renditions[lookups[i]] = self._save_rendition(filters[i], cache_keys[i], generated_image, size)
+
+        return still_missing
+
+    def generate_renditions(self, filters):
+        """
+        Gets or creates the renditions for many filters, returning them in the same order.
+        Existing renditions are looked up in one query and the original is read, decoded and
+        oriented at most once, however many renditions are missing.
+        """
+        filters = [get_filter(filter) if isinstance(filter, str) else filter for filter in filters]
+
+        cache_keys = [filter.get_cache_key(self) for filter in filters]
+        lookups = [(filter.spec, cache_key) for filter, cache_key in zip(filters, cache_keys)]
+
+        renditions = self._find_renditions(lookups)
+        missing = [i for i, lookup in enumerate(lookups) if lookup not in renditions]
+
+        metrics.incr('rendition.hit', len(lookups) - len(missing))
+        metrics.incr('rendition.miss', len(missing))
+
+        if not missing:
+            return [renditions[lookup] for lookup in lookups]
+
+        generated = len(missing)
+
+        with count_storage_reads() as storage_reads, lock_renditions(self, [lookups[i] for i in missing]) as waited:
+            if waited:
+                # another worker generated some of them while this one waited for the lock
+                missing = self._refind_renditions(lookups, missing, renditions)
+
+            if missing and get_setting('CASCADE_RENDITIONS'):
+                missing = self._cascade_renditions(filters, cache_keys, lookups, missing, renditions)
+
+            if missing:
+                with self.get_willow_image() as willow:
+                    original_format = willow.format_name
+
+                    # only the headers are read, an animation over the limits is rendered as a still
+                    animation = open_animation(willow)
+
+                    if get_setting('CONTENT_ADDRESSED_RENDITIONS') and self.file_hash:
+                        # only the header has been read, the files may already be stored for the same content
+                        missing = self._find_stored_renditions(
+                            filters, cache_keys, lookups, missing, renditions, willow, original_format, animation)
+
+                    if animation is not None:
+                        missing = self._generate_animated_renditions(
+                            filters, cache_keys, lookups, missing, renditions, willow, animation)
+
+                    if missing:
+                        with metrics.timer('decode', format=original_format):
+                            # Decode large jpegs at the smallest size all of the missing renditions allow
+                            willow, scale = open_reduced(willow, [filters[i] for i in missing], self)
+
+                            # Fix orientation of image
+                            willow = willow.auto_orient()
+
+                            # Pillow decodes lazily, read the pixels here rather than in the first operation
+                            if isinstance(willow, PillowImage):
+                                willow.image.load()
+
+                        for i in missing:
+                            if lookups[i] in renditions:
+                                # the same spec was asked for twice
+                                continue
+
+                            # Generate the rendition image
+                            with get_output_file() as output:
+                                generated_image, size = filters[i].process(willow, self, output, original_format, scale)
+                                renditions[lookups[i]] = self._save_rendition(
+                                    filters[i], cache_keys[i], generated_image, size)
+
+        logger.debug('Generated {} rendition(s) of {} with {} storage read(s)'.format(
+            generated, self, storage_reads.count))
+
+        return [renditions[lookup] for lookup in lookups]
+
+    def get_rendition(self, filter):
+        return self.generate_renditions([filter])[0]
+
 
 class Image(AbstractImage):
     """ base image model """
@@ -0,0 +1,56 @@
+from contextlib import contextmanager
+
+from willow.image import Image as WillowImage
+
+from images import metrics
+from images.exceptions import SourceImageIOError
+from images.fields import record_storage_read
+
+
+class WillowImageMixin:
+    """ opens the model's ``file`` as a willow image """
+
+    def is_stored_locally(self):
+        """ Returns True if the image is hosted on the local filesystem """
+        try:
+            self.file.path
+
+            return True
+        except NotImplementedError:
+            return False
+
+    @contextmanager
+    def get_willow_image(self):
+        # Open file if it is closed
+        close_file = False
+        try:
+            image_file = self.file
+
+            if self.file.closed:
+                # Reopen the file
+                if self.is_stored_locally():
+                    self.file.open('rb')
+                else:
+                    # Some external storage backends don't allow reopening
+                    # the file. Get a fresh file instance. #1397
+                    storage = self._meta.get_field('file').storage
+                    image_file = storage.open(self.file.name, 'rb')
+                    record_storage_read()
+
+                close_file = True
+        except IOError as e:
+            # re-throw this as a SourceImageIOError so that calling code can distinguish
+            # these from IOErrors elsewhere in the process
+            raise SourceImageIOError(str(e))
+
+        # Seek to beginning
+        image_file.seek(0)
+
+        try:
+            with metrics.timer('open'):
+                willow = WillowImage.open(image_file)
+
+            yield willow
+        finally:
+            if close_file:
+                image_file.close()
@@ -5,8 +5,12 @@ from django.forms.utils import flatatt
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 
+from images.cache import get_rendition_url_cache, get_rendition_url_cache_key
+from images.fields import ImageField
+from images.models.mixins import WillowImageMixin
 
-class AbstractRendition(models.Model):
+
+class AbstractRendition(WillowImageMixin, models.Model):
     """ Abstract base model to hold various renditions of an image """
 
     filter_spec = models.CharField(
@@ -18,7 +22,7 @@ class AbstractRendition(models.Model):
         related_name='renditions',
         on_delete=models.CASCADE
     )
-    file = models.ImageField(
+    file = ImageField(
         verbose_name=_('file'),
         upload_to='images_renditions/',
         width_field='width',
@@ -47,7 +51,19 @@ class AbstractRendition(models.Model):
 
     @property
     def url(self):
-        return self.file.url
+        """ The url of the file, kept in the ``IMAGES_RENDITION_URL_CACHE`` when it is enabled """
+        url_cache = get_rendition_url_cache()
+        if url_cache is None:
+            return self.file.url
+
+        key = get_rendition_url_cache_key(self.file.name)
+        url = url_cache.get(key)
+
+        if url is None:
+            url = self.file.url
+            url_cache.set(key, url)
+
+        return url
 
     @property
     def alt(self):
@@ -0,0 +1,52 @@
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+
+class AbstractRenditionJob(models.Model):
+    """ Abstract base model to queue renditions to be generated by a worker """
+
+    image = models.ForeignKey(
+        'Image',
+        related_name='rendition_jobs',
+        on_delete=models.CASCADE
+    )
+    filter_spec = models.CharField(
+        max_length=255
+    )
+    focal_point_key = models.CharField(
+        max_length=16,
+        blank=True,
+        default='',
+        editable=False
+    )
+    created_at = models.DateTimeField(
+        verbose_name=_('created at'),
+        auto_now_add=True,
+        db_index=True
+    )
+    started_at = models.DateTimeField(
+        verbose_name=_('started at'),
+        null=True,
+        blank=True
+    )
+    attempts = models.PositiveIntegerField(
+        verbose_name=_('attempts'),
+        default=0
+    )
+    error = models.TextField(
+        verbose_name=_('error'),
+        blank=True
+    )
+
+    class Meta:
+        abstract = True
+        unique_together = (
+            ('image', 'filter_spec', 'focal_point_key'),
+        )
+
+    def __str__(self):
+        return '{} {}'.format(self.image_id, self.filter_spec)
+
+
+class RenditionJob(AbstractRenditionJob):
+    """ queued rendition waiting to be generated """
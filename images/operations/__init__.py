@@ -1,3 +1,4 @@
+from .avif_quality import AVIFQualityOperation
 from .background_color import BackgroundColorOperation
 from .crop import CropOperation
 from .do_nothing import DoNothingOperation
@@ -5,4 +6,6 @@ from .fill import FillOperation
 from .format import FormatOperation
 from .jpeg_quality import JPEGQualityOperation
 from .min_max import MinMaxOperation
+from .poster import PosterOperation
+from .webp_quality import WebPQualityOperation
 from .width_height import WidthHeightOperation
@@ -1,9 +1,23 @@
 import inspect
 
 from images.exceptions import InvalidFilterSpecError
+from images.rect import Rect
+
+
+def clamp_rect(rect, size):
+    """ clamps a crop rect to the boundaries of an image of size in the same way as willow does """
+    left, top, right, bottom = rect
+    width, height = size
+    return max(0, left), max(0, top), min(right, width), min(bottom, height)
 
 
 class Operation:
+    # only scales the whole image, so running it on a larger rendition looks the same as running it on the original
+    resize_only = False
+
+    # only changes how the result is saved, not its pixels
+    output_only = False
+
     def __init__(self, method, *args):
         self.method = method
         self.args = args
@@ -25,3 +39,58 @@ class Operation:
 
     def run(self, willow, image, env):
         raise NotImplementedError
+
+    def get_output_size(self, size, image):
+        """
+        Returns the (width, height) running the operation on an image of size gives, without touching any pixels.
+        Only the image's focal point fields are used. Operations that do not change the size leave this as it is.
+        """
+        return size
+
+    def get_output_sizes(self, sizes, focal_points):
+        """
+        get_output_size for many images at once, given arrays of their sizes and focal point rects as made by
+        ``images.geometry.get_image_arrays``. Operations that do not change the size leave this as it is.
+        """
+        return sizes
+
+    def get_crop_size(self, rect, size):
+        """ the size cropping an image of size to rect gives, clamped and rounded the same as willow and pillow """
+        left, top, right, bottom = clamp_rect(rect, size)
+        return int(round(right)) - int(round(left)), int(round(bottom)) - int(round(top))
+
+    # When the original was decoded at a reduced size env['scale'] holds the (x, y) scale of the image
+    # against the one a full size decode would have at the same point. Operations work in full size units
+    # through these helpers so their results are the same either way.
+
+    def get_image_size(self, willow, env):
+        """ the size of the image as if the original had been decoded at full size """
+        if 'scale' not in env:
+            return willow.get_size()
+
+        width, height = willow.get_size()
+        scale_x, scale_y = env['scale']
+        return int(round(width / scale_x)), int(round(height / scale_y))
+
+    def crop_image(self, willow, rect, env):
+        """ crops to a rect given in full size units """
+        if 'scale' not in env:
+            return willow.crop(rect)
+
+        scale_x, scale_y = env['scale']
+        size = self.get_image_size(willow, env)
+
+        left, top, right, bottom = clamp_rect(rect, size)
+        willow = willow.crop(Rect(left * scale_x, top * scale_y, right * scale_x, bottom * scale_y).round())
+
+        # against the size a full size crop would have
+        width, height = willow.get_size()
+        crop_width, crop_height = self.get_crop_size(rect, size)
+        env['scale'] = (width / crop_width, height / crop_height)
+
+        return willow
+
+    def resize_image(self, willow, size, env):
+        """ resizes to an exact size, so the image is no longer reduced """
+        env.pop('scale', None)
+        return willow.resize(size)
@@ -1,8 +1,10 @@
+from images import geometry
 from images.rect import Rect
 from .base import Operation
 
 
 class CropOperation(Operation):
+    vary_fields = ('focal_point_width', 'focal_point_height', 'focal_point_x', 'focal_point_y')
 
     def construct(self, size=None):
         if size:
@@ -12,8 +14,12 @@ class CropOperation(Operation):
             self.width = int(width_str)
             self.height = int(height_str)
 
-    def run(self, willow, image, env):
-        image_width, image_height = willow.get_size()
+            # cropped to the given rect rather than the focal point
+            self.vary_fields = ()
+
+    def get_crop_rect(self, size, image):
+        """ the rect to crop an image of size to, None to leave it uncropped """
+        image_width, image_height = size
         focal_point = image.get_focal_point()
 
         if hasattr(self, 'left'):
@@ -26,11 +32,35 @@ class CropOperation(Operation):
             max_crop_width = min(self.width, crop_x * 2, remaining_after_x * 2)
             max_crop_height = min(self.height, crop_y * 2, remaining_after_y * 2)
 
-            rect = Rect.from_point(crop_x, crop_y, max_crop_width, max_crop_height)
-
-            willow = willow.crop(rect)
+            return Rect.from_point(crop_x, crop_y, max_crop_width, max_crop_height)
 
         elif focal_point:
-            willow = willow.crop(focal_point)
+            return focal_point
+
+    def get_output_size(self, size, image):
+        rect = self.get_crop_rect(size, image)
+
+        if rect is None:
+            return size
+
+        return self.get_crop_size(rect, size)
+
+    def get_crop_rect_args(self):
+        """ the (left, top, width, height) of the spec, None to crop to the focal point """
+        if hasattr(self, 'left'):
+            return self.left, self.top, self.width, self.height
+
+    def get_crop_rects(self, sizes, focal_points):
+        """ get_crop_rect for many images at once, with rows of NaN for images left uncropped """
+        return geometry.get_crop_rects(sizes, focal_points, self.get_crop_rect_args())
+
+    def get_output_sizes(self, sizes, focal_points):
+        return geometry.get_cropped_sizes(sizes, focal_points, self.get_crop_rect_args())
+
+    def run(self, willow, image, env):
+        rect = self.get_crop_rect(self.get_image_size(willow, env), image)
+
+        if rect is not None:
+            willow = self.crop_image(willow, rect, env)
 
         return willow
@@ -2,6 +2,8 @@ from .base import Operation
 
 
 class DoNothingOperation(Operation):
+    resize_only = True
+
     def construct(self):
         pass
 
@@ -1,3 +1,4 @@
+from images import geometry
 from images.rect import Rect
 from .base import Operation
 
@@ -27,8 +28,9 @@ class FillOperation(Operation):
         if self.crop_closeness > 1:
             self.crop_closeness = 1
 
-    def run(self, willow, image, env):
-        image_width, image_height = willow.get_size()
+    def get_crop_rect(self, size, image):
+        """ the rect to crop an image of size to before it is resized """
+        image_width, image_height = size
         focal_point = image.get_focal_point()
 
         # Get crop aspect ratio
@@ -91,18 +93,37 @@ class FillOperation(Operation):
         # Don't allow the crop box to go over the image boundary
         rect = rect.move_to_clamp(Rect(0, 0, image_width, image_height))
 
+        return rect.round()
+
+    def get_output_size(self, size, image):
+        crop_width, crop_height = self.get_crop_size(self.get_crop_rect(size, image), size)
+
+        # Only resized if the image is too big
+        if self.width / crop_width < 1.0:
+            return self.width, self.height
+
+        return crop_width, crop_height
+
+    def get_crop_rects(self, sizes, focal_points):
+        """ get_crop_rect for many images at once """
+        return geometry.get_fill_crop_rects(sizes, focal_points, self.width, self.height, self.crop_closeness)
+
+    def get_output_sizes(self, sizes, focal_points):
+        return geometry.get_fill_sizes(sizes, focal_points, self.width, self.height, self.crop_closeness)
+
+    def run(self, willow, image, env):
         # Crop!
-        willow = willow.crop(rect.round())
+        willow = self.crop_image(willow, self.get_crop_rect(self.get_image_size(willow, env), image), env)
 
         # Get scale for resizing
         # The scale should be the same for both the horizontal and
         # vertical axes
-        aftercrop_width, aftercrop_height = willow.get_size()
+        aftercrop_width, aftercrop_height = self.get_image_size(willow, env)
         scale = self.width / aftercrop_width
 
         # Only resize if the image is too big
         if scale < 1.0:
             # Resize!
-            willow = willow.resize((self.width, self.height))
+            willow = self.resize_image(willow, (self.width, self.height), env)
 
         return willow
@@ -1,12 +1,49 @@
+from PIL import Image as PIL_Image
+from willow.plugins.pillow import PillowImage
+
 from .base import Operation
 
 
+def has_avif_encoder():
+    """ True if Pillow can save avif, natively or through a plugin, and willow can ask it to """
+    PIL_Image.init()
+    return 'AVIF' in PIL_Image.SAVE and hasattr(PillowImage, 'save_as_avif')
+
+
 class FormatOperation(Operation):
+    output_only = True
+
+    # the content types of the formats
+    mime_types = {
+        'jpeg': 'image/jpeg',
+        'png': 'image/png',
+        'gif': 'image/gif',
+        'webp': 'image/webp',
+        'avif': 'image/avif',
+    }
+
+    # the file extensions of the formats
+    extensions = {
+        'jpeg': '.jpg',
+        'png': '.png',
+        'gif': '.gif',
+        'webp': '.webp',
+        'avif': '.avif',
+    }
+
     def construct(self, fmt):
         self.format = fmt
 
-        if self.format not in ['jpeg', 'png', 'gif']:
-            raise ValueError("Format must be either 'jpeg', 'png' or 'gif'")
+        # auto is resolved from the request's Accept header, left unresolved it keeps the original format
+        if self.format == 'auto':
+            return
+
+        if self.format not in self.mime_types:
+            raise ValueError("Format must be either 'jpeg', 'png', 'gif', 'webp', 'avif' or 'auto'")
+
+        if self.format == 'avif' and not has_avif_encoder():
+            raise ValueError("AVIF output needs Pillow with an AVIF encoder")
 
     def run(self, willow, image, env):
-        env['output-format'] = self.format
+        if self.format != 'auto':
+            env['output-format'] = self.format
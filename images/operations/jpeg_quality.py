@@ -2,6 +2,8 @@ from .base import Operation
 
 
 class JPEGQualityOperation(Operation):
+    output_only = True
+
     def construct(self, quality):
         self.quality = int(quality)
 
@@ -1,22 +1,25 @@
+from images import geometry
 from .base import Operation
 
 
 class MinMaxOperation(Operation):
+    resize_only = True
+
     def construct(self, size):
         # Get width and height
         width_str, height_str = size.split('x')
         self.width = int(width_str)
         self.height = int(height_str)
 
-    def run(self, willow, image, env):
-        image_width, image_height = willow.get_size()
+    def get_output_size(self, size, image):
+        image_width, image_height = size
 
         horz_scale = self.width / image_width
         vert_scale = self.height / image_height
 
         if self.method == 'min':
             if image_width <= self.width or image_height <= self.height:
-                return
+                return size
 
             if horz_scale > vert_scale:
                 width = self.width
@@ -27,7 +30,7 @@ class MinMaxOperation(Operation):
 
         elif self.method == 'max':
             if image_width <= self.width and image_height <= self.height:
-                return
+                return size
 
             if horz_scale < vert_scale:
                 width = self.width
@@ -38,6 +41,16 @@ class MinMaxOperation(Operation):
 
         else:
             # Unknown method
-            return
+            return size
+
+        return width, height
+
+    def get_output_sizes(self, sizes, focal_points):
+        return geometry.get_min_max_sizes(sizes, self.method, self.width, self.height)
+
+    def run(self, willow, image, env):
+        size = self.get_image_size(willow, env)
+        output_size = self.get_output_size(size, image)
 
-        return willow.resize((width, height))
+        if output_size != size:
+            return self.resize_image(willow, output_size, env)
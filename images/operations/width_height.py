@@ -1,16 +1,19 @@
+from images import geometry
 from .base import Operation
 
 
 class WidthHeightOperation(Operation):
+    resize_only = True
+
     def construct(self, size):
         self.size = int(size)
 
-    def run(self, willow, image, env):
-        image_width, image_height = willow.get_size()
+    def get_output_size(self, size, image):
+        image_width, image_height = size
 
         if self.method == 'width':
             if image_width <= self.size:
-                return
+                return size
 
             scale = self.size / image_width
 
@@ -19,7 +22,7 @@ class WidthHeightOperation(Operation):
 
         elif self.method == 'height':
             if image_height <= self.size:
-                return
+                return size
 
             scale = self.size / image_height
 
@@ -28,6 +31,16 @@ class WidthHeightOperation(Operation):
 
         else:
             # Unknown method
-            return
+            return size
+
+        return width, height
+
+    def get_output_sizes(self, sizes, focal_points):
+        return geometry.get_resized_sizes(sizes, self.method, self.size)
+
+    def run(self, willow, image, env):
+        size = self.get_image_size(willow, env)
+        output_size = self.get_output_size(size, image)
 
-        return willow.resize((width, height))
+        if output_size != size:
+            return self.resize_image(willow, output_size, env)
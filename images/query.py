@@ -0,0 +1,95 @@
+from itertools import islice
+
+from django.db import models
+from django.db.models.query import ModelIterable
+
+from images.filter import get_filter
+
+
+def prefetch_renditions(images, filters):
+    """
+    Fetches the renditions of many images for many filters in a single query.
+
+    Each image is seeded with a lookup of its renditions that ``get_rendition`` checks
+    before going to the database, so rendering the same specs for every image in a
+    listing does not cost a query per image. Returns the images as a list.
+    """
+
+    images = list(images)
+    if not images:
+        return images
+
+    filters = [get_filter(f) if isinstance(f, str) else f for f in filters]
+
+    wanted = {}
+    specs = set()
+
+    for image in images:
+        image._prefetched_renditions = {}
+
+        for filter in filters:
+            cache_key = filter.get_cache_key(image)
+            wanted[(image.pk, filter.spec, cache_key)] = image
+            specs.add(filter.spec)
+
+            # mark as missing until we know otherwise
+            image._prefetched_renditions[(filter.spec, cache_key)] = None
+
+    rendition_model = images[0].renditions.model
+    renditions = rendition_model.objects.filter(
+        image__in=[image.pk for image in images],
+        filter_spec__in=specs
+    )
+
+    for rendition in renditions:
+        image = wanted.get((rendition.image_id, rendition.filter_spec, rendition.focal_point_key))
+        if image is not None:
+            rendition.image = image
+            image._prefetched_renditions[(rendition.filter_spec, rendition.focal_point_key)] = rendition
+
+    return images
+
+
+class ImageQuerySet(models.QuerySet):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._rendition_filters = []
+        self._renditions_prefetched = False
+
+    def prefetch_renditions(self, *filters):
+        """
+        Returns a new queryset that fetches the renditions for the given filters
+        in one extra query when evaluated, or one for each chunk of images with ``iterator()``.
+        """
+        clone = self._chain()
+        clone._rendition_filters = clone._rendition_filters + list(filters)
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._rendition_filters = self._rendition_filters[:]
+        return clone
+
+    def iterator(self, chunk_size=2000):
+        iterator = super().iterator(chunk_size=chunk_size)
+
+        # django's prefetch_related is left out of iterator() but the renditions can be fetched a chunk at a time
+        if self._rendition_filters and self._iterable_class is ModelIterable:
+            return self._iterate_prefetched(iterator, chunk_size)
+
+        return iterator
+
+    def _iterate_prefetched(self, iterator, chunk_size):
+        while True:
+            images = list(islice(iterator, chunk_size))
+            if not images:
+                return
+
+            yield from prefetch_renditions(images, self._rendition_filters)
+
+    def _fetch_all(self):
+        super()._fetch_all()
+        if self._rendition_filters and not self._renditions_prefetched and self._iterable_class is ModelIterable:
+            prefetch_renditions(self._result_cache, self._rendition_filters)
+            self._renditions_prefetched = True
@@ -0,0 +1,88 @@
+import logging
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from images.conf import get_setting
+from images.exceptions import SourceImageIOError
+from images.models import RenditionJob
+
+
+logger = logging.getLogger(__name__)
+
+
+def claim_job():
+    """
+    Claims the oldest queued rendition job so no other worker picks it up.
+    Jobs that were started but never finished are reclaimed after ``RENDITION_JOB_TIMEOUT``
+    seconds, up to ``RENDITION_JOB_MAX_ATTEMPTS`` times. Returns None if the queue is empty.
+    """
+    stale_before = timezone.now() - timedelta(seconds=get_setting('RENDITION_JOB_TIMEOUT'))
+
+    with transaction.atomic():
+        jobs = RenditionJob.objects.filter(
+            Q(started_at__isnull=True) | Q(started_at__lt=stale_before),
+            attempts__lt=get_setting('RENDITION_JOB_MAX_ATTEMPTS')
+        ).order_by('created_at', 'pk')
+
+        if connection.features.has_select_for_update_skip_locked:
+            jobs = jobs.select_for_update(skip_locked=True)
+
+        job = jobs.first()
+
+        if job is not None:
+            job.started_at = timezone.now()
+            job.attempts += 1
+            job.save(update_fields=['started_at', 'attempts'])
+
+    return job
+
+
+def requeue_failed_jobs(queryset=None):
+    """
+    Queues the jobs that used up their ``RENDITION_JOB_MAX_ATTEMPTS`` again, all of them or those in queryset.
+    Returns the number of jobs queued.
+    """
+    if queryset is None:
+        queryset = RenditionJob.objects.all()
+
+    return queryset.filter(attempts__gte=get_setting('RENDITION_JOB_MAX_ATTEMPTS')).update(
+        attempts=0, started_at=None, error='')
+
+
+def run_job(job):
+    """
+    Generates the rendition for a job, returns True if it succeeded.
+    Failed jobs are left started so they are only retried once ``RENDITION_JOB_TIMEOUT`` has passed.
+    """
+    try:
+        job.image.get_rendition(job.filter_spec)
+    except Exception as e:
+        if isinstance(e, SourceImageIOError):
+            logger.error('Source image missing {}'.format(job.image))
+        else:
+            logger.exception('Failed to generate rendition {} for {}'.format(job.filter_spec, job.image))
+
+        job.error = str(e)
+        job.save(update_fields=['error'])
+        return False
+
+    job.delete()
+    return True
+
+
+def process_queue(limit=None):
+    """ Works through the queued rendition jobs, returns the number of jobs processed """
+    processed = 0
+
+    while limit is None or processed < limit:
+        job = claim_job()
+        if job is None:
+            break
+
+        run_job(job)
+        processed += 1
+
+    return processed
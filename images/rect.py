@@ -1,20 +1,32 @@
 import math
+from operator import itemgetter
 
+# the attribute of each index of a Rect
+RECT_FIELDS = ('left', 'top', 'right', 'bottom')
 
-class Vector:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
 
-    def __iter__(self):
-        return iter((self.x, self.y))
+class Vector(tuple):
+    """ An (x, y) pair, a tuple so building and indexing one costs no more than a plain tuple """
 
-    def __getitem__(self, key):
-        return (self.x, self.y)[key]
+    __slots__ = ()
+
+    def __new__(cls, x, y):
+        return tuple.__new__(cls, (x, y))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    x = property(itemgetter(0))
+    y = property(itemgetter(1))
 
     def __eq__(self, other):
         return tuple(self) == tuple(other)
 
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = tuple.__hash__
+
     def __repr__(self):
         return 'Vector(x: %d, y: %d)' % (
             self.x, self.y
@@ -22,6 +34,10 @@ class Vector:
 
 
 class Rect:
+    # derived values such as the width and centroid are worked out from the edges when asked for,
+    # rather than through a Vector, as the edges can be changed at any time
+    __slots__ = ('left', 'top', 'right', 'bottom')
+
     def __init__(self, left, top, right, bottom):
         self.left = left
         self.top = top
@@ -32,51 +48,53 @@ class Rect:
         return Vector(self.right - self.left, self.bottom - self.top)
 
     def _set_size(self, new_size):
-        centroid = self.centroid
-        self.left = centroid[0] - new_size[0] / 2
-        self.right = centroid[0] + new_size[0] / 2
-        self.top = centroid[1] - new_size[1] / 2
-        self.bottom = centroid[1] + new_size[1] / 2
+        centroid_x = (self.left + self.right) / 2
+        centroid_y = (self.top + self.bottom) / 2
+        self.left = centroid_x - new_size[0] / 2
+        self.right = centroid_x + new_size[0] / 2
+        self.top = centroid_y - new_size[1] / 2
+        self.bottom = centroid_y + new_size[1] / 2
 
     size = property(_get_size, _set_size)
 
     @property
     def width(self):
-        return self.size.x
+        return self.right - self.left
 
     @property
     def height(self):
-        return self.size.y
+        return self.bottom - self.top
 
     def _get_centroid(self):
         return Vector((self.left + self.right) / 2, (self.top + self.bottom) / 2)
 
     def _set_centroid(self, new_centroid):
-        size = self.size
-        self.left = new_centroid[0] - size[0] / 2
-        self.right = new_centroid[0] + size[0] / 2
-        self.top = new_centroid[1] - size[1] / 2
-        self.bottom = new_centroid[1] + size[1] / 2
+        width = self.right - self.left
+        height = self.bottom - self.top
+        self.left = new_centroid[0] - width / 2
+        self.right = new_centroid[0] + width / 2
+        self.top = new_centroid[1] - height / 2
+        self.bottom = new_centroid[1] + height / 2
 
     centroid = property(_get_centroid, _set_centroid)
 
     @property
     def x(self):
-        return self.centroid.x
+        return (self.left + self.right) / 2
 
     @property
     def y(self):
-        return self.centroid.y
+        return (self.top + self.bottom) / 2
 
     @property
     def centroid_x(self):
         # Included for backwards compatibility
-        return self.centroid.x
+        return (self.left + self.right) / 2
 
     @property
     def centroid_y(self):
         # Included for backwards compatibility
-        return self.centroid.y
+        return (self.top + self.bottom) / 2
 
     def as_tuple(self):
         # No longer needed, this class should behave like a tuple
@@ -90,75 +108,75 @@ class Rect:
         """
         Returns a new rect with all attributes rounded to integers
         """
-        clone = self.clone()
-
-        # Round down left and top
-        clone.left = int(math.floor(clone.left))
-        clone.top = int(math.floor(clone.top))
-
-        # Round up right and bottom
-        clone.right = int(math.ceil(clone.right))
-        clone.bottom = int(math.ceil(clone.bottom))
-
-        return clone
+        # Round down left and top, round up right and bottom
+        return type(self)(
+            int(math.floor(self.left)),
+            int(math.floor(self.top)),
+            int(math.ceil(self.right)),
+            int(math.ceil(self.bottom)),
+        )
 
     def move_to_clamp(self, other):
         """
         Moves this rect so it is completely covered by the rect in "other" and
         returns a new Rect instance.
         """
-        other = Rect(*other)
-        clone = self.clone()
+        other_left, other_top, other_right, other_bottom = other
+        left, top, right, bottom = self.left, self.top, self.right, self.bottom
 
-        if clone.left < other.left:
-            clone.right -= clone.left - other.left
-            clone.left = other.left
+        if left < other_left:
+            right -= left - other_left
+            left = other_left
 
-        if clone.top < other.top:
-            clone.bottom -= clone.top - other.top
-            clone.top = other.top
+        if top < other_top:
+            bottom -= top - other_top
+            top = other_top
 
-        if clone.right > other.right:
-            clone.left -= clone.right - other.right
-            clone.right = other.right
+        if right > other_right:
+            left -= right - other_right
+            right = other_right
 
-        if clone.bottom > other.bottom:
-            clone.top -= clone.bottom - other.bottom
-            clone.bottom = other.bottom
+        if bottom > other_bottom:
+            top -= bottom - other_bottom
+            bottom = other_bottom
 
-        return clone
+        return type(self)(left, top, right, bottom)
 
     def move_to_cover(self, other):
         """
         Moves this rect so it completely covers the rect specified in the
         "other" parameter and returns a new Rect instance.
         """
-        other = Rect(*other)
-        clone = self.clone()
+        other_left, other_top, other_right, other_bottom = other
+        left, top, right, bottom = self.left, self.top, self.right, self.bottom
 
-        if clone.left > other.left:
-            clone.right -= clone.left - other.left
-            clone.left = other.left
+        if left > other_left:
+            right -= left - other_left
+            left = other_left
 
-        if clone.top > other.top:
-            clone.bottom -= clone.top - other.top
-            clone.top = other.top
+        if top > other_top:
+            bottom -= top - other_top
+            top = other_top
 
-        if clone.right < other.right:
-            clone.left += other.right - clone.right
-            clone.right = other.right
+        if right < other_right:
+            left += other_right - right
+            right = other_right
 
-        if clone.bottom < other.bottom:
-            clone.top += other.bottom - clone.bottom
-            clone.bottom = other.bottom
+        if bottom < other_bottom:
+            top += other_bottom - bottom
+            bottom = other_bottom
 
-        return clone
+        return type(self)(left, top, right, bottom)
 
     def __iter__(self):
         return iter((self.left, self.top, self.right, self.bottom))
 
     def __getitem__(self, key):
-        return (self.left, self.top, self.right, self.bottom)[key]
+        if isinstance(key, slice):
+            return (self.left, self.top, self.right, self.bottom)[key]
+
+        # raises IndexError out of range, the same as a tuple
+        return getattr(self, RECT_FIELDS[key])
 
     def __eq__(self, other):
         return tuple(self) == tuple(other)
@@ -1,18 +1,80 @@
 
+from images.conf import get_setting
 from images.exceptions import SourceImageIOError
+from images.filter import get_filter
 from images.models import Rendition
 
 
+def get_placeholder_rendition(image, filter):
+    """ Queues the rendition to be generated by a worker and returns a placeholder of the original file """
+    image.enqueue_rendition(filter)
+
+    width, height = filter.predict_size(image)
+    rendition = Rendition(image=image, filter_spec=filter.spec, width=width, height=height)
+    rendition.file.name = image.file.name
+    return rendition
+
+
+def get_not_found_rendition(image):
+    """ A dummy rendition that outputs a broken image """
+    rendition = Rendition(image=image, width=0, height=0)
+    rendition.file.name = 'not-found'
+    return rendition
+
+
+def get_rendition_or_placeholder(image, specs):
+    """
+    Gets the rendition for the image if it exists, otherwise queues it to be generated by a worker
+    and returns a placeholder rendition of the original file with the rendition's dimensions.
+    """
+    filter = get_filter(specs) if isinstance(specs, str) else specs
+
+    rendition = image.find_rendition(filter)
+
+    if rendition is None:
+        rendition = get_placeholder_rendition(image, filter)
+
+    return rendition
+
+
+def get_renditions_or_placeholders(image, specs):
+    """ The same as get_rendition_or_placeholder for many specs, finding the existing renditions in one query """
+    filters = [get_filter(spec) if isinstance(spec, str) else spec for spec in specs]
+
+    renditions = image.find_renditions(filters)
+
+    return [
+        rendition if rendition is not None else get_placeholder_rendition(image, filter)
+        for filter, rendition in zip(filters, renditions)
+    ]
+
+
 def get_rendition_or_not_found(image, specs):
     """
     Tries to get / create the rendition for the image or renders a not-found image if it does not exist.
+    When ``ASYNC_RENDITIONS`` is set missing renditions are queued and a placeholder is returned instead.
     """
     try:
+        if get_setting('ASYNC_RENDITIONS'):
+            return get_rendition_or_placeholder(image, specs)
+
         return image.get_rendition(specs)
     except SourceImageIOError:
         # Image file is (probably) missing from /media/images - generate a dummy
         # rendition so that we just output a broken image, rather than crashing out completely
         # during rendering.
-        rendition = Rendition(image=image, width=0, height=0)
-        rendition.file.name = 'not-found'
-        return rendition
+        return get_not_found_rendition(image)
+
+
+def get_renditions_or_not_found(image, specs):
+    """
+    The same as get_rendition_or_not_found for many specs. The existing renditions are found in one query
+    and any that are missing are generated from a single read of the original.
+    """
+    try:
+        if get_setting('ASYNC_RENDITIONS'):
+            return get_renditions_or_placeholders(image, specs)
+
+        return image.generate_renditions(specs)
+    except SourceImageIOError:
+        return [get_not_found_rendition(image) for spec in specs]
@@ -1,6 +1,8 @@
 from django.db import transaction
 from django.db.models.signals import post_delete, post_save
 
+from images.cache import (
+    get_rendition_cache, get_rendition_cache_key, get_rendition_url_cache, get_rendition_url_cache_key)
 from images.models import Image, Rendition
 from images.utils import create_default_image_renditions
 
@@ -10,12 +12,39 @@ def create_image_renditions(instance, **kwargs):
     create_default_image_renditions(instance)
 
 
+def is_file_shared(instance):
+    """
+    Returns True if another row of the instance's model uses the same stored file.
+    Checked whatever the settings, as rows may have come to share files while they were turned on.
+    """
+    return type(instance)._default_manager.filter(file=instance.file.name).exists()
+
+
 def delete_image_cleanup(instance, **kwargs):
-    """ Cleanup deleted images from disk """
-    transaction.on_commit(lambda: instance.file.delete(False))
+    """ Cleanup deleted images from disk, leaving files shared by duplicate uploads or content addressed renditions """
+    def delete_file():
+        if not is_file_shared(instance):
+            instance.file.delete(False)
+
+    transaction.on_commit(delete_file)
+
+
+def invalidate_rendition_cache(instance, **kwargs):
+    """ Remove a saved or deleted rendition and the url of its file from the rendition caches """
+    rendition_cache = get_rendition_cache()
+    if rendition_cache is not None:
+        rendition_cache.delete(
+            get_rendition_cache_key(instance.image_id, instance.filter_spec, instance.focal_point_key)
+        )
+
+    url_cache = get_rendition_url_cache()
+    if url_cache is not None and instance.file:
+        url_cache.delete(get_rendition_url_cache_key(instance.file.name))
 
 
 def register_signals():
     post_save.connect(create_image_renditions, sender=Image)
     post_delete.connect(delete_image_cleanup, sender=Image)
     post_delete.connect(delete_image_cleanup, sender=Rendition)
+    post_save.connect(invalidate_rendition_cache, sender=Rendition)
+    post_delete.connect(invalidate_rendition_cache, sender=Rendition)
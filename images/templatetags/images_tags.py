@@ -1,14 +1,45 @@
+import logging
 import re
 
 from django import template
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.forms.utils import flatatt
 from django.utils.functional import cached_property
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 
-from images.filter import Filter
-from images.shortcuts import get_rendition_or_not_found
+from images import metrics
+from images.filter import get_filter, resolve_auto_format
+from images.operations import FormatOperation
+from images.shortcuts import get_rendition_or_not_found, get_renditions_or_not_found
+from images.views import generate_image_url
+
+logger = logging.getLogger(__name__)
 
 register = template.Library()
 allowed_filter_pattern = re.compile("^[A-Za-z0-9_\-\.]+$")
 
+VARY_ON_ACCEPT_MIDDLEWARE = 'images.middleware.VaryOnAcceptMiddleware'
+
+# whether the missing middleware has been warned about, so the warning is logged once per process
+_warned_vary_on_accept = False
+
+
+def vary_on_accept(request):
+    """ Marks the response to the request as negotiated from its Accept header, for the VaryOnAcceptMiddleware """
+    global _warned_vary_on_accept
+
+    request.images_vary_on_accept = True
+
+    if VARY_ON_ACCEPT_MIDDLEWARE not in settings.MIDDLEWARE and not _warned_vary_on_accept:
+        _warned_vary_on_accept = True
+        logger.warning(
+            'format-auto in an image tag picks the format from the Accept header, add {} to MIDDLEWARE so the '
+            'page is sent with Vary: Accept and is not cached for browsers that cannot show it.'.format(
+                VARY_ON_ACCEPT_MIDDLEWARE)
+        )
+
 
 @register.tag(name="image")
 def image(parser, token):
@@ -84,7 +115,7 @@ class ImageNode(template.Node):
 
     @cached_property
     def filter(self):
-        return Filter(spec=self.filter_spec)
+        return get_filter(self.filter_spec)
 
     def render(self, context):
         try:
@@ -95,7 +126,24 @@ class ImageNode(template.Node):
         if not image:
             return ''
 
-        rendition = get_rendition_or_not_found(image, self.filter)
+        filter = self.filter
+        if 'format-auto' in self.filter_spec:
+            # negotiate the format from the request being rendered
+            request = context.get('request')
+            accept = ''
+            if request is not None:
+                accept = request.META.get('HTTP_ACCEPT', '')
+                vary_on_accept(request)
+
+            filter = get_filter(resolve_auto_format(self.filter_spec, accept))
+
+        if metrics.get_metrics() is None:
+            rendition = get_rendition_or_not_found(image, filter)
+        else:
+            query_counter = metrics.QueryCounter()
+            with connections[image._state.db or DEFAULT_DB_ALIAS].execute_wrapper(query_counter):
+                rendition = get_rendition_or_not_found(image, filter)
+            metrics.observe('template.image.queries', query_counter.count)
 
         if self.output_var_name:
             # return the rendition object in the given variable
@@ -107,3 +155,142 @@ class ImageNode(template.Node):
             for key in self.attrs:
                 resolved_attrs[key] = self.attrs[key].resolve(context)
             return rendition.img_tag(resolved_attrs)
+
+
+@register.simple_tag()
+def image_url(image, filter_spec, viewname='images:serve'):
+    """
+    The signed url of the view serving the image's rendition, eg {% image_url page.image 'width-400' %}.
+    Renders without touching the database, the rendition is generated by the first request for it.
+    """
+    if not image:
+        return ''
+
+    return generate_image_url(image, filter_spec, viewname=viewname)
+
+
+def parse_comma_list(value):
+    return [part.strip() for part in str(value).split(',') if part.strip()]
+
+
+def parse_widths(tag_name, widths):
+    widths = parse_comma_list(widths)
+
+    if not widths:
+        raise template.TemplateSyntaxError("'{}' tag needs at least one width, eg widths=\"320,640\"".format(tag_name))
+
+    for width in widths:
+        if not width.isdigit() or not int(width):
+            raise template.TemplateSyntaxError(
+                "'{}' tag widths must be whole numbers of pixels (given width: {})".format(tag_name, width))
+
+    return [int(width) for width in widths]
+
+
+def parse_formats(tag_name, formats):
+    """ the output formats, checked before any rendition is generated as they would only fail once one was saved """
+    formats = parse_comma_list(formats)
+
+    for output_format in formats:
+        # auto has no content type to give a <source>
+        is_valid = output_format != 'auto'
+
+        if is_valid:
+            try:
+                FormatOperation('format', output_format)
+            except ValueError:
+                is_valid = False
+
+        if not is_valid:
+            raise template.TemplateSyntaxError(
+                "'{}' tag formats must be ones the image can be saved as, such as png, jpeg or webp "
+                "(given format: {})".format(tag_name, output_format))
+
+    return formats
+
+
+def get_width_specs(widths, filter_spec=None, output_format=None):
+    """ the filter specs of a rendition at each width, after any filter_spec and in any output format """
+    specs = []
+
+    for width in widths:
+        spec = 'width-{}'.format(width)
+        if filter_spec:
+            spec = '{}|{}'.format(filter_spec, spec)
+        if output_format:
+            spec = '{}|format-{}'.format(spec, output_format)
+        specs.append(spec)
+
+    return specs
+
+
+def get_srcset(renditions):
+    """ the srcset of the renditions, leaving out widths the image is too small to give more than once """
+    candidates = []
+    seen = set()
+
+    for rendition in renditions:
+        if rendition.width not in seen:
+            seen.add(rendition.width)
+            candidates.append('{} {}w'.format(rendition.url, rendition.width))
+
+    return ', '.join(candidates)
+
+
+@register.simple_tag()
+def image_srcset(image, widths, filter_spec=None, **attrs):
+    """
+    An <img> tag with a srcset of the image at each of the widths, eg
+    {% image_srcset page.image widths="320,640,1280" sizes="(min-width: 800px) 50vw, 100vw" class="photo" %}
+    The renditions are found in one query and any missing are generated from a single read of the original.
+    filter_spec is run before the widths, eg filter_spec="fill-1600x900".
+    """
+    if not image:
+        return ''
+
+    renditions = get_renditions_or_not_found(image, get_width_specs(parse_widths('image_srcset', widths), filter_spec))
+
+    # the largest is the fallback for browsers without srcset
+    img_attrs = renditions[-1].attrs_dict.copy()
+    img_attrs['srcset'] = get_srcset(renditions)
+    img_attrs.update(attrs)
+
+    return mark_safe('<img{}>'.format(flatatt(img_attrs)))
+
+
+@register.simple_tag()
+def picture(image, widths, formats='', filter_spec=None, **attrs):
+    """
+    A <picture> with a <source> of the image at each of the widths in each of the formats, eg
+    {% picture page.image widths="320,640" formats="png,jpeg" sizes="50vw" class="photo" %}
+    The last format is used for the <img>, which is the image's own format if no formats are given.
+    All of the renditions are found in one query and any missing are generated from a single read of the original.
+    """
+    if not image:
+        return ''
+
+    widths = parse_widths('picture', widths)
+    formats = parse_formats('picture', formats) or [None]
+
+    specs = []
+    for output_format in formats:
+        specs += get_width_specs(widths, filter_spec, output_format)
+
+    renditions = get_renditions_or_not_found(image, specs)
+
+    sources = []
+    for i, output_format in enumerate(formats[:-1]):
+        source_attrs = {
+            'type': FormatOperation.mime_types[output_format],
+            'srcset': get_srcset(renditions[i * len(widths):(i + 1) * len(widths)]),
+        }
+        if 'sizes' in attrs:
+            source_attrs['sizes'] = attrs['sizes']
+        sources.append(format_html('<source{}>', flatatt(source_attrs)))
+
+    img_renditions = renditions[-len(widths):]
+    img_attrs = img_renditions[-1].attrs_dict.copy()
+    img_attrs['srcset'] = get_srcset(img_renditions)
+    img_attrs.update(attrs)
+
+    return format_html('<picture>{}<img{}></picture>', mark_safe(''.join(sources)), flatatt(img_attrs))
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from images import views
+
+app_name = 'images'
+
+urlpatterns = [
+    path('<str:signature>/<int:image_id>/<str:version>/<str:filter_spec>/', views.serve, name='serve'),
+]
@@ -1,5 +1,9 @@
+import base64
+import hashlib
 import logging
 
+from django.utils.crypto import constant_time_compare, salted_hmac
+
 from images.conf import get_setting
 from images.exceptions import SourceImageIOError
 
@@ -7,22 +11,70 @@ from images.exceptions import SourceImageIOError
 logger = logging.getLogger(__name__)
 
 
+def get_default_filter_specs():
+    """ the filter specs of the renditions every image should have """
+    filter_specs = list(get_setting('DEFAULT_FILTER_SPECS'))
+
+    # the thumbnail rendition
+    thumbnail_spec = get_setting('THUMBNAIL_FILTER_SPEC')
+    if thumbnail_spec:
+        filter_specs.append(thumbnail_spec)
+
+    return filter_specs
+
+
+def get_file_hash(file):
+    """ the SHA-256 hex digest of a file's content, read in chunks so large uploads are never held in memory """
+    sha256 = hashlib.sha256()
+
+    for chunk in file.chunks():
+        sha256.update(chunk)
+
+    file.seek(0)
+    return sha256.hexdigest()
+
+
 def create_default_image_renditions(instance):
     """ create default renditions for an image instance """
+    changed_fields = instance.get_changed_fields()
+
+    if changed_fields is not None and not changed_fields:
+        # nothing the renditions are made from has changed
+        return
 
     # if required delete all the renditions on save
     if get_setting('CLEAR_RENDITIONS_ON_SAVE'):
-        instance.renditions.all().delete()
+        if changed_fields is not None and 'file' not in changed_fields:
+            # only the focal point moved, renditions not made from it are unchanged
+            instance.renditions.exclude(focal_point_key='').delete()
+        else:
+            instance.renditions.all().delete()
 
-    try:
-        # create a rendition for each of the defaults
-        for filter_spec in get_setting('DEFAULT_FILTER_SPECS'):
-            instance.get_rendition(filter_spec)
+        # forget any renditions fetched by prefetch_renditions as they are now gone
+        if hasattr(instance, '_prefetched_renditions'):
+            del instance._prefetched_renditions
+
+    # an upload sharing the file of an existing image takes copies of its renditions
+    source = instance.__dict__.pop('_shared_file_source', None)
+    if source is not None:
+        instance.copy_renditions(source)
 
-        # create the thumbnail rendition
-        thumbnail_spec = get_setting('THUMBNAIL_FILTER_SPEC')
-        if thumbnail_spec:
-            instance.get_rendition(thumbnail_spec)
+    # renditions the workers gave up on are worth trying again with a new file, a new focal point gets jobs of its own
+    if changed_fields is not None and 'file' in changed_fields:
+        from images.queue import requeue_failed_jobs
+        requeue_failed_jobs(instance.rendition_jobs.all())
+
+    filter_specs = get_default_filter_specs()
+
+    # leave them to a worker rather than blocking the save
+    if get_setting('ASYNC_DEFAULT_RENDITIONS'):
+        for filter_spec in filter_specs:
+            instance.enqueue_rendition(filter_spec)
+        return
+
+    try:
+        # create a rendition for each of the defaults from a single read of the original
+        instance.generate_renditions(filter_specs)
 
     except SourceImageIOError:
         logger.error('Source image missing {}'.format(instance))
@@ -48,3 +100,23 @@ def parse_color_string(color_string):
         ValueError('Color string must be either 3 or 6 hexadecimal digits long')
 
     return r, g, b
+
+
+def get_rendition_version(image, filter):
+    """
+    the version of a rendition in its url, which changes with the image's file and the focal point
+    the filter varies with, so a cached response is never served for a changed image
+    """
+    value = '{}/{}/{}'.format(image.file.name, image.file_hash, filter.get_cache_key(image))
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:8]
+
+
+def generate_signature(image_id, filter_spec, version=''):
+    """ the signature of a rendition url, made with the ``SECRET_KEY`` so urls cannot be made up """
+    value = '{}/{}/{}/'.format(image_id, version, filter_spec)
+    digest = salted_hmac('images.views.serve', value).digest()
+    return base64.urlsafe_b64encode(digest).decode('ascii').rstrip('=')
+
+
+def verify_signature(signature, image_id, filter_spec, version=''):
+    return constant_time_compare(signature, generate_signature(image_id, filter_spec, version))
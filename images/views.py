@@ -0,0 +1,85 @@
+import hashlib
+import mimetypes
+import os
+
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_safe
+
+from images.conf import get_setting
+from images.exceptions import InvalidFilterSpecError, SourceImageIOError
+from images.filter import get_filter, has_auto_format, resolve_auto_format
+from images.models import Image
+from images.operations import FormatOperation
+from images.utils import generate_signature, get_rendition_version, verify_signature
+
+
+def generate_image_url(image, filter_spec, viewname='images:serve'):
+    """ Returns the signed url of the serve view for a rendition, without touching the database """
+    filter = get_filter(filter_spec)
+    version = get_rendition_version(image, filter)
+
+    # format-auto is left out of the canonical spec, the view still has to negotiate the format
+    url_spec = filter.spec
+    if has_auto_format(filter_spec):
+        url_spec = 'format-auto' if url_spec == 'original' else '{}|format-auto'.format(url_spec)
+
+    signature = generate_signature(image.pk, url_spec, version)
+    return reverse(viewname, args=(signature, image.pk, version, url_spec))
+
+
+def get_content_type(file_name):
+    extension = os.path.splitext(file_name)[1].lower()
+
+    for output_format, format_extension in FormatOperation.extensions.items():
+        if extension == format_extension:
+            return FormatOperation.mime_types[output_format]
+
+    return mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+
+
+@require_safe
+def serve(request, signature, image_id, version, filter_spec):
+    """ Serves a rendition, generating it if it does not exist yet """
+    if not verify_signature(signature, image_id, filter_spec, version):
+        raise PermissionDenied
+
+    image = get_object_or_404(Image, pk=image_id)
+
+    try:
+        filter = get_filter(filter_spec)
+    except InvalidFilterSpecError:
+        raise Http404('Invalid filter spec')
+
+    # responses are cached publicly, an url made before the image changed must not serve the new rendition
+    if version != get_rendition_version(image, filter):
+        raise Http404('Image has changed')
+
+    # each format negotiated from format-auto is stored as its own rendition
+    resolved_filter_spec = resolve_auto_format(filter_spec, request.META.get('HTTP_ACCEPT', ''))
+
+    try:
+        rendition = image.get_rendition(resolved_filter_spec)
+    except InvalidFilterSpecError:
+        raise Http404('Invalid filter spec')
+    except SourceImageIOError:
+        return HttpResponse('Source image file not found', content_type='text/plain', status=410)
+
+    # the file name changes whenever the rendition is generated again
+    etag = '"{}"'.format(hashlib.sha1(rendition.file.name.encode('utf-8')).hexdigest())
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        content_type = get_content_type(rendition.file.name)
+        response = FileResponse(rendition.file.open('rb'), content_type=content_type)
+
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=get_setting('SERVE_CACHE_MAX_AGE'))
+
+    if resolved_filter_spec != filter_spec:
+        patch_vary_headers(response, ['Accept'])
+
+    return response
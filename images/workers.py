@@ -0,0 +1,96 @@
+"""
+Functions run in worker processes by the management commands.
+
+Models are imported inside the functions as pool processes started with the spawn or
+forkserver methods have to set up django before any models can be imported.
+"""
+import logging
+import multiprocessing
+from contextlib import contextmanager
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def init_worker():
+    """ Prepares a pool process to use the django project """
+    import django
+    django.setup()
+
+
+@contextmanager
+def map_in_workers(func, args, workers):
+    """
+    Yields an iterator of func called with each of args, in order, run in a pool of worker processes when there is
+    more than one worker and in this process otherwise. The pool is stopped when the block exits.
+    args should be a list, a pool reads any other iterable from a thread of its own.
+    """
+    if workers < 2:
+        yield map(func, args)
+        return
+
+    # child processes must open their own database connections
+    connections.close_all()
+    pool = multiprocessing.Pool(workers, initializer=init_worker)
+
+    try:
+        yield pool.imap(func, args)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def regenerate_image_renditions(image, filter_specs=None, clear=True):
+    """
+    Regenerates the renditions of an image and returns the renditions that were created.
+    Without filter_specs the default renditions are created the same way as saving the image does,
+    otherwise the renditions for the given specs are deleted and created again.
+    With clear False no existing renditions are deleted, only missing ones are created.
+    """
+    from images.conf import get_setting
+    from images.filter import get_filter
+    from images.utils import get_default_filter_specs
+
+    if filter_specs:
+        filters = [get_filter(filter_spec) for filter_spec in filter_specs]
+
+        if clear:
+            image.renditions.filter(filter_spec__in=[filter.spec for filter in filters]).delete()
+
+    else:
+        filters = [get_filter(filter_spec) for filter_spec in get_default_filter_specs()]
+
+        if clear and get_setting('CLEAR_RENDITIONS_ON_SAVE'):
+            image.renditions.all().delete()
+
+    existing = set(image.renditions.values_list('pk', flat=True))
+    renditions = image.generate_renditions(filters)
+
+    return [rendition for rendition in renditions if rendition.pk not in existing]
+
+
+def regenerate_batch(pks, filter_specs=None, clear=True):
+    """
+    Regenerates the renditions of a batch of images, see regenerate_image_renditions.
+    Returns a tuple of the number of images done, the bytes written and the number of failures.
+    Renditions that share a file already stored add no bytes.
+    """
+    from images.models import Image
+
+    done = 0
+    bytes_written = 0
+    failures = 0
+
+    for image in Image.objects.filter(pk__in=pks).order_by('pk'):
+        try:
+            renditions = regenerate_image_renditions(image, filter_specs, clear)
+            # the size of the generated file, asking the storage would cost a call for each rendition
+            bytes_written += sum(getattr(rendition, '_bytes_written', 0) for rendition in renditions)
+        except Exception:
+            logger.exception('Failed to regenerate renditions for {}'.format(image))
+            failures += 1
+        else:
+            done += 1
+
+    return done, bytes_written, failures
@@ -1,6 +1,8 @@
+import struct
 from io import BytesIO
 
 import PIL.Image
+import PIL.ImageDraw
 from django.core.files.images import ImageFile
 
 from images.models import Image
@@ -11,3 +13,24 @@ def get_temporary_image(filename='image.png', colour='white', size=(400, 200)):
     image = PIL.Image.new('RGBA', size, colour)
     image.save(f, 'PNG')
     return ImageFile(f, name=filename)
+
+
+def get_temporary_animation(filename='image.gif', frames=5, size=(400, 200), duration=100):
+    f = BytesIO()
+    images = [PIL.Image.new('RGB', size, (i * 40 % 256, 0, 255 - i * 40 % 256)) for i in range(frames)]
+    images[0].save(f, 'GIF', save_all=True, append_images=images[1:], duration=duration, loop=0)
+    return ImageFile(f, name=filename)
+
+
+def get_temporary_jpeg(filename='image.jpg', size=(200, 100), orientation=None):
+    f = BytesIO()
+    image = PIL.Image.new('RGB', size, 'white')
+    PIL.ImageDraw.Draw(image).ellipse((0, 0) + size, fill='red')
+
+    kwargs = {}
+    if orientation is not None:
+        # a little endian tiff header with an ifd holding just the orientation tag
+        kwargs['exif'] = b'Exif\x00\x00II*\x00' + struct.pack('<IHHHIHHI', 8, 1, 0x0112, 3, 1, orientation, 0, 0)
+
+    image.save(f, 'JPEG', **kwargs)
+    return ImageFile(f, name=filename)
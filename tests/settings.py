@@ -12,6 +12,8 @@ INSTALLED_APPS = [
     'tests',
 ]
 
+ROOT_URLCONF = 'tests.urls'
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -20,6 +22,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'images.middleware.VaryOnAcceptMiddleware',
 ]
 
 DATABASES = {
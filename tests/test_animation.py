@@ -0,0 +1,146 @@
+from io import BytesIO
+
+import PIL.Image
+from django.test import TestCase, override_settings
+from mock import patch
+
+from images.animation import Animation, count_gif_frames, quantize_frame
+from images.filter import Filter
+from images.models import Image
+from tests.data import get_temporary_animation, get_temporary_image
+
+
+class TestCountGifFrames(TestCase):
+    def test_counts_frames(self):
+        self.assertEqual(count_gif_frames(get_temporary_animation(frames=7)), 7)
+
+    def test_stops_past_limit(self):
+        self.assertEqual(count_gif_frames(get_temporary_animation(frames=7), limit=3), 4)
+
+    def test_still(self):
+        f = BytesIO()
+        PIL.Image.new('RGB', (10, 10)).save(f, 'GIF')
+        self.assertEqual(count_gif_frames(f), 1)
+
+    def test_not_a_gif(self):
+        self.assertEqual(count_gif_frames(get_temporary_image()), 0)
+
+
+class TestQuantizeFrame(TestCase):
+    def test_opaque(self):
+        frame = quantize_frame(PIL.Image.new('RGBA', (10, 10), (255, 0, 0, 255)))
+
+        self.assertEqual(frame.mode, 'P')
+        self.assertNotIn('transparency', frame.info)
+        self.assertEqual(frame.convert('RGB').getpixel((0, 0)), (255, 0, 0))
+
+    def test_transparent(self):
+        pil_image = PIL.Image.new('RGBA', (10, 10), (255, 0, 0, 255))
+        pil_image.paste((0, 0, 0, 0), (0, 0, 5, 10))
+
+        frame = quantize_frame(pil_image).convert('RGBA')
+
+        self.assertEqual(frame.getpixel((0, 0))[3], 0)
+        self.assertEqual(frame.getpixel((7, 0)), (255, 0, 0, 255))
+
+
+@override_settings(IMAGES_ANIMATED_RENDITIONS=True)
+class TestAnimatedRenditions(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(title='Test image', file=get_temporary_animation())
+
+    def open_output(self, output):
+        output.seek(0)
+        return PIL.Image.open(output)
+
+    def test_frames_are_resized(self):
+        output = BytesIO()
+        out = Filter('width-200').run(self.image, output)
+
+        self.assertEqual(out.format_name, 'gif')
+        pil_image = self.open_output(output)
+        self.assertEqual(pil_image.size, (200, 100))
+        self.assertEqual(pil_image.n_frames, 5)
+        self.assertEqual(pil_image.info['duration'], 100)
+        self.assertEqual(pil_image.info['loop'], 0)
+
+        pil_image.seek(4)
+        self.assertEqual(pil_image.convert('RGB').getpixel((100, 50)), (160, 0, 95))
+
+    def test_frames_are_kept_in_a_palette(self):
+        with patch('PIL.Image.Image.save', autospec=True) as save:
+            Filter('width-200').run(self.image, BytesIO())
+
+        frames = [save.call_args[0][0]] + save.call_args[1]['append_images']
+        self.assertEqual([frame.mode for frame in frames], ['P'] * 5)
+
+    def test_frames_are_decoded_one_at_a_time(self):
+        frames = Animation.frames
+
+        def check_frames(animation):
+            for willow, duration in frames(animation):
+                # the original is still on the frame just yielded
+                self.assertEqual(animation.image.tell(), check_frames.count)
+                check_frames.count += 1
+                yield willow, duration
+
+        check_frames.count = 0
+
+        with patch.object(Animation, 'frames', autospec=True, side_effect=check_frames):
+            Filter('width-200').run(self.image, BytesIO())
+
+        self.assertEqual(check_frames.count, 5)
+
+    def test_animated_webp(self):
+        output = BytesIO()
+        out = Filter('width-200|format-webp').run(self.image, output)
+
+        self.assertEqual(out.format_name, 'webp')
+        pil_image = self.open_output(output)
+        self.assertEqual(pil_image.size, (200, 100))
+        self.assertEqual(pil_image.n_frames, 5)
+
+    def test_poster(self):
+        output = BytesIO()
+        out = Filter('width-200|poster').run(self.image, output)
+
+        self.assertEqual(out.format_name, 'png')
+        self.assertEqual(self.open_output(output).size, (200, 100))
+
+    def test_still_format(self):
+        out = Filter('width-200|format-jpeg').run(self.image, BytesIO())
+        self.assertEqual(out.format_name, 'jpeg')
+
+    @override_settings(IMAGES_ANIMATION_MAX_FRAMES=4)
+    def test_over_frame_limit_is_still(self):
+        with patch.object(Animation, 'frames') as frames:
+            out = Filter('width-200').run(self.image, BytesIO())
+
+        self.assertEqual(out.format_name, 'png')
+        frames.assert_not_called()
+
+    @override_settings(IMAGES_ANIMATION_MAX_PIXELS=400 * 200 * 4)
+    def test_over_pixel_limit_is_still(self):
+        out = Filter('width-200').run(self.image, BytesIO())
+        self.assertEqual(out.format_name, 'png')
+
+    @override_settings(IMAGES_ANIMATED_RENDITIONS=False)
+    def test_disabled_is_still(self):
+        out = Filter('width-200').run(self.image, BytesIO())
+        self.assertEqual(out.format_name, 'png')
+
+    def test_generate_renditions(self):
+        animated, poster = self.image.generate_renditions(['width-200', 'width-200|poster'])
+
+        self.assertTrue(animated.file.name.endswith('.gif'))
+        self.assertEqual((animated.width, animated.height), (200, 100))
+        with animated.file.open() as f:
+            self.assertEqual(PIL.Image.open(f).n_frames, 5)
+
+        self.assertTrue(poster.file.name.endswith('.png'))
+        self.assertEqual((poster.width, poster.height), (200, 100))
+
+    @override_settings(IMAGES_CONTENT_ADDRESSED_RENDITIONS=True)
+    def test_content_addressed_name_is_animated_format(self):
+        rendition = self.image.get_rendition('width-200')
+        self.assertTrue(rendition.file.name.endswith('.gif'))
@@ -0,0 +1,208 @@
+from django.core.cache import caches
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase, override_settings
+from mock import patch
+
+from images.cache import (
+    DjangoRenditionCache, LRURenditionCache, get_rendition_cache, get_rendition_url_cache,
+    get_rendition_url_cache_key)
+from images.models import Image
+from tests.data import get_temporary_image
+
+
+LRU_CACHE = {
+    'BACKEND': 'images.cache.LRURenditionCache',
+    'OPTIONS': {'max_size': 100, 'timeout': 60},
+}
+
+
+class TestLRURenditionCache(TestCase):
+    @patch('images.cache._warned_lru_cache', False)
+    def test_warns_once_it_is_not_shared(self):
+        with patch('images.cache.logger') as logger:
+            LRURenditionCache()
+            LRURenditionCache()
+
+        self.assertEqual(logger.warning.call_count, 1)
+
+    def test_get_set_delete(self):
+        cache = LRURenditionCache()
+        key = (1, 'width-100', '')
+
+        self.assertIsNone(cache.get(key))
+
+        cache.set(key, (1, 'a.png', 100, 50))
+        self.assertEqual(cache.get(key), (1, 'a.png', 100, 50))
+
+        cache.delete(key)
+        self.assertIsNone(cache.get(key))
+
+    def test_evicts_least_recently_used(self):
+        cache = LRURenditionCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        # touch a so b becomes the least recently used
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expires(self):
+        cache = LRURenditionCache(timeout=10)
+
+        with patch('images.cache.time.monotonic', return_value=100):
+            cache.set('a', 1)
+
+        with patch('images.cache.time.monotonic', return_value=105):
+            self.assertEqual(cache.get('a'), 1)
+
+        with patch('images.cache.time.monotonic', return_value=111):
+            self.assertIsNone(cache.get('a'))
+
+    def test_clear(self):
+        cache = LRURenditionCache()
+        cache.set('a', 1)
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+
+
+class TestDjangoRenditionCache(TestCase):
+    def setUp(self):
+        self.addCleanup(caches['default'].clear)
+
+    def test_get_set_delete(self):
+        cache = DjangoRenditionCache()
+        key = (1, 'width-100|format-jpeg', 'abcd1234')
+
+        cache.set(key, (1, 'a.jpg', 100, 50))
+        self.assertEqual(cache.get(key), (1, 'a.jpg', 100, 50))
+
+        cache.delete(key)
+        self.assertIsNone(cache.get(key))
+
+    def test_keys_of_any_length(self):
+        cache = DjangoRenditionCache()
+        key = get_rendition_url_cache_key('images_renditions/a.jpg')
+
+        cache.set(key, '/media/images_renditions/a.jpg')
+        self.assertEqual(cache.get(key), '/media/images_renditions/a.jpg')
+        self.assertIsNone(cache.get((1, 'width-100', '')))
+
+    def test_clear_leaves_other_keys(self):
+        cache = DjangoRenditionCache()
+        key = (1, 'width-100', '')
+        caches['default'].set('session', 'kept')
+
+        cache.set(key, (1, 'a.jpg', 100, 50))
+        cache.clear()
+
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(caches['default'].get('session'), 'kept')
+
+        cache.set(key, (1, 'b.jpg', 100, 50))
+        self.assertEqual(cache.get(key), (1, 'b.jpg', 100, 50))
+
+    def test_clear_is_seen_by_other_processes(self):
+        cache = DjangoRenditionCache()
+        other = DjangoRenditionCache()
+        key = (1, 'width-100', '')
+
+        cache.set(key, (1, 'a.jpg', 100, 50))
+        other.clear()
+
+        self.assertIsNone(cache.get(key))
+
+
+@override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+@override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+class TestGetRenditionCache(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(title='Test image', file=get_temporary_image())
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_rendition_cache())
+
+    @override_settings(IMAGES_RENDITION_CACHE=LRU_CACHE)
+    def test_configured_backend(self):
+        cache = get_rendition_cache()
+        self.assertIsInstance(cache, LRURenditionCache)
+        self.assertEqual(cache.max_size, 100)
+        self.assertIs(get_rendition_cache(), cache)
+
+    @override_settings(IMAGES_RENDITION_CACHE=LRU_CACHE)
+    def test_cache_hit_does_not_query(self):
+        rendition = self.image.get_rendition('width-100')
+
+        with self.assertNumQueries(0):
+            cached = self.image.get_rendition('width-100')
+
+        self.assertEqual(cached.pk, rendition.pk)
+        self.assertEqual(cached.file.name, rendition.file.name)
+        self.assertEqual(cached.width, 100)
+        self.assertEqual(cached.height, 50)
+        self.assertEqual(cached.alt, 'Test image')
+
+    @override_settings(IMAGES_RENDITION_CACHE=LRU_CACHE)
+    def test_deleting_rendition_invalidates(self):
+        rendition = self.image.get_rendition('width-100')
+        rendition.delete()
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.image._find_rendition('width-100', ''))
+
+    @override_settings(IMAGES_RENDITION_CACHE=LRU_CACHE)
+    @override_settings(IMAGES_CLEAR_RENDITIONS_ON_SAVE=True)
+    def test_clear_renditions_on_save_invalidates(self):
+        old = self.image.get_rendition('width-100')
+        self.image.file = get_temporary_image(colour='black')
+        self.image.save()
+
+        new = self.image.get_rendition('width-100')
+        self.assertNotEqual(new.pk, old.pk)
+        self.assertTrue(self.image.renditions.filter(pk=new.pk).exists())
+
+
+@override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+@override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+class TestRenditionUrlCache(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(title='Test image', file=get_temporary_image())
+        self.rendition = self.image.get_rendition('width-100')
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_rendition_url_cache())
+
+        with patch.object(FileSystemStorage, 'url', return_value='/a.png') as url:
+            self.rendition.url
+            self.rendition.url
+
+        self.assertEqual(url.call_count, 2)
+
+    @override_settings(IMAGES_RENDITION_URL_CACHE=LRU_CACHE)
+    def test_url_is_resolved_once(self):
+        with patch.object(FileSystemStorage, 'url', return_value='/a.png') as url:
+            self.assertEqual(self.rendition.url, '/a.png')
+            self.assertEqual(self.image.renditions.get().url, '/a.png')
+
+        self.assertEqual(url.call_count, 1)
+
+    @override_settings(IMAGES_RENDITION_URL_CACHE=LRU_CACHE)
+    def test_saving_rendition_invalidates(self):
+        with patch.object(FileSystemStorage, 'url', return_value='/a.png'):
+            self.rendition.url
+
+        self.rendition.save()
+
+        with patch.object(FileSystemStorage, 'url', return_value='/b.png'):
+            self.assertEqual(self.rendition.url, '/b.png')
+
+    @override_settings(IMAGES_RENDITION_URL_CACHE=LRU_CACHE)
+    def test_new_file_is_not_given_the_old_url(self):
+        old_url = self.rendition.url
+
+        self.rendition.file.name = 'images_renditions/other.png'
+        self.assertNotEqual(self.rendition.url, old_url)
+        self.assertTrue(self.rendition.url.endswith('images_renditions/other.png'))
@@ -0,0 +1,164 @@
+import copy
+import random
+from unittest import skipUnless
+
+from django.test import TestCase
+
+from images import geometry
+from images.filter import Filter
+from images.models import Image
+from images.rect import Rect, Vector
+
+
+class TestVector(TestCase):
+    def test_is_a_tuple(self):
+        vector = Vector(3, 4)
+
+        self.assertEqual((vector.x, vector.y), (3, 4))
+        self.assertEqual(vector[0], 3)
+        self.assertEqual(tuple(vector), (3, 4))
+
+    def test_equals_any_pair(self):
+        self.assertEqual(Vector(3, 4), (3, 4))
+        self.assertEqual(Vector(3, 4), [3, 4])
+        self.assertNotEqual(Vector(3, 4), [4, 3])
+
+    def test_has_no_dict(self):
+        with self.assertRaises(AttributeError):
+            Vector(3, 4).z = 5
+
+    def test_copy(self):
+        self.assertEqual(copy.copy(Vector(3, 4)), Vector(3, 4))
+
+
+class TestRect(TestCase):
+    def test_derived_values(self):
+        rect = Rect(10, 20, 50, 100)
+
+        self.assertEqual(rect.size, (40, 80))
+        self.assertEqual((rect.width, rect.height), (40, 80))
+        self.assertEqual(rect.centroid, (30, 60))
+        self.assertEqual((rect.x, rect.y), (30, 60))
+        self.assertEqual((rect.centroid_x, rect.centroid_y), (30, 60))
+
+    def test_derived_values_follow_edges(self):
+        rect = Rect(10, 20, 50, 100)
+        rect.right = 90
+
+        self.assertEqual(rect.width, 80)
+        self.assertEqual(rect.centroid, (50, 60))
+
+    def test_set_size_and_centroid(self):
+        rect = Rect(10, 20, 50, 100)
+
+        rect.size = (20, 40)
+        self.assertEqual(rect, (20, 40, 40, 80))
+
+        rect.centroid = (100, 100)
+        self.assertEqual(rect, (90, 80, 110, 120))
+
+    def test_round_returns_a_new_rect(self):
+        rect = Rect(10.5, 20.5, 50.5, 100.5)
+
+        self.assertEqual(rect.round(), (10, 20, 51, 101))
+        self.assertEqual(rect, (10.5, 20.5, 50.5, 100.5))
+
+    def test_move_to_clamp(self):
+        self.assertEqual(Rect(-10, -10, 40, 40).move_to_clamp((0, 0, 100, 100)), (0, 0, 50, 50))
+        self.assertEqual(Rect(80, 80, 130, 130).move_to_clamp(Rect(0, 0, 100, 100)), (50, 50, 100, 100))
+
+    def test_move_to_cover(self):
+        self.assertEqual(Rect(0, 0, 50, 50).move_to_cover((60, 60, 80, 80)), (30, 30, 80, 80))
+
+    def test_indexing(self):
+        rect = Rect(10, 20, 50, 100)
+
+        self.assertEqual(rect[0], 10)
+        self.assertEqual(rect[-1], 100)
+        self.assertEqual(list(rect), [10, 20, 50, 100])
+        self.assertEqual(rect.as_tuple(), (10, 20, 50, 100))
+        self.assertEqual(rect[1:3], (20, 50))
+
+        with self.assertRaises(IndexError):
+            rect[4]
+        with self.assertRaises(IndexError):
+            rect[-5]
+
+    def test_indexing_follows_edges(self):
+        rect = Rect(10, 20, 50, 100)
+        rect.top = 30
+
+        self.assertEqual(rect[1], 30)
+
+
+@skipUnless(geometry.numpy is not None, 'numpy is not installed')
+class TestBatchGeometry(TestCase):
+    specs = [
+        'original',
+        'width-400',
+        'height-300',
+        'min-300x300',
+        'max-300x300',
+        'fill-300x200',
+        'fill-300x200-c50',
+        'fill-300x200-c100',
+        'fill-1000x100-c75',
+        'crop',
+        'crop-100x100x200x150',
+        'width-800|fill-200x200-c50',
+        'format-webp|max-150x150',
+    ]
+
+    def get_images(self, count=200):
+        # a mix of sizes and focal points, some of them extending off the image
+        random.seed(1)
+        images = []
+
+        for i in range(count):
+            width = random.randint(1, 2000)
+            height = random.randint(1, 2000)
+            image = Image(width=width, height=height)
+
+            if i % 3:
+                image.focal_point_x = random.randint(0, width)
+                image.focal_point_y = random.randint(0, height)
+                image.focal_point_width = random.randint(1, width + 50)
+                image.focal_point_height = random.randint(1, height + 50)
+
+            images.append(image)
+
+        return images
+
+    def test_predict_sizes_matches_predict_size(self):
+        images = self.get_images()
+        predicted = geometry.predict_sizes(images, self.specs)
+
+        self.assertEqual(list(predicted), self.specs)
+
+        for spec in self.specs:
+            filter = Filter(spec)
+            expected = [list(filter.predict_size(image)) for image in images]
+            self.assertEqual(predicted[spec].tolist(), expected, spec)
+
+    def test_fill_crop_rects_match_get_crop_rect(self):
+        images = self.get_images()
+        sizes, focal_points = geometry.get_image_arrays(images)
+
+        for spec in ['fill-300x200', 'fill-300x200-c50', 'fill-50x400-c100']:
+            operation = Filter(spec).operations[0]
+            expected = [list(operation.get_crop_rect((image.width, image.height), image)) for image in images]
+            self.assertEqual(operation.get_crop_rects(sizes, focal_points).tolist(), expected, spec)
+
+    def test_crop_rects_without_focal_point_are_nan(self):
+        images = [Image(width=100, height=100), Image(
+            width=100, height=100, focal_point_x=50, focal_point_y=50, focal_point_width=20, focal_point_height=20)]
+        sizes, focal_points = geometry.get_image_arrays(images)
+
+        rects = Filter('crop').operations[0].get_crop_rects(sizes, focal_points)
+
+        self.assertEqual(geometry.has_rect(rects).tolist(), [False, True])
+        self.assertEqual(rects[1].tolist(), [40, 40, 60, 60])
+
+    def test_no_images(self):
+        predicted = geometry.predict_sizes([], ['fill-100x100', 'width-100'])
+        self.assertEqual(predicted['fill-100x100'].shape, (0, 2))
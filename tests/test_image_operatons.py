@@ -1,13 +1,20 @@
 from io import BytesIO
+from unittest import skipUnless
 
+import PIL.Image
 from django.test import TestCase, override_settings
 from mock import Mock, patch
+from PIL import ImageChops, ImageStat
 
 from images import operations
 from images.exceptions import InvalidFilterSpecError
-from images.filter import Filter
+from images.filter import (
+    Filter, canonicalize_spec, get_filter, has_auto_format, open_reduced, resolve_auto_format
+)
 from images.models import Image
-from .data import get_temporary_image
+from images.operations.format import has_avif_encoder
+from images.shortcuts import get_renditions_or_not_found
+from .data import get_temporary_image, get_temporary_jpeg
 
 
 class WillowOperationRecorder:
@@ -85,6 +92,12 @@ class ImageOperationTestCase(TestCase):
             # Check
             self.assertEqual(operation_recorder.ran_operations, expected_output)
 
+            # Check the geometry gives the same size without running
+            self.assertEqual(
+                operation.get_output_size((image.width, image.height), image),
+                tuple(operation_recorder.get_size())
+            )
+
         test_run.__name__ = str('test_run_%s' % filter_spec)
         return test_run
 
@@ -448,6 +461,22 @@ class TestCropOperation(ImageOperationTestCase):
 TestCropOperation.setup_test_methods()
 
 
+class TestCropCacheKey(TestCase):
+    def setUp(self):
+        self.image = Image(width=1000, height=1000, focal_point_x=500, focal_point_y=500,
+                           focal_point_width=200, focal_point_height=200)
+
+    def test_focal_point_crop_varies_with_focal_point(self):
+        cache_key = Filter('crop').get_cache_key(self.image)
+        self.assertNotEqual(cache_key, '')
+
+        self.image.focal_point_x = 400
+        self.assertNotEqual(Filter('crop').get_cache_key(self.image), cache_key)
+
+    def test_given_crop_does_not_vary(self):
+        self.assertEqual(Filter('crop-100x100x500x500').get_cache_key(self.image), '')
+
+
 class TestFormatFilter(TestCase):
     def test_jpeg(self):
         fil = Filter(spec='width-400|format-jpeg')
@@ -479,6 +508,41 @@ class TestFormatFilter(TestCase):
 
         self.assertEqual(out.format_name, 'gif')
 
+    def test_webp(self):
+        fil = Filter(spec='width-400|format-webp')
+        image = Image.objects.create(
+            title="Test image",
+            file=get_temporary_image(),
+        )
+        out = fil.run(image, BytesIO())
+
+        self.assertEqual(out.format_name, 'webp')
+
+    @skipUnless(has_avif_encoder(), 'no avif encoder')
+    def test_avif(self):
+        fil = Filter(spec='width-400|format-avif')
+        image = Image.objects.create(
+            title="Test image",
+            file=get_temporary_image(),
+        )
+        out = fil.run(image, BytesIO())
+
+        self.assertEqual(out.format_name, 'avif')
+
+    def test_avif_without_encoder(self):
+        with patch('images.operations.format.has_avif_encoder', return_value=False):
+            self.assertRaises(InvalidFilterSpecError, operations.FormatOperation, 'format', 'avif')
+
+    def test_unresolved_auto_keeps_original_format(self):
+        fil = Filter(spec='width-400|format-auto')
+        image = Image.objects.create(
+            title="Test image",
+            file=get_temporary_image(),
+        )
+        out = fil.run(image, BytesIO())
+
+        self.assertEqual(out.format_name, 'png')
+
     def test_invalid(self):
         fil = Filter(spec='width-400|format-foo')
         image = Image.objects.create(
@@ -488,6 +552,65 @@ class TestFormatFilter(TestCase):
         self.assertRaises(InvalidFilterSpecError, fil.run, image, BytesIO())
 
 
+class TestWebPQualityFilter(TestCase):
+    def test_webp_quality_filter(self):
+        image = Image.objects.create(
+            title="Test image",
+            file=get_temporary_image(),
+        )
+
+        with patch('PIL.Image.Image.save') as save:
+            Filter(spec='width-400|webpquality-40|format-webp').run(image, BytesIO())
+
+        self.assertEqual(save.call_args[1]['quality'], 40)
+
+    @override_settings(IMAGES_WEBP_QUALITY=50)
+    def test_webp_quality_setting(self):
+        image = Image.objects.create(
+            title="Test image",
+            file=get_temporary_image(),
+        )
+
+        with patch('PIL.Image.Image.save') as save:
+            Filter(spec='width-400|format-webp').run(image, BytesIO())
+
+        self.assertEqual(save.call_args[1]['quality'], 50)
+
+    def test_invalid(self):
+        self.assertRaises(InvalidFilterSpecError, operations.WebPQualityOperation, 'webpquality', '101')
+        self.assertRaises(InvalidFilterSpecError, operations.AVIFQualityOperation, 'avifquality', '101')
+
+
+class TestResolveAutoFormat(TestCase):
+    def test_webp(self):
+        self.assertEqual(
+            resolve_auto_format('width-100|format-auto', 'image/webp,image/*;q=0.8'), 'width-100|format-webp')
+
+    @skipUnless(has_avif_encoder(), 'no avif encoder')
+    def test_avif_preferred(self):
+        self.assertEqual(
+            resolve_auto_format('width-100|format-auto', 'image/avif,image/webp,*/*'), 'width-100|format-avif')
+
+    def test_avif_without_encoder(self):
+        with patch('images.filter.has_avif_encoder', return_value=False):
+            self.assertEqual(
+                resolve_auto_format('width-100|format-auto', 'image/avif,image/webp'), 'width-100|format-webp')
+
+    def test_not_accepted(self):
+        self.assertEqual(resolve_auto_format('width-100|format-auto', 'image/png,*/*'), 'width-100')
+        self.assertEqual(resolve_auto_format('width-100|format-auto', 'image/webp;q=0,*/*'), 'width-100')
+        self.assertEqual(resolve_auto_format('format-auto', ''), 'original')
+
+    def test_without_auto(self):
+        self.assertEqual(resolve_auto_format('width-100|format-png', 'image/webp'), 'width-100|format-png')
+
+    def test_has_auto_format(self):
+        self.assertTrue(has_auto_format('width-100|format-auto'))
+        self.assertTrue(has_auto_format('format-png|format-auto|width-100'))
+        self.assertFalse(has_auto_format('format-auto|format-png'))
+        self.assertFalse(has_auto_format('width-100'))
+
+
 class TestJPEGQualityFilter(TestCase):
     def test_default_quality(self):
         fil = Filter(spec='width-400|format-jpeg')
@@ -607,3 +730,178 @@ class TestBackgroundColorFilter(TestCase):
             file=get_temporary_image(),
         )
         self.assertRaises(ValueError, fil.run, image, BytesIO())
+
+
+class TestFilterPredictSize(TestCase):
+    def test_predict_size(self):
+        image = Image(width=1000, height=500)
+
+        self.assertEqual(Filter(spec='original').predict_size(image), (1000, 500))
+        self.assertEqual(Filter(spec='width-400').predict_size(image), (400, 200))
+        self.assertEqual(Filter(spec='height-100|format-jpeg').predict_size(image), (200, 100))
+        self.assertEqual(Filter(spec='max-100x100').predict_size(image), (100, 50))
+        self.assertEqual(Filter(spec='min-100x100').predict_size(image), (200, 100))
+        self.assertEqual(Filter(spec='fill-80x60').predict_size(image), (80, 60))
+        self.assertEqual(Filter(spec='fill-2000x2000').predict_size(image), (500, 500))
+        self.assertEqual(Filter(spec='crop-500x250x100x50').predict_size(image), (100, 50))
+
+    def test_predict_size_with_focal_point(self):
+        image = Image(
+            width=1000,
+            height=1000,
+            focal_point_x=1000,
+            focal_point_y=500,
+            focal_point_width=0,
+            focal_point_height=0,
+        )
+
+        self.assertEqual(Filter(spec='fill-80x60-c100').predict_size(image), (80, 60))
+
+    def test_predict_size_matches_generated_rendition(self):
+        image = Image.objects.create(
+            title="Test image",
+            file=get_temporary_image(size=(539, 720)),
+        )
+
+        for spec in ['width-100', 'max-300x300', 'min-50x70', 'fill-200x200', 'fill-90x50-c50', 'crop-100x100x80x60']:
+            rendition = image.get_rendition(spec)
+            self.assertEqual(Filter(spec=spec).predict_size(image), (rendition.width, rendition.height), spec)
+
+
+class TestReducedDecode(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_temporary_jpeg(size=(2400, 1600)),
+            focal_point_x=1800,
+            focal_point_y=400,
+            focal_point_width=300,
+            focal_point_height=200,
+        )
+        self.image.renditions.all().delete()
+
+    def open_reduced(self, filter_spec):
+        with self.image.get_willow_image() as willow:
+            willow, scale = open_reduced(willow, [Filter(spec=filter_spec)], self.image)
+            return willow.get_size(), scale
+
+    def test_get_decode_scale(self):
+        self.assertEqual(Filter(spec='original').get_decode_scale((2400, 1600), self.image), 1)
+        self.assertEqual(Filter(spec='width-4000').get_decode_scale((2400, 1600), self.image), 1)
+        self.assertEqual(Filter(spec='width-240').get_decode_scale((2400, 1600), self.image), 0.1)
+        self.assertEqual(Filter(spec='crop-1200x800x600x400|width-60').get_decode_scale((2400, 1600), self.image), 0.1)
+
+    def test_jpeg_decoded_at_reduced_size(self):
+        self.assertEqual(self.open_reduced('width-100'), ((300, 200), (0.125, 0.125)))
+        self.assertEqual(self.open_reduced('width-400'), ((1200, 800), (0.5, 0.5)))
+
+    def test_jpeg_decoded_at_full_size(self):
+        self.assertEqual(self.open_reduced('width-1000'), ((2400, 1600), None))
+        self.assertEqual(self.open_reduced('crop-1200x800x600x400'), ((2400, 1600), None))
+
+    def test_png_decoded_at_full_size(self):
+        self.image.file = get_temporary_image(size=(2400, 1600))
+        self.image.save()
+
+        self.assertEqual(self.open_reduced('width-100'), ((2400, 1600), None))
+
+    def test_exif_orientation(self):
+        self.image.file = get_temporary_jpeg(size=(1600, 2400), orientation=6)
+        self.image.save()
+
+        # the stored size is not oriented but the operations are run on the oriented image
+        self.assertEqual(self.open_reduced('height-100'), ((200, 300), (0.125, 0.125)))
+        self.assertEqual(self.image.get_rendition('height-100').width, 150)
+
+    def test_renditions_match_full_size_decode(self):
+        filter_specs = [
+            'width-100', 'max-300x300', 'min-90x70', 'fill-200x100', 'fill-100x100-c100', 'fill-60x90-c50',
+            'crop|width-100', 'crop-1200x800x900x600|width-150', 'width-700|fill-50x50-c100',
+        ]
+
+        reduced = self.image.generate_renditions(filter_specs)
+        self.image.renditions.all().delete()
+
+        with patch('images.models.image.open_reduced', side_effect=lambda willow, filters, image: (willow, None)):
+            full = self.image.generate_renditions(filter_specs)
+
+        for filter_spec, a, b in zip(filter_specs, reduced, full):
+            self.assertEqual((a.width, a.height), (b.width, b.height), filter_spec)
+
+            with a.get_willow_image() as a_willow, b.get_willow_image() as b_willow:
+                difference = ImageChops.difference(a_willow.get_pillow_image(), b_willow.get_pillow_image())
+                self.assertLess(max(ImageStat.Stat(difference).mean), 8, filter_spec)
+
+
+class TestGetFilter(TestCase):
+    def test_shared_between_equivalent_specs(self):
+        filter = get_filter('width-123')
+
+        self.assertIs(get_filter('width-123'), filter)
+        self.assertIsInstance(filter.operations, tuple)
+
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC='width-124')
+    def test_aliases_are_expanded(self):
+        self.assertIs(get_filter('thumbnail'), get_filter('width-124'))
+        self.assertEqual(get_filter('thumbnail').spec, 'width-124')
+
+    def test_invalid_spec_is_not_parsed_again(self):
+        with patch('images.filter.Filter', wraps=Filter) as filter_class:
+            for _ in range(3):
+                with self.assertRaises(InvalidFilterSpecError):
+                    get_filter('nonsense-123')
+
+        self.assertEqual(filter_class.call_count, 1)
+
+    @override_settings(IMAGES_FILTER_CACHE_SIZE=2)
+    def test_bounded(self):
+        filter = get_filter('width-125')
+        get_filter('width-126')
+        get_filter('width-127')
+
+        self.assertIsNot(get_filter('width-125'), filter)
+
+
+class TestCanonicalizeSpec(TestCase):
+    def test_output_operations_are_ordered_last(self):
+        self.assertEqual(canonicalize_spec('format-jpeg|width-100'), 'width-100|format-jpeg')
+        self.assertEqual(canonicalize_spec('width-100|format-jpeg'), 'width-100|format-jpeg')
+        self.assertEqual(canonicalize_spec('jpegquality-60|format-jpeg|width-100'), 'width-100|format-jpeg|jpegquality-60')
+
+    def test_last_output_operation_wins(self):
+        self.assertEqual(canonicalize_spec('format-png|width-100|format-jpeg'), 'width-100|format-jpeg')
+
+    def test_pixel_operations_keep_their_order(self):
+        self.assertEqual(canonicalize_spec('bgcolor-fff|fill-100x100|width-50'), 'bgcolor-fff|fill-100x100|width-50')
+
+    def test_original_is_dropped_when_combined(self):
+        self.assertEqual(canonicalize_spec('original'), 'original')
+        self.assertEqual(canonicalize_spec('original|original'), 'original')
+        self.assertEqual(canonicalize_spec('original|width-100'), 'width-100')
+        self.assertEqual(canonicalize_spec('original|format-png'), 'format-png')
+
+    def test_unresolved_auto_format_is_dropped(self):
+        self.assertEqual(canonicalize_spec('width-100|format-auto'), 'width-100')
+        self.assertEqual(canonicalize_spec('format-png|width-100|format-auto'), 'width-100|format-png')
+        self.assertEqual(canonicalize_spec('format-auto'), 'original')
+
+    def test_unresolved_auto_format_shares_a_rendition(self):
+        image = Image.objects.create(title="Test image", file=get_temporary_image())
+
+        rendition = image.get_rendition('width-100|format-auto')
+
+        self.assertEqual(rendition.filter_spec, 'width-100')
+        self.assertEqual(image.get_rendition('width-100').pk, rendition.pk)
+        self.assertEqual(get_renditions_or_not_found(image, ['width-100|format-auto'])[0].pk, rendition.pk)
+
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC='width-100')
+    def test_aliases_are_expanded(self):
+        self.assertEqual(canonicalize_spec('format-jpeg|thumbnail'), 'width-100|format-jpeg')
+
+    def test_equivalent_specs_share_a_rendition(self):
+        image = Image.objects.create(title="Test image", file=get_temporary_image())
+
+        rendition = image.get_rendition('format-jpeg|width-100')
+
+        self.assertEqual(rendition.filter_spec, 'width-100|format-jpeg')
+        self.assertEqual(image.get_rendition('original|width-100|format-jpeg').pk, rendition.pk)
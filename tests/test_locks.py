@@ -0,0 +1,180 @@
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from mock import patch
+
+from images import locks
+from images.filter import Filter
+from images.locks import CacheLock, FileLock, get_rendition_locks, lock_renditions
+from images.models import Image
+from tests.data import get_temporary_image
+
+
+class TestCacheLock(TestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.addCleanup(self.cache.clear)
+
+    def test_acquire_release(self):
+        lock = CacheLock(self.cache, 'lock', 10)
+        other = CacheLock(self.cache, 'lock', 10)
+
+        self.assertTrue(lock.acquire())
+        self.assertFalse(other.acquire())
+
+        lock.release()
+        self.assertTrue(other.acquire())
+
+    def test_release_leaves_a_lock_taken_by_another(self):
+        lock = CacheLock(self.cache, 'lock', 10)
+        lock.acquire()
+
+        # expired and taken by another
+        self.cache.set('lock', 'another')
+        lock.release()
+
+        self.assertEqual(self.cache.get('lock'), 'another')
+
+
+class TestFileLock(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_acquire_release(self):
+        path = os.path.join(self.dir, 'locks', '1.lock')
+        lock = FileLock(path)
+        other = FileLock(path)
+
+        self.assertTrue(lock.acquire())
+        self.assertFalse(other.acquire())
+
+        lock.release()
+        self.assertTrue(other.acquire())
+        other.release()
+
+    def test_waits_for_release(self):
+        path = os.path.join(self.dir, '1.lock')
+        lock = FileLock(path)
+        lock.acquire()
+
+        timer = threading.Timer(0.1, lock.release)
+        timer.start()
+        self.addCleanup(timer.join)
+
+        other = FileLock(path)
+        self.assertTrue(other.acquire(wait=5))
+        other.release()
+
+
+@override_settings(IMAGES_DEFAULT_FILTER_SPECS=[], IMAGES_THUMBNAIL_FILTER_SPEC=None)
+@override_settings(IMAGES_SINGLE_FLIGHT_RENDITIONS=True)
+class TestLockRenditions(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(title='Test image', file=get_temporary_image())
+        self.lookup = ('width-100', '')
+
+    def test_disabled(self):
+        with override_settings(IMAGES_SINGLE_FLIGHT_RENDITIONS=False):
+            with patch('images.locks.get_rendition_locks') as get_rendition_locks:
+                with lock_renditions(self.image, [self.lookup]) as waited:
+                    self.assertFalse(waited)
+
+        self.assertFalse(get_rendition_locks.called)
+
+    def test_local_storage_uses_file_locks(self):
+        rendition_locks = get_rendition_locks(self.image, [self.lookup, ('width-200', '')])
+        self.assertTrue(all(isinstance(lock, FileLock) for lock in rendition_locks))
+
+    def test_lock_files_are_outside_storage(self):
+        lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_dir)
+
+        with override_settings(IMAGES_RENDITION_LOCK_DIR=lock_dir):
+            lock, = get_rendition_locks(self.image, [self.lookup])
+
+        self.assertTrue(lock.path.startswith(os.path.join(lock_dir, 'images-rendition-locks') + os.sep))
+
+    def test_lock_files_default_to_temporary_directory(self):
+        lock, = get_rendition_locks(self.image, [self.lookup])
+
+        self.assertTrue(lock.path.startswith(tempfile.gettempdir() + os.sep))
+        self.assertFalse(lock.path.startswith(settings.MEDIA_ROOT))
+
+    def test_remote_storage_uses_cache_locks(self):
+        with patch('django.core.files.storage.FileSystemStorage.path', side_effect=NotImplementedError):
+            with patch('images.locks.logger'):
+                rendition_locks = get_rendition_locks(self.image, [self.lookup, ('width-200', '')])
+
+        self.assertEqual(len(rendition_locks), 2)
+        self.assertTrue(all(isinstance(lock, CacheLock) for lock in rendition_locks))
+
+    @patch.object(locks, '_warned_lock_caches', set())
+    def test_local_memory_lock_cache_warns_once(self):
+        with patch('django.core.files.storage.FileSystemStorage.path', side_effect=NotImplementedError):
+            with patch('images.locks.logger') as logger:
+                get_rendition_locks(self.image, [self.lookup])
+                get_rendition_locks(self.image, [self.lookup])
+
+        self.assertEqual(logger.warning.call_count, 1)
+
+    @patch.object(locks, '_warned_lock_caches', set())
+    @override_settings(
+        CACHES={'locks': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        IMAGES_RENDITION_LOCK_CACHE='locks'
+    )
+    def test_shared_lock_cache_does_not_warn(self):
+        with patch('django.core.files.storage.FileSystemStorage.path', side_effect=NotImplementedError):
+            with patch('images.locks.logger') as logger:
+                get_rendition_locks(self.image, [self.lookup])
+
+        self.assertFalse(logger.warning.called)
+
+    def test_not_waited(self):
+        with lock_renditions(self.image, [self.lookup]) as waited:
+            self.assertFalse(waited)
+
+    def test_waits_for_another_worker(self):
+        lock = get_rendition_locks(self.image, [self.lookup])[0]
+        lock.acquire()
+
+        timer = threading.Timer(0.1, lock.release)
+        timer.start()
+        self.addCleanup(timer.join)
+
+        with lock_renditions(self.image, [self.lookup]) as waited:
+            self.assertTrue(waited)
+
+    @override_settings(IMAGES_RENDITION_LOCK_TIMEOUT=0)
+    def test_runs_without_the_lock_after_timeout(self):
+        lock = get_rendition_locks(self.image, [self.lookup])[0]
+        lock.acquire()
+        self.addCleanup(lock.release)
+
+        with lock_renditions(self.image, [self.lookup]) as waited:
+            self.assertTrue(waited)
+
+    def test_rendition_generated_by_another_worker_is_used(self):
+        @contextmanager
+        def generated_elsewhere(image, lookups):
+            # another worker generates the rendition while this one waits
+            with patch('images.models.image.lock_renditions', lock_renditions):
+                Image.objects.get(pk=image.pk).get_rendition('width-100')
+            yield True
+
+        self.assertIsNone(self.image.find_rendition('width-100'))
+
+        with patch('images.models.image.lock_renditions', generated_elsewhere):
+            with patch.object(Filter, 'process', autospec=True, side_effect=Filter.process) as process:
+                rendition = self.image.get_rendition('width-100')
+
+        # only by the other worker
+        self.assertEqual(process.call_count, 1)
+        self.assertEqual(rendition.width, 100)
+        self.assertEqual(self.image.renditions.count(), 1)
@@ -1,10 +1,38 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase, override_settings
+from django.utils import timezone
+from mock import patch
 
-from images.models import Image
+from images.models import Image, Rendition, RenditionJob
 from tests.data import get_temporary_image
 
 
+class InlinePool:
+    """ Runs the work of a process pool in this process """
+
+    def __init__(self, processes, initializer=None):
+        self.processes = processes
+
+    def imap(self, func, iterable):
+        return map(func, iterable)
+
+    def terminate(self):
+        pass
+
+    def join(self):
+        pass
+
+
 class CommandsTestCase(TestCase):
     def setUp(self):
         # Create an image for running tests on
@@ -22,6 +50,357 @@ class CommandsTestCase(TestCase):
 
         args = []
         opts = {}
-        call_command('regenerate_renditions', *args, **opts)
+        call_command('regenerate_renditions', *args, stdout=StringIO(), **opts)
 
         self.assertEqual(self.image.renditions.count(), 3)
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def test_regenerate_renditions_summary(self):
+        Image.objects.create(title="Another image", file=get_temporary_image())
+        Image.objects.create(title="Bad image", file='original_images/missing.png', width=10, height=10)
+
+        stdout = StringIO()
+        call_command('regenerate_renditions', batch_size=2, stdout=stdout)
+        output = stdout.getvalue()
+
+        self.assertIn('2 of 3 Image(s)', output)
+        self.assertIn('3 of 3 Image(s)', output)
+        self.assertIn('Completed 2 Image(s)', output)
+        self.assertIn('1 failure(s)', output)
+
+        bytes_written = sum(rendition.file.size for image in Image.objects.all() for rendition in image.renditions.all())
+        self.assertIn('%s bytes written' % bytes_written, output)
+
+    def test_regenerate_renditions_summary_does_not_ask_storage_for_sizes(self):
+        storage = Rendition._meta.get_field('file').storage
+
+        stdout = StringIO()
+        with patch.object(storage, 'size', side_effect=AssertionError('size asked of the storage')):
+            call_command('regenerate_renditions', stdout=stdout)
+
+        bytes_written = sum(rendition.file.size for rendition in self.image.renditions.all())
+        self.assertIn('Completed 1 Image(s)', stdout.getvalue())
+        self.assertIn('%s bytes written' % bytes_written, stdout.getvalue())
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def test_regenerate_renditions_specs(self):
+        old = self.image.get_rendition('width-100')
+        old_50 = self.image.get_rendition('width-50')
+
+        call_command('regenerate_renditions', specs=['width-50', 'height-20'], stdout=StringIO())
+
+        self.assertTrue(self.image.renditions.filter(filter_spec='height-20').exists())
+        self.assertNotEqual(self.image.renditions.get(filter_spec='width-50').pk, old_50.pk)
+        self.assertEqual(self.image.renditions.get(filter_spec='width-100').pk, old.pk)
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def test_regenerate_renditions_ids(self):
+        other = Image.objects.create(title="Another image", file=get_temporary_image())
+
+        call_command('regenerate_renditions', ids=[str(other.pk)], specs=['width-50'], stdout=StringIO())
+
+        self.assertFalse(self.image.renditions.filter(filter_spec='width-50').exists())
+        self.assertTrue(other.renditions.filter(filter_spec='width-50').exists())
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def test_regenerate_renditions_since(self):
+        Image.objects.filter(pk=self.image.pk).update(created_at=timezone.now() - timedelta(days=10))
+        other = Image.objects.create(title="Another image", file=get_temporary_image())
+
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        call_command('regenerate_renditions', since=since, specs=['width-50'], stdout=StringIO())
+
+        self.assertFalse(self.image.renditions.filter(filter_spec='width-50').exists())
+        self.assertTrue(other.renditions.filter(filter_spec='width-50').exists())
+
+        with self.assertRaises(CommandError):
+            call_command('regenerate_renditions', since='yesterday', stdout=StringIO())
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def test_regenerate_renditions_checkpoint(self):
+        other = Image.objects.create(title="Another image", file=get_temporary_image())
+
+        checkpoint = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+        with open(checkpoint, 'w') as f:
+            json.dump({'last_pk': self.image.pk}, f)
+
+        stdout = StringIO()
+        call_command('regenerate_renditions', checkpoint=checkpoint, specs=['width-50'], stdout=stdout)
+
+        self.assertIn('Resuming after image %s' % self.image.pk, stdout.getvalue())
+        self.assertFalse(self.image.renditions.filter(filter_spec='width-50').exists())
+        self.assertTrue(other.renditions.filter(filter_spec='width-50').exists())
+
+        # removed once the run completes
+        self.assertFalse(os.path.exists(checkpoint))
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def test_regenerate_renditions_workers(self):
+        Image.objects.create(title="Another image", file=get_temporary_image())
+
+        with patch('multiprocessing.Pool', InlinePool):
+            stdout = StringIO()
+            call_command('regenerate_renditions', workers=2, batch_size=1, stdout=stdout)
+
+        self.assertIn('Completed 2 Image(s)', stdout.getvalue())
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def test_regenerate_renditions_workers_batches_are_listed_first(self):
+        Image.objects.create(title="Another image", file=get_temporary_image())
+
+        with patch('multiprocessing.Pool', InlinePool):
+            with patch.object(InlinePool, 'imap', autospec=True,
+                              side_effect=lambda pool, func, iterable: map(func, iterable)) as imap:
+                call_command('regenerate_renditions', workers=2, batch_size=1, stdout=StringIO())
+
+        # the pool never queries the database for the batches itself
+        self.assertIsInstance(imap.call_args[0][2], list)
+        self.assertEqual(len(imap.call_args[0][2]), 2)
+
+    def test_regenerate_renditions_invalid_options(self):
+        with self.assertRaises(CommandError):
+            call_command('regenerate_renditions', workers=0, stdout=StringIO())
+
+        with self.assertRaises(CommandError):
+            call_command('regenerate_renditions', batch_size=0, stdout=StringIO())
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100', 'width-200'])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC='width-50')
+    @override_settings(IMAGES_ASYNC_DEFAULT_RENDITIONS=True)
+    def test_process_rendition_queue(self):
+        self.image.file = get_temporary_image(colour='black')
+        self.image.save()
+        self.assertEqual(self.image.rendition_jobs.count(), 3)
+
+        call_command('process_rendition_queue', stdout=StringIO())
+
+        self.assertEqual(self.image.rendition_jobs.count(), 0)
+        self.assertEqual(self.image.renditions.count(), 3)
+
+    def test_process_rendition_queue_retry_failed(self):
+        job = self.image.enqueue_rendition('width-100')
+        RenditionJob.objects.filter(pk=job.pk).update(attempts=3, error='Failed')
+
+        call_command('process_rendition_queue', stdout=StringIO())
+        self.assertTrue(RenditionJob.objects.filter(pk=job.pk).exists())
+
+        stdout = StringIO()
+        call_command('process_rendition_queue', retry_failed=True, stdout=stdout)
+
+        self.assertIn('Queued 1 failed rendition job(s) again', stdout.getvalue())
+        self.assertFalse(RenditionJob.objects.filter(pk=job.pk).exists())
+
+    def make_duplicates(self):
+        self.image.renditions.all().delete()
+
+        # stored before specs were canonicalized
+        duplicate = self.image.get_rendition('width-100|format-png')
+        Rendition.objects.filter(pk=duplicate.pk).update(filter_spec='format-png|width-100')
+        canonical = self.image.get_rendition('width-100|format-png')
+
+        renamed = self.image.get_rendition('width-60')
+        Rendition.objects.filter(pk=renamed.pk).update(filter_spec='original|width-60')
+
+        return duplicate, canonical, renamed
+
+    def test_dedupe_renditions(self):
+        duplicate, canonical, renamed = self.make_duplicates()
+
+        stdout = StringIO()
+        call_command('dedupe_renditions', stdout=stdout)
+
+        self.assertEqual(
+            sorted(self.image.renditions.values_list('pk', 'filter_spec')),
+            sorted([(canonical.pk, 'width-100|format-png'), (renamed.pk, 'width-60')])
+        )
+        self.assertIn('Removed 1 duplicate Rendition(s) and renamed 1 Rendition(s)', stdout.getvalue())
+
+    def test_dedupe_renditions_dry_run(self):
+        self.make_duplicates()
+
+        stdout = StringIO()
+        call_command('dedupe_renditions', dry_run=True, stdout=stdout)
+
+        self.assertEqual(self.image.renditions.count(), 3)
+        self.assertIn('Would remove 1 duplicate Rendition(s) and would rename 1 Rendition(s)', stdout.getvalue())
+
+    def make_source_dir(self, dir=None):
+        source = tempfile.mkdtemp(dir=dir)
+        self.addCleanup(shutil.rmtree, source)
+
+        for name, size in [('one.png', (400, 200)), ('two.png', (300, 600))]:
+            with open(os.path.join(source, name), 'wb') as f:
+                f.write(get_temporary_image(size=size).file.getvalue())
+
+        with open(os.path.join(source, 'broken.jpg'), 'wb') as f:
+            f.write(b'not an image')
+
+        with open(os.path.join(source, 'notes.txt'), 'w') as f:
+            f.write('not imported')
+
+        return source
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def test_import_images(self):
+        source = self.make_source_dir()
+
+        stdout, stderr = StringIO(), StringIO()
+        with patch.object(Image, 'generate_renditions', autospec=True) as generate_renditions:
+            call_command('import_images', source, stdout=stdout, stderr=stderr)
+
+        images = Image.objects.exclude(pk=self.image.pk).order_by('title')
+        self.assertEqual(
+            [(image.title, image.width, image.height) for image in images],
+            [('one.png', 400, 200), ('two.png', 300, 600)]
+        )
+        self.assertIn('broken.jpg', stderr.getvalue())
+        self.assertIn('Imported 2 Image(s)', stdout.getvalue())
+        self.assertIn('1 failure(s)', stdout.getvalue())
+
+        # renditions are only created by the warmup, not by a save of each image
+        self.assertEqual(generate_renditions.call_count, 2)
+
+        with open(os.path.join(source, 'one.png'), 'rb') as f:
+            self.assertEqual(images[0].file.read(), f.read())
+            f.seek(0)
+            self.assertEqual(images[0].file_hash, hashlib.sha256(f.read()).hexdigest())
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def test_import_images_creates_default_renditions(self):
+        source = self.make_source_dir()
+
+        with patch('multiprocessing.Pool', InlinePool):
+            call_command('import_images', source, workers=2, batch_size=1, stdout=StringIO(), stderr=StringIO())
+
+        for image in Image.objects.exclude(pk=self.image.pk):
+            self.assertEqual(list(image.renditions.values_list('filter_spec', flat=True)), ['width-100'])
+
+    def test_import_images_no_renditions(self):
+        source = self.make_source_dir()
+
+        call_command('import_images', source, renditions=False, stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(Image.objects.count(), 3)
+        self.assertFalse(Rendition.objects.exclude(image=self.image).exists())
+
+    def test_import_images_link(self):
+        source = self.make_source_dir(dir=settings.MEDIA_ROOT)
+
+        call_command('import_images', source, link=True, renditions=False, stdout=StringIO(), stderr=StringIO())
+
+        image = Image.objects.get(title='one.png')
+        self.assertTrue(os.path.samefile(image.file.path, os.path.join(source, 'one.png')))
+
+    def test_import_images_manifest(self):
+        source = self.make_source_dir()
+        manifest = os.path.join(source, 'manifest.csv')
+
+        with open(manifest, 'w') as f:
+            f.write('one.png,The First\n\ntwo.png\n')
+
+        call_command('import_images', manifest, renditions=False, stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(
+            sorted(Image.objects.exclude(pk=self.image.pk).values_list('title', flat=True)),
+            ['The First', 'two.png']
+        )
+
+    def test_import_images_manifest_allowed_extensions(self):
+        source = self.make_source_dir()
+        manifest = os.path.join(source, 'manifest.csv')
+        shutil.copy(os.path.join(source, 'one.png'), os.path.join(source, 'one.tiff'))
+
+        with open(manifest, 'w') as f:
+            f.write('one.tiff\ntwo.png\n')
+
+        stderr = StringIO()
+        call_command('import_images', manifest, renditions=False, stdout=StringIO(), stderr=stderr)
+
+        self.assertEqual(list(Image.objects.exclude(pk=self.image.pk).values_list('title', flat=True)), ['two.png'])
+        self.assertIn('one.tiff', stderr.getvalue())
+
+    @override_settings(IMAGES_DEDUPLICATE_UPLOADS=True)
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def test_import_images_deduplicate_uploads(self):
+        source = self.make_source_dir()
+        shutil.copy(os.path.join(source, 'one.png'), os.path.join(source, 'one-again.png'))
+        with open(os.path.join(source, 'existing.png'), 'wb') as f:
+            self.image.file.open()
+            f.write(self.image.file.read())
+            self.image.file.close()
+
+        rendition = self.image.get_rendition('width-100')
+
+        call_command('import_images', source, batch_size=2, stdout=StringIO(), stderr=StringIO())
+
+        one = Image.objects.get(title='one.png')
+        self.assertEqual(Image.objects.get(title='one-again.png').file.name, one.file.name)
+        self.assertNotEqual(Image.objects.get(title='two.png').file.name, one.file.name)
+
+        # a file matching an image imported before shares its file and renditions
+        existing = Image.objects.get(title='existing.png')
+        self.assertEqual(existing.file.name, self.image.file.name)
+        self.assertEqual(existing.get_rendition('width-100').file.name, rendition.file.name)
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def test_import_images_without_deduplicate_uploads(self):
+        source = self.make_source_dir()
+        shutil.copy(os.path.join(source, 'one.png'), os.path.join(source, 'one-again.png'))
+
+        call_command('import_images', source, renditions=False, stdout=StringIO(), stderr=StringIO())
+
+        self.assertNotEqual(
+            Image.objects.get(title='one-again.png').file.name,
+            Image.objects.get(title='one.png').file.name
+        )
+
+    def test_import_images_invalid_source(self):
+        with self.assertRaises(CommandError):
+            call_command('import_images', '/does/not/exist', stdout=StringIO())
+
+    def make_orphan(self):
+        storage = Rendition._meta.get_field('file').storage
+        return storage.save('images_renditions/orphans/orphan.png', get_temporary_image())
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'])
+    def test_delete_orphaned_renditions(self):
+        self.image.get_rendition('width-100')
+        orphan = self.make_orphan()
+        storage = Rendition._meta.get_field('file').storage
+
+        stdout = StringIO()
+        call_command('delete_orphaned_renditions', min_age=0, stdout=stdout)
+
+        self.assertFalse(storage.exists(orphan))
+        for rendition in Rendition.objects.all():
+            self.assertTrue(storage.exists(rendition.file.name))
+        self.assertIn('Deleted', stdout.getvalue())
+
+    def test_delete_orphaned_renditions_dry_run(self):
+        orphan = self.make_orphan()
+        self.addCleanup(Rendition._meta.get_field('file').storage.delete, orphan)
+
+        stdout = StringIO()
+        call_command('delete_orphaned_renditions', min_age=0, dry_run=True, stdout=stdout)
+
+        self.assertTrue(Rendition._meta.get_field('file').storage.exists(orphan))
+        self.assertIn('Would delete', stdout.getvalue())
+
+    def test_delete_orphaned_renditions_leaves_new_files(self):
+        orphan = self.make_orphan()
+        self.addCleanup(Rendition._meta.get_field('file').storage.delete, orphan)
+
+        call_command('delete_orphaned_renditions', stdout=StringIO())
+
+        self.assertTrue(Rendition._meta.get_field('file').storage.exists(orphan))
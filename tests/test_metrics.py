@@ -0,0 +1,167 @@
+import os
+import shutil
+import tempfile
+
+import PIL.ImageFile
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from mock import patch
+
+from images import metrics
+from images.metrics import PrometheusTextMetrics, StatsDMetrics, get_metrics
+from images.models import Image
+from tests.data import get_temporary_image, get_temporary_jpeg
+
+
+recorded = []
+
+
+def record(kind, name, value, tags):
+    recorded.append((kind, name, value, tags))
+
+
+RECORDING_METRICS = {
+    'BACKEND': 'images.metrics.CallbackMetrics',
+    'OPTIONS': {'callback': 'tests.test_metrics.record'},
+}
+
+
+@override_settings(IMAGES_DEFAULT_FILTER_SPECS=[], IMAGES_THUMBNAIL_FILTER_SPEC=None)
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(title='Test image', file=get_temporary_image())
+        del recorded[:]
+        self.addCleanup(recorded.clear)
+
+    def get_recorded(self, kind, name):
+        return [(value, tags) for recorded_kind, recorded_name, value, tags in recorded
+                if (recorded_kind, recorded_name) == (kind, name)]
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_metrics())
+
+        with metrics.timer('encode') as tags:
+            tags['format'] = 'png'
+
+        self.image.get_rendition('width-100')
+        self.assertEqual(recorded, [])
+
+    @override_settings(IMAGES_METRICS=RECORDING_METRICS)
+    def test_rendition_miss(self):
+        self.image.get_rendition('width-100|format-jpeg')
+
+        self.assertEqual(self.get_recorded('incr', 'rendition.miss'), [(1, None)])
+        self.assertEqual(self.get_recorded('incr', 'rendition.hit'), [(0, None)])
+
+        self.assertEqual(len(self.get_recorded('timing', 'open')), 1)
+        self.assertEqual([tags for value, tags in self.get_recorded('timing', 'decode')], [{'format': 'png'}])
+        self.assertEqual(
+            [tags for value, tags in self.get_recorded('timing', 'operation')],
+            [{'operation': 'width'}, {'operation': 'format'}]
+        )
+        self.assertEqual([tags for value, tags in self.get_recorded('timing', 'encode')], [{'format': 'jpeg'}])
+        self.assertEqual(len(self.get_recorded('timing', 'storage.write')), 1)
+
+        rendition = self.image.get_rendition('width-100|format-jpeg')
+        self.assertEqual(self.get_recorded('incr', 'storage.write.bytes'), [(rendition.file.size, None)])
+
+    @override_settings(IMAGES_METRICS=RECORDING_METRICS)
+    def test_original_is_decoded_in_decode_timer(self):
+        load = PIL.ImageFile.ImageFile.load
+        timed_before_load = []
+        self.image = Image.objects.create(title='Test image', file=get_temporary_jpeg(size=(2000, 1000)))
+
+        def record_load(pil_image):
+            timed_before_load.append([name for kind, name, value, tags in recorded if kind == 'timing'])
+            return load(pil_image)
+
+        with patch.object(PIL.ImageFile.ImageFile, 'load', autospec=True, side_effect=record_load):
+            self.image.get_rendition('width-100')
+
+        # decoded at a reduced size, the pixels are read after the file is opened but before the decode timer stops
+        self.assertEqual(timed_before_load[0], ['open'])
+
+    @override_settings(IMAGES_METRICS=RECORDING_METRICS)
+    def test_rendition_hit(self):
+        self.image.get_rendition('width-100')
+        del recorded[:]
+
+        self.image.get_rendition('width-100')
+
+        self.assertEqual(self.get_recorded('incr', 'rendition.hit'), [(1, None)])
+        self.assertEqual(self.get_recorded('timing', 'encode'), [])
+
+    @override_settings(IMAGES_METRICS=RECORDING_METRICS)
+    def test_image_tag_queries(self):
+        self.image.get_rendition('width-100')
+        del recorded[:]
+
+        Template('{% load images_tags %}{% image image width-100 %}').render(Context({'image': self.image}))
+
+        self.assertEqual(self.get_recorded('observe', 'template.image.queries'), [(1, None)])
+
+
+class TestStatsDMetrics(TestCase):
+    def test_sends_metrics(self):
+        with patch('images.metrics.socket.socket') as socket:
+            backend = StatsDMetrics(host='statsd', port=9125)
+
+        backend.incr('rendition.miss', 2)
+        backend.timing('encode', 0.25, {'format': 'jpeg'})
+        backend.observe('template.image.queries', 3)
+
+        self.assertEqual([call[0] for call in socket.return_value.sendto.call_args_list], [
+            (b'images.rendition.miss:2|c', ('statsd', 9125)),
+            (b'images.encode.jpeg:250.0|ms', ('statsd', 9125)),
+            (b'images.template.image.queries:3|h', ('statsd', 9125)),
+        ])
+
+    def test_send_errors_are_ignored(self):
+        with patch('images.metrics.socket.socket') as socket:
+            backend = StatsDMetrics()
+
+        socket.return_value.sendto.side_effect = OSError
+        backend.incr('rendition.miss')
+
+
+class TestPrometheusTextMetrics(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_render(self):
+        backend = PrometheusTextMetrics(os.path.join(self.dir, 'images.prom'), interval=60)
+        backend.incr('rendition.miss')
+        backend.incr('rendition.miss')
+        backend.timing('encode', 0.5, {'format': 'jpeg'})
+        backend.timing('encode', 0.25, {'format': 'jpeg'})
+        backend.observe('template.image.queries', 3)
+
+        self.assertEqual(backend.render(), '\n'.join([
+            '# TYPE images_rendition_miss_total counter',
+            'images_rendition_miss_total 2',
+            '# TYPE images_encode_seconds summary',
+            'images_encode_seconds_count{format="jpeg"} 2',
+            'images_encode_seconds_sum{format="jpeg"} 0.75',
+            '# TYPE images_template_image_queries summary',
+            'images_template_image_queries_count 1',
+            'images_template_image_queries_sum 3',
+        ]) + '\n')
+
+    def test_writes_file(self):
+        path = os.path.join(self.dir, 'images-{pid}.prom')
+        backend = PrometheusTextMetrics(path, interval=60)
+
+        backend.incr('rendition.hit')
+
+        with open(path.format(pid=os.getpid())) as f:
+            self.assertIn('images_rendition_hit_total 1', f.read())
+
+        # not written again until the interval has passed
+        backend.incr('rendition.hit')
+        with open(path.format(pid=os.getpid())) as f:
+            self.assertIn('images_rendition_hit_total 1', f.read())
+
+        backend.write()
+        with open(path.format(pid=os.getpid())) as f:
+            self.assertIn('images_rendition_hit_total 2', f.read())
@@ -1,11 +1,15 @@
+import hashlib
 import os
 from django.db import models
 from django.test import override_settings
+from mock import patch
 
-from images.models import Image
+from images.fields import ImageField, count_storage_reads
+from images.filter import Filter
+from images.models import Image, Rendition
 from images.rect import Rect
 from images.validators import validate_image_file_extension
-from tests.data import get_temporary_image
+from tests.data import get_temporary_image, get_temporary_jpeg
 from tests.test_case import AppTestCase
 
 
@@ -27,7 +31,7 @@ class ModelTests(AppTestCase):
 
     def test_file(self):
         field = Image._meta.get_field('file')
-        self.assertModelField(field, models.ImageField)
+        self.assertModelField(field, ImageField)
         self.assertEqual(field.upload_to, 'original_images/')
         self.assertEqual(field.width_field, 'width')
         self.assertEqual(field.height_field, 'height')
@@ -159,6 +163,7 @@ class GetRenditionTests(AppTestCase):
 
         self.assertEqual(image.renditions.count(), 3)
 
+        image.file = get_temporary_image(colour='black')
         image.save()
 
         self.assertEqual(image.renditions.count(), 1)
@@ -327,3 +332,444 @@ class GetRenditionTests(AppTestCase):
 
         # should have one rendition
         self.assertEqual(image.renditions.count(), 1)
+
+
+class GenerateRenditionsTests(AppTestCase):
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=[])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def setUp(self):
+        self.image = Image.objects.create(
+            title='Some Title',
+            file=get_temporary_image(size=(640, 480))
+        )
+
+    def test_returns_renditions_in_order(self):
+        renditions = self.image.generate_renditions(['width-100', 'original', 'height-100'])
+
+        self.assertEqual([r.filter_spec for r in renditions], ['width-100', 'original', 'height-100'])
+        self.assertEqual(renditions[0].width, 100)
+        self.assertEqual(renditions[1].width, 640)
+        self.assertEqual(renditions[2].height, 100)
+        self.assertEqual(self.image.renditions.count(), 3)
+
+    def test_decodes_original_once(self):
+        with patch.object(Image, 'get_willow_image', wraps=self.image.get_willow_image) as get_willow_image:
+            self.image.generate_renditions(['width-100', 'width-200', 'height-100'])
+
+        self.assertEqual(get_willow_image.call_count, 1)
+
+    def test_existing_renditions_are_not_generated(self):
+        existing = self.image.get_rendition('width-100')
+
+        with patch.object(Image, 'get_willow_image') as get_willow_image:
+            with self.assertNumQueries(1):
+                renditions = self.image.generate_renditions(['width-100'])
+
+        self.assertFalse(get_willow_image.called)
+        self.assertEqual(renditions[0].pk, existing.pk)
+
+    def test_same_spec_twice(self):
+        renditions = self.image.generate_renditions(['width-100', 'width-100'])
+
+        self.assertEqual(renditions[0].pk, renditions[1].pk)
+        self.assertEqual(self.image.renditions.count(), 1)
+
+    def test_stored_file_is_not_read_for_dimensions(self):
+        with patch('django.core.files.images.get_image_dimensions') as get_image_dimensions:
+            rendition = self.image.get_rendition('width-100')
+
+        self.assertFalse(get_image_dimensions.called)
+        self.assertEqual((rendition.width, rendition.height), (100, 75))
+        self.assertEqual(rendition.file.read()[:8], b'\x89PNG\r\n\x1a\n')
+
+    @override_settings(IMAGES_RENDITION_SPOOL_MAX_SIZE=1)
+    def test_large_output_is_spooled_to_disk(self):
+        rendition = self.image.get_rendition('width-100')
+
+        with rendition.get_willow_image() as willow:
+            self.assertEqual(willow.get_size(), (100, 75))
+
+    def test_file_stored_by_a_lost_race_is_deleted(self):
+        existing = self.image.get_rendition('width-100')
+        storage = existing.file.storage
+
+        # the existing rendition is not found so it is generated again
+        with patch.object(Image, '_find_renditions', return_value={}):
+            with patch.object(storage, 'delete', wraps=storage.delete) as delete:
+                rendition = self.image.get_rendition('width-100')
+
+        self.assertEqual(rendition.pk, existing.pk)
+        self.assertEqual(delete.call_count, 1)
+        self.assertNotEqual(delete.call_args[0][0], existing.file.name)
+        self.assertFalse(storage.exists(delete.call_args[0][0]))
+
+
+@override_settings(IMAGES_DEFAULT_FILTER_SPECS=[], IMAGES_THUMBNAIL_FILTER_SPEC=None)
+class StorageReadsTests(AppTestCase):
+
+    def test_rendition_miss_reads_only_the_original(self):
+        image = Image.objects.create(title='Some Title', file=get_temporary_image(size=(640, 480)))
+
+        with count_storage_reads() as storage_reads:
+            image.get_rendition('width-100')
+
+        self.assertEqual(storage_reads.count, 1)
+
+    def test_rendition_hit_reads_nothing(self):
+        image = Image.objects.create(title='Some Title', file=get_temporary_image(size=(640, 480)))
+        image.get_rendition('width-100')
+
+        with count_storage_reads() as storage_reads:
+            image.get_rendition('width-100')
+
+        self.assertEqual(storage_reads.count, 0)
+
+    def test_saved_file_is_read_again_by_default(self):
+        with count_storage_reads() as storage_reads:
+            image = Image.objects.create(title='Some Title', file=get_temporary_image(size=(640, 480)))
+
+        self.assertEqual(storage_reads.count, 1)
+        self.assertEqual((image.width, image.height), (640, 480))
+
+    @override_settings(IMAGES_SKIP_DIMENSION_UPDATE=True)
+    def test_saved_file_is_not_read_again(self):
+        with count_storage_reads() as storage_reads:
+            image = Image.objects.create(title='Some Title', file=get_temporary_image(size=(640, 480)))
+
+        self.assertEqual(storage_reads.count, 0)
+        self.assertEqual((image.width, image.height), (640, 480))
+
+    @override_settings(IMAGES_SKIP_DIMENSION_UPDATE=True)
+    def test_known_dimensions_are_kept(self):
+        with patch('django.core.files.images.get_image_dimensions') as get_image_dimensions:
+            image = Image.objects.create(
+                title='Some Title',
+                file=get_temporary_image(size=(640, 480)),
+                width=640,
+                height=480
+            )
+
+        self.assertFalse(get_image_dimensions.called)
+        self.assertEqual((image.width, image.height), (640, 480))
+
+    @override_settings(IMAGES_SKIP_DIMENSION_UPDATE=True)
+    def test_new_upload_is_read(self):
+        image = Image.objects.create(title='Some Title', file=get_temporary_image(size=(640, 480)))
+
+        image.file = get_temporary_image(size=(200, 100))
+        image.save()
+
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (200, 100))
+
+
+@override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100'], IMAGES_THUMBNAIL_FILTER_SPEC='width-50')
+class DeduplicateUploadsTests(AppTestCase):
+
+    def setUp(self):
+        self.image = Image.objects.create(title='Some Title', file=get_temporary_image(size=(640, 480)))
+
+    def test_file_hash(self):
+        upload = get_temporary_image(size=(640, 480))
+        upload.seek(0)
+        expected = hashlib.sha256(upload.read()).hexdigest()
+
+        self.assertEqual(self.image.file_hash, expected)
+        self.assertEqual(Image.objects.get(pk=self.image.pk).file_hash, expected)
+
+    def test_file_hash_kept_when_file_unchanged(self):
+        file_hash = self.image.file_hash
+        self.image.title = 'Other Title'
+        self.image.save()
+
+        self.assertEqual(self.image.file_hash, file_hash)
+
+    def test_not_shared_by_default(self):
+        duplicate = Image.objects.create(title='Duplicate', file=get_temporary_image(size=(640, 480)))
+
+        self.assertEqual(duplicate.file_hash, self.image.file_hash)
+        self.assertNotEqual(duplicate.file.name, self.image.file.name)
+
+    @override_settings(IMAGES_DEDUPLICATE_UPLOADS=True)
+    def test_duplicate_shares_file_and_renditions(self):
+        with patch.object(Image, 'get_willow_image') as get_willow_image:
+            duplicate = Image.objects.create(title='Duplicate', file=get_temporary_image(size=(640, 480)))
+
+        self.assertFalse(get_willow_image.called)
+        self.assertEqual(duplicate.file.name, self.image.file.name)
+        self.assertEqual((duplicate.width, duplicate.height), (640, 480))
+
+        files = sorted(self.image.renditions.values_list('filter_spec', 'file'))
+        self.assertEqual(sorted(duplicate.renditions.values_list('filter_spec', 'file')), files)
+        self.assertEqual(len(files), 2)
+
+    @override_settings(IMAGES_DEDUPLICATE_UPLOADS=True)
+    def test_different_content_is_not_shared(self):
+        other = Image.objects.create(title='Other', file=get_temporary_image(colour='black', size=(640, 480)))
+
+        self.assertNotEqual(other.file_hash, self.image.file_hash)
+        self.assertNotEqual(other.file.name, self.image.file.name)
+
+    @override_settings(IMAGES_DEDUPLICATE_UPLOADS=True)
+    def test_copy_renditions_leaves_out_focal_point_renditions(self):
+        self.image.set_focal_point(Rect(100, 100, 200, 200))
+        self.image.save()
+        self.image.get_rendition('fill-100x100')
+
+        duplicate = Image.objects.create(title='Duplicate', file=get_temporary_image(size=(640, 480)))
+
+        self.assertFalse(duplicate.renditions.filter(filter_spec='fill-100x100').exists())
+        self.assertEqual(duplicate.get_rendition('fill-100x100').width, 100)
+
+    def test_shared_file_is_kept_after_setting_is_turned_off(self):
+        with override_settings(IMAGES_DEDUPLICATE_UPLOADS=True):
+            duplicate = Image.objects.create(title='Duplicate', file=get_temporary_image(size=(640, 480)))
+
+        storage, name = self.image.file.storage, self.image.file.name
+
+        # the cleanup runs once the delete is committed
+        with patch('images.signals.transaction.on_commit', side_effect=lambda func: func()):
+            duplicate.delete()
+
+        self.assertTrue(storage.exists(name))
+
+        with patch('images.signals.transaction.on_commit', side_effect=lambda func: func()):
+            self.image.delete()
+
+        self.assertFalse(storage.exists(name))
+
+
+@override_settings(IMAGES_DEFAULT_FILTER_SPECS=[], IMAGES_THUMBNAIL_FILTER_SPEC=None)
+@override_settings(IMAGES_CONTENT_ADDRESSED_RENDITIONS=True)
+class ContentAddressedRenditionsTests(AppTestCase):
+
+    def setUp(self):
+        self.image = Image.objects.create(title='Some Title', file=get_temporary_image(size=(640, 480)))
+        self.other = Image.objects.create(title='Other Title', file=get_temporary_image(size=(640, 480)))
+
+    def test_file_name(self):
+        rendition = self.image.get_rendition('width-100|format-jpeg')
+
+        name = self.image.get_content_addressed_name('width-100|format-jpeg', '', 'jpeg')
+        self.assertEqual(rendition.file.name, 'images_renditions/' + name)
+        self.assertTrue(name.endswith('.jpg'))
+
+    def test_stored_file_is_used_for_the_same_content(self):
+        rendition = self.image.get_rendition('width-100')
+
+        with patch.object(Filter, 'process') as process:
+            other_rendition = self.other.get_rendition('width-100')
+
+        self.assertFalse(process.called)
+        self.assertNotEqual(other_rendition.pk, rendition.pk)
+        self.assertEqual(other_rendition.file.name, rendition.file.name)
+        self.assertEqual((other_rendition.width, other_rendition.height), (100, 75))
+
+    def test_focal_point_changes_file_name(self):
+        rendition = self.image.get_rendition('fill-100x100')
+
+        self.other.set_focal_point(Rect(100, 100, 200, 200))
+        self.other.save()
+        other_rendition = self.other.get_rendition('fill-100x100')
+
+        self.assertNotEqual(other_rendition.file.name, rendition.file.name)
+
+    def test_different_content_changes_file_name(self):
+        other = Image.objects.create(title='Other', file=get_temporary_image(colour='black', size=(640, 480)))
+
+        self.assertNotEqual(
+            other.get_rendition('width-100').file.name, self.image.get_rendition('width-100').file.name)
+
+    def test_shared_file_is_kept_after_setting_is_turned_off(self):
+        rendition = self.image.get_rendition('width-100')
+        other_rendition = self.other.get_rendition('width-100')
+        storage, name = rendition.file.storage, rendition.file.name
+
+        with override_settings(IMAGES_CONTENT_ADDRESSED_RENDITIONS=False):
+            # the cleanup runs once the delete is committed
+            with patch('images.signals.transaction.on_commit', side_effect=lambda func: func()):
+                rendition.delete()
+
+            self.assertTrue(storage.exists(name))
+            self.assertEqual(Rendition.objects.get(pk=other_rendition.pk).file.name, name)
+
+            with patch('images.signals.transaction.on_commit', side_effect=lambda func: func()):
+                other_rendition.delete()
+
+        self.assertFalse(storage.exists(name))
+
+    @override_settings(IMAGES_CONTENT_ADDRESSED_RENDITIONS=False)
+    def test_disabled(self):
+        rendition = self.image.get_rendition('width-100')
+        other_rendition = self.other.get_rendition('width-100')
+
+        self.assertNotEqual(other_rendition.file.name, rendition.file.name)
+
+    def test_stored_file_of_rotated_photo_keeps_its_size(self):
+        # stored as 200x100, shown rotated to 100x200
+        image = Image.objects.create(title='Rotated', file=get_temporary_jpeg(orientation=6))
+        other = Image.objects.create(title='Other rotated', file=get_temporary_jpeg(orientation=6))
+        rendition = image.get_rendition('width-100')
+
+        with patch.object(Filter, 'process') as process:
+            other_rendition = other.get_rendition('width-100')
+
+        self.assertFalse(process.called)
+        self.assertEqual(other_rendition.file.name, rendition.file.name)
+        self.assertEqual((rendition.width, rendition.height), (100, 200))
+        self.assertEqual((other_rendition.width, other_rendition.height), (100, 200))
+
+
+@override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100', 'fill-50x50'], IMAGES_THUMBNAIL_FILTER_SPEC=None)
+@override_settings(IMAGES_CLEAR_RENDITIONS_ON_SAVE=True)
+class SaveRenditionsTests(AppTestCase):
+
+    def setUp(self):
+        Image.objects.create(title='Some Title', file=get_temporary_image(size=(640, 480)))
+        self.image = Image.objects.get()
+        self.renditions = dict(self.image.renditions.values_list('filter_spec', 'pk'))
+
+    def test_changed_fields(self):
+        self.assertEqual(self.image.get_changed_fields(), set())
+
+        self.image.title = 'Other Title'
+        self.image.focal_point_x = 10
+        self.assertEqual(self.image.get_changed_fields(), {'focal_point_x'})
+
+        self.image.save()
+        self.assertEqual(self.image.get_changed_fields(), set())
+
+    def test_changed_fields_of_unsaved_image(self):
+        self.assertIsNone(Image(title='Some Title').get_changed_fields())
+
+    def test_title_change_leaves_renditions(self):
+        self.image.title = 'Other Title'
+
+        with patch.object(Image, 'generate_renditions') as generate_renditions:
+            self.image.save()
+
+        self.assertFalse(generate_renditions.called)
+        self.assertEqual(dict(self.image.renditions.values_list('filter_spec', 'pk')), self.renditions)
+
+    def test_focal_point_change_replaces_focal_point_renditions(self):
+        self.image.set_focal_point(Rect(100, 100, 200, 200))
+        self.image.save()
+
+        renditions = dict(self.image.renditions.values_list('filter_spec', 'pk'))
+        self.assertEqual(renditions['width-100'], self.renditions['width-100'])
+        self.assertNotEqual(renditions['fill-50x50'], self.renditions['fill-50x50'])
+        self.assertEqual(self.image.renditions.count(), 2)
+
+    def test_file_change_replaces_all_renditions(self):
+        self.image.file = get_temporary_image(colour='black', size=(640, 480))
+        self.image.save()
+
+        renditions = dict(self.image.renditions.values_list('filter_spec', 'pk'))
+        self.assertNotEqual(renditions['width-100'], self.renditions['width-100'])
+        self.assertNotEqual(renditions['fill-50x50'], self.renditions['fill-50x50'])
+
+
+@override_settings(IMAGES_CASCADE_RENDITIONS=True)
+class CascadeRenditionsTests(AppTestCase):
+
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=[])
+    @override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def setUp(self):
+        self.image = Image.objects.create(
+            title='Some Title',
+            file=get_temporary_image(size=(1600, 1200))
+        )
+
+    def test_generated_from_larger_rendition(self):
+        self.image.get_rendition('width-1200')
+
+        with patch.object(Image, 'get_willow_image') as get_willow_image:
+            rendition = self.image.get_rendition('max-400x400')
+
+        self.assertFalse(get_willow_image.called)
+        self.assertEqual((rendition.width, rendition.height), (400, 300))
+        self.assertEqual((rendition.file.width, rendition.file.height), (400, 300))
+
+    def test_smallest_larger_rendition_is_used(self):
+        small = self.image.get_rendition('width-600')
+        self.image.get_rendition('width-1200')
+        self.image.get_rendition('width-100')
+
+        with patch.object(Rendition, 'get_willow_image', autospec=True,
+                          side_effect=Rendition.get_willow_image) as get_willow_image:
+            self.image.get_rendition('width-500')
+
+        self.assertEqual(get_willow_image.call_args[0][0].pk, small.pk)
+
+    def test_same_size_as_predicted(self):
+        self.image.get_rendition('width-1000')
+
+        for filter_spec in ['width-333', 'height-333', 'min-333x333', 'max-333x333']:
+            rendition = self.image.get_rendition(filter_spec)
+            self.assertEqual(
+                (rendition.width, rendition.height),
+                Filter(spec=filter_spec).predict_size(self.image)
+            )
+
+    def test_format_operations_are_applied(self):
+        self.image.get_rendition('width-1200')
+
+        rendition = self.image.get_rendition('width-400|format-jpeg|jpegquality-40')
+
+        self.assertTrue(rendition.file.name.endswith('.jpg'))
+
+    def test_not_used_for_crops(self):
+        self.image.get_rendition('width-1200')
+
+        with patch.object(Image, 'get_willow_image', wraps=self.image.get_willow_image) as get_willow_image:
+            self.image.get_rendition('fill-300x300')
+
+        self.assertEqual(get_willow_image.call_count, 1)
+
+    def test_cropped_renditions_are_not_sources(self):
+        self.image.get_rendition('fill-1200x1200')
+
+        with patch.object(Image, 'get_willow_image', wraps=self.image.get_willow_image) as get_willow_image:
+            self.image.get_rendition('width-300')
+
+        self.assertEqual(get_willow_image.call_count, 1)
+
+    def test_uses_original_without_a_larger_rendition(self):
+        self.image.get_rendition('width-200')
+
+        with patch.object(Image, 'get_willow_image', wraps=self.image.get_willow_image) as get_willow_image:
+            rendition = self.image.get_rendition('width-300')
+
+        self.assertEqual(get_willow_image.call_count, 1)
+        self.assertEqual(rendition.width, 300)
+
+    def test_uses_original_when_stored_size_is_wrong(self):
+        # eg the original has an exif orientation so the stored size is not the oriented size
+        source = self.image.get_rendition('width-1200')
+        source.width, source.height = 900, 1200
+        source.save()
+
+        with patch.object(Image, 'get_willow_image', wraps=self.image.get_willow_image) as get_willow_image:
+            self.image.get_rendition('width-300')
+
+        self.assertEqual(get_willow_image.call_count, 1)
+
+    def test_invalid_stored_filter_specs_are_skipped(self):
+        source = self.image.get_rendition('width-1200')
+        for filter_spec in ['legacyop-10', 'width-1400|format-nonsense']:
+            self.image.renditions.create(
+                filter_spec=filter_spec, focal_point_key='', file=source.file.name, width=1200, height=900)
+
+        rendition = self.image.get_rendition('width-300')
+
+        self.assertEqual((rendition.width, rendition.height), (300, 225))
+
+    @override_settings(IMAGES_CASCADE_RENDITIONS=False)
+    def test_disabled(self):
+        self.image.get_rendition('width-1200')
+
+        with patch.object(Image, 'get_willow_image', wraps=self.image.get_willow_image) as get_willow_image:
+            self.image.get_rendition('width-300')
+
+        self.assertEqual(get_willow_image.call_count, 1)
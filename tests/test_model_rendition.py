@@ -1,5 +1,6 @@
 from django.db import models
 
+from images.fields import ImageField
 from images.models import Image, Rendition
 from tests.data import get_temporary_image
 from tests.test_case import AppTestCase
@@ -15,7 +16,7 @@ class ModelTests(AppTestCase):
 
     def test_file(self):
         field = Rendition._meta.get_field('file')
-        self.assertModelField(field, models.ImageField)
+        self.assertModelField(field, ImageField)
         self.assertEqual(field.upload_to, 'images_renditions/')
         self.assertEqual(field.width_field, 'width')
         self.assertEqual(field.height_field, 'height')
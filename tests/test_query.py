@@ -0,0 +1,90 @@
+from django import template
+from django.test import TestCase, override_settings
+
+from images.models import Image
+from images.query import prefetch_renditions
+from tests.data import get_temporary_image
+
+
+@override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100', 'width-200'])
+@override_settings(IMAGES_THUMBNAIL_FILTER_SPEC=None)
+class TestPrefetchRenditions(TestCase):
+    def setUp(self):
+        for i in range(3):
+            Image.objects.create(title='Image %s' % i, file=get_temporary_image())
+
+    def test_prefetch_renditions(self):
+        with self.assertNumQueries(2):
+            images = prefetch_renditions(Image.objects.all(), ['width-100', 'width-200'])
+
+        self.assertEqual(len(images), 3)
+
+        with self.assertNumQueries(0):
+            for image in images:
+                rendition = image.get_rendition('width-100')
+                self.assertEqual(rendition.width, 100)
+                self.assertEqual(rendition.alt, image.title)
+                self.assertEqual(image.get_rendition('width-200').width, 200)
+
+    def test_prefetch_renditions_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(prefetch_renditions(Image.objects.none(), ['width-100']), [])
+
+    def test_missing_renditions_are_generated(self):
+        images = prefetch_renditions(Image.objects.all(), ['width-50'])
+
+        for image in images:
+            self.assertEqual(image.get_rendition('width-50').width, 50)
+
+        self.assertEqual(Image.objects.first().renditions.filter(filter_spec='width-50').count(), 1)
+
+    def test_thumbnail_alias(self):
+        with override_settings(IMAGES_THUMBNAIL_FILTER_SPEC='width-100'):
+            images = prefetch_renditions(Image.objects.all(), ['thumbnail'])
+
+            with self.assertNumQueries(0):
+                for image in images:
+                    self.assertEqual(image.get_rendition('thumbnail').width, 100)
+
+    def test_queryset_method(self):
+        queryset = Image.objects.prefetch_renditions('width-100').order_by('pk')
+
+        with self.assertNumQueries(2):
+            images = list(queryset)
+            for image in images:
+                image.get_rendition('width-100')
+
+    def test_queryset_method_iterator(self):
+        queryset = Image.objects.prefetch_renditions('width-100').order_by('pk')
+
+        # one query for the images and one for the renditions of each chunk
+        with self.assertNumQueries(3):
+            for image in queryset.iterator(chunk_size=2):
+                self.assertEqual(image.get_rendition('width-100').width, 100)
+
+    def test_queryset_method_values_iterator(self):
+        queryset = Image.objects.prefetch_renditions('width-100').values_list('title', flat=True).order_by('pk')
+        self.assertEqual(list(queryset.iterator()), ['Image 0', 'Image 1', 'Image 2'])
+
+    def test_queryset_method_chained_filters(self):
+        queryset = Image.objects.prefetch_renditions('width-100').prefetch_renditions('width-200').filter(title='Image 1')
+
+        with self.assertNumQueries(2):
+            image = queryset[0]
+            image.get_rendition('width-100')
+            image.get_rendition('width-200')
+
+    def test_queryset_method_values(self):
+        titles = Image.objects.prefetch_renditions('width-100').values_list('title', flat=True)
+        self.assertEqual(len(titles), 3)
+
+    def test_template_tag_uses_prefetched_renditions(self):
+        temp = template.Template(
+            '{% load images_tags %}{% for img in images %}{% image img width-100 %}{% endfor %}'
+        )
+        context = template.Context({'images': Image.objects.prefetch_renditions('width-100')})
+
+        with self.assertNumQueries(2):
+            result = temp.render(context)
+
+        self.assertEqual(result.count('width="100"'), 3)
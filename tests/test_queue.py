@@ -0,0 +1,178 @@
+from django import template
+from django.test import TestCase, override_settings
+
+from images.models import Image, RenditionJob
+from images.queue import claim_job, process_queue, requeue_failed_jobs
+from images.shortcuts import get_rendition_or_not_found
+from tests.data import get_temporary_image
+
+
+@override_settings(IMAGES_DEFAULT_FILTER_SPECS=['width-100', 'width-200'])
+@override_settings(IMAGES_THUMBNAIL_FILTER_SPEC='width-50')
+class TestAsyncDefaultRenditions(TestCase):
+
+    @override_settings(IMAGES_ASYNC_DEFAULT_RENDITIONS=True)
+    def test_default_renditions_are_queued(self):
+        image = Image.objects.create(title='Test image', file=get_temporary_image())
+
+        self.assertEqual(image.renditions.count(), 0)
+        self.assertEqual(
+            sorted(image.rendition_jobs.values_list('filter_spec', flat=True)),
+            ['width-100', 'width-200', 'width-50']
+        )
+
+        self.assertEqual(process_queue(), 3)
+
+        self.assertEqual(image.renditions.count(), 3)
+        self.assertEqual(RenditionJob.objects.count(), 0)
+
+    @override_settings(IMAGES_ASYNC_DEFAULT_RENDITIONS=True)
+    def test_saving_twice_queues_once(self):
+        image = Image.objects.create(title='Test image', file=get_temporary_image())
+        image.save()
+
+        self.assertEqual(image.rendition_jobs.count(), 3)
+
+    @override_settings(IMAGES_ASYNC_DEFAULT_RENDITIONS=True)
+    def test_process_queue_limit(self):
+        Image.objects.create(title='Test image', file=get_temporary_image())
+
+        self.assertEqual(process_queue(limit=2), 2)
+        self.assertEqual(RenditionJob.objects.count(), 1)
+
+
+class TestRenditionJobs(TestCase):
+    fixtures = ['test']
+
+    @override_settings(IMAGES_RENDITION_JOB_MAX_ATTEMPTS=2)
+    def test_failed_job_is_retried_then_given_up(self):
+        bad_image = Image.objects.get(pk=1)
+        bad_image.enqueue_rendition('width-100')
+
+        self.assertEqual(process_queue(), 1)
+
+        job = RenditionJob.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertNotEqual(job.error, '')
+
+        # not retried until the job times out
+        self.assertEqual(process_queue(), 0)
+
+        with override_settings(IMAGES_RENDITION_JOB_TIMEOUT=-1):
+            self.assertEqual(process_queue(), 1)
+            self.assertEqual(process_queue(), 0)
+
+        self.assertEqual(RenditionJob.objects.get().attempts, 2)
+
+    @override_settings(IMAGES_RENDITION_JOB_MAX_ATTEMPTS=1)
+    @override_settings(IMAGES_RENDITION_JOB_MAX_ATTEMPTS=1, IMAGES_ASYNC_RENDITIONS=True)
+    def test_exhausted_job_stays_exhausted(self):
+        bad_image = Image.objects.get(pk=1)
+        bad_image.enqueue_rendition('width-100')
+
+        with self.assertLogs('images.queue', 'ERROR'):
+            self.assertEqual(process_queue(), 1)
+
+        # rendering the image again leaves the job the workers gave up on
+        for i in range(2):
+            template.Template('{% load images_tags %}{% image image width-100 %}').render(
+                template.Context({'image': bad_image}))
+        job = bad_image.rendition_jobs.get()
+
+        self.assertEqual(job.attempts, 1)
+        self.assertNotEqual(job.error, '')
+        self.assertIsNone(claim_job())
+
+    @override_settings(IMAGES_RENDITION_JOB_MAX_ATTEMPTS=1)
+    def test_requeue_failed_jobs(self):
+        bad_image = Image.objects.get(pk=1)
+        job = bad_image.enqueue_rendition('width-100')
+
+        with self.assertLogs('images.queue', 'ERROR'):
+            process_queue()
+
+        self.assertEqual(requeue_failed_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.started_at, job.error), (0, None, ''))
+        self.assertEqual(claim_job(), job)
+
+    @override_settings(IMAGES_RENDITION_JOB_MAX_ATTEMPTS=1)
+    @override_settings(IMAGES_DEFAULT_FILTER_SPECS=[], IMAGES_THUMBNAIL_FILTER_SPEC=None)
+    def test_new_file_requeues_failed_jobs(self):
+        bad_image = Image.objects.get(pk=1)
+        job = bad_image.enqueue_rendition('width-100')
+
+        with self.assertLogs('images.queue', 'ERROR'):
+            process_queue()
+
+        bad_image.title = 'Renamed'
+        bad_image.save()
+        self.assertIsNone(claim_job())
+
+        bad_image.file = get_temporary_image()
+        bad_image.save()
+        self.assertEqual(claim_job(), job)
+
+    def test_queued_job_is_left_alone(self):
+        bad_image = Image.objects.get(pk=1)
+        claimed = bad_image.enqueue_rendition('width-100')
+        claim_job()
+
+        job = bad_image.enqueue_rendition('width-100')
+
+        self.assertEqual(job.pk, claimed.pk)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.started_at)
+
+    def test_claimed_job_is_not_claimed_again(self):
+        bad_image = Image.objects.get(pk=1)
+        bad_image.enqueue_rendition('width-100')
+
+        self.assertIsNotNone(claim_job())
+        self.assertIsNone(claim_job())
+
+    @override_settings(IMAGES_RENDITION_JOB_TIMEOUT=-1)
+    def test_stale_job_is_reclaimed(self):
+        bad_image = Image.objects.get(pk=1)
+        bad_image.enqueue_rendition('width-100')
+
+        self.assertIsNotNone(claim_job())
+        self.assertIsNotNone(claim_job())
+
+
+@override_settings(IMAGES_ASYNC_RENDITIONS=True)
+class TestAsyncRenditions(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(title='Test image', file=get_temporary_image())
+
+    def test_placeholder(self):
+        rendition = get_rendition_or_not_found(self.image, 'width-200')
+
+        self.assertIsNone(rendition.pk)
+        self.assertEqual(rendition.url, self.image.file.url)
+        self.assertEqual(rendition.width, 200)
+        self.assertEqual(rendition.height, 100)
+        self.assertFalse(self.image.renditions.filter(filter_spec='width-200').exists())
+        self.assertTrue(self.image.rendition_jobs.filter(filter_spec='width-200').exists())
+
+    def test_existing_rendition(self):
+        existing = self.image.get_rendition('width-200')
+
+        rendition = get_rendition_or_not_found(self.image, 'width-200')
+
+        self.assertEqual(rendition.pk, existing.pk)
+        self.assertFalse(self.image.rendition_jobs.exists())
+
+    def test_image_tag(self):
+        temp = template.Template('{% load images_tags %}{% image image_obj fill-80x60 %}')
+        context = template.Context({'image_obj': self.image})
+
+        result = temp.render(context)
+        self.assertTrue('src="{}"'.format(self.image.file.url) in result)
+        self.assertTrue('width="80"' in result)
+        self.assertTrue('height="60"' in result)
+
+        process_queue()
+
+        result = temp.render(context)
+        self.assertTrue(self.image.get_rendition('fill-80x60').url in result)
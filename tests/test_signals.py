@@ -1,5 +1,6 @@
 from django.db import transaction
-from django.test import TransactionTestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from mock import patch
 
 from images.models import Image
 from tests.data import get_temporary_image
@@ -22,3 +23,50 @@ class TestFilesDeletedForDefaultModels(TransactionTestCase):
             rendition.delete()
             self.assertTrue(rendition.file.storage.exists(rendition.file.name))
         self.assertFalse(rendition.file.storage.exists(rendition.file.name))
+
+
+@override_settings(IMAGES_DEDUPLICATE_UPLOADS=True)
+@patch('images.signals.transaction.on_commit', side_effect=lambda func: func())
+class TestSharedFilesKept(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(title="Test Image", file=get_temporary_image())
+        self.duplicate = Image.objects.create(title="Duplicate", file=get_temporary_image())
+
+    def test_shared_image_file_kept_until_last_image_deleted(self, on_commit):
+        storage = self.image.file.storage
+        name = self.image.file.name
+        self.assertEqual(self.duplicate.file.name, name)
+
+        self.image.delete()
+        self.assertTrue(storage.exists(name))
+
+        self.duplicate.delete()
+        self.assertFalse(storage.exists(name))
+
+    def test_shared_rendition_file_kept(self, on_commit):
+        rendition = self.image.renditions.get(filter_spec='width-100')
+        storage = rendition.file.storage
+
+        self.image.delete()
+        self.assertTrue(storage.exists(rendition.file.name))
+        self.assertEqual(self.duplicate.renditions.get(filter_spec='width-100').file.name, rendition.file.name)
+
+
+@override_settings(IMAGES_CONTENT_ADDRESSED_RENDITIONS=True)
+@patch('images.signals.transaction.on_commit', side_effect=lambda func: func())
+class TestContentAddressedFilesKept(TestCase):
+    def test_shared_rendition_file_kept_until_last_rendition_deleted(self, on_commit):
+        image = Image.objects.create(title="Test Image", file=get_temporary_image())
+        other = Image.objects.create(title="Other Image", file=get_temporary_image())
+        rendition = image.get_rendition('width-100')
+        other_rendition = other.get_rendition('width-100')
+
+        storage = rendition.file.storage
+        name = rendition.file.name
+        self.assertEqual(other_rendition.file.name, name)
+
+        rendition.delete()
+        self.assertTrue(storage.exists(name))
+
+        other_rendition.delete()
+        self.assertFalse(storage.exists(name))
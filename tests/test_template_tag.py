@@ -1,7 +1,12 @@
 from django import template
-from django.test import override_settings
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from mock import patch
 
+from images.filter import get_filter
+from images.middleware import VaryOnAcceptMiddleware
 from images.models import Image
+from images.utils import generate_signature, get_rendition_version
 from tests.data import get_temporary_image
 from tests.test_case import AppTestCase
 
@@ -151,3 +156,171 @@ class TestImageTag(AppTestCase):
             )
             context = template.Context({'image_obj': self.image})
             temp.render(context)
+
+
+class TestImageTagFormatAuto(AppTestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_temporary_image(),
+        )
+
+    def render(self, accept, spec='width-100|format-auto', request=None):
+        request = request or RequestFactory().get('/', HTTP_ACCEPT=accept)
+        temp = template.Template('{% load images_tags %}{% image image_obj ' + spec.replace('|', ' ') + ' %}')
+        return temp.render(template.Context({'image_obj': self.image, 'request': request}))
+
+    def test_negotiated_from_request(self):
+        self.assertIn('.webp', self.render('image/webp,*/*'))
+        self.assertIn('.png', self.render('text/html,*/*'))
+        self.assertTrue(self.image.renditions.filter(filter_spec='width-100|format-webp').exists())
+        self.assertTrue(self.image.renditions.filter(filter_spec='width-100').exists())
+
+    def test_response_varies_on_accept(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT='image/webp,*/*')
+        self.render('', request=request)
+
+        response = VaryOnAcceptMiddleware().process_response(request, HttpResponse())
+        self.assertEqual(response['Vary'], 'Accept')
+
+    def test_response_without_auto_does_not_vary(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT='image/webp,*/*')
+        self.render('', spec='width-100', request=request)
+
+        response = VaryOnAcceptMiddleware().process_response(request, HttpResponse())
+        self.assertFalse(response.has_header('Vary'))
+
+    @patch('images.templatetags.images_tags._warned_vary_on_accept', False)
+    def test_warns_once_without_middleware(self):
+        with override_settings(MIDDLEWARE=[]):
+            with patch('images.templatetags.images_tags.logger') as logger:
+                self.render('image/webp,*/*')
+                self.render('image/webp,*/*')
+
+        self.assertEqual(logger.warning.call_count, 1)
+
+
+class TestImageUrlTag(AppTestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_temporary_image(),
+        )
+
+    def render(self, source, context):
+        return template.Template('{% load images_tags %}' + source).render(template.Context(context))
+
+    def test_renders_signed_url(self):
+        with self.assertNumQueries(0):
+            result = self.render('{% image_url image_obj "width-100" %}', {'image_obj': self.image})
+
+        version = get_rendition_version(self.image, get_filter('width-100'))
+        self.assertEqual(result, '/images/{}/{}/{}/width-100/'.format(
+            generate_signature(self.image.pk, 'width-100', version), self.image.pk, version))
+
+    def test_no_image(self):
+        self.assertEqual(self.render('{% image_url image_obj "width-100" %}', {'image_obj': None}), '')
+
+
+@override_settings(IMAGES_DEFAULT_FILTER_SPECS=[], IMAGES_THUMBNAIL_FILTER_SPEC=None)
+class TestResponsiveTags(AppTestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_temporary_image(size=(1000, 500)),
+        )
+
+    def render(self, source):
+        return template.Template('{% load images_tags %}' + source).render(template.Context({'image_obj': self.image}))
+
+    def get_url(self, filter_spec):
+        return self.image.renditions.get(filter_spec=filter_spec).url
+
+    def test_image_srcset(self):
+        result = self.render('{% image_srcset image_obj widths="200,400" sizes="50vw" class="photo" %}')
+
+        self.assertHTMLEqual(
+            result,
+            '<img src="{1}" srcset="{0} 200w, {1} 400w" width="400" height="200" alt="Test image" '
+            'sizes="50vw" class="photo">'.format(self.get_url('width-200'), self.get_url('width-400'))
+        )
+
+    def test_image_srcset_filter_spec(self):
+        self.render('{% image_srcset image_obj widths="200" filter_spec="fill-400x400" %}')
+
+        self.assertEqual(self.image.renditions.get().filter_spec, 'fill-400x400|width-200')
+
+    def test_image_srcset_leaves_out_repeated_widths(self):
+        result = self.render('{% image_srcset image_obj widths="800,2000,3000" %}')
+
+        self.assertIn('srcset="{} 800w, {} 1000w"'.format(
+            self.get_url('width-800'), self.get_url('width-2000')), result)
+
+    def test_image_srcset_single_query_and_decode(self):
+        self.image.get_rendition('width-200')
+
+        with patch.object(Image, 'get_willow_image', wraps=self.image.get_willow_image) as get_willow_image:
+            with self.assertNumQueries(9):
+                # one lookup, then a get_or_create of each of the two missing renditions
+                self.render('{% image_srcset image_obj widths="200,300,400" %}')
+
+        self.assertEqual(get_willow_image.call_count, 1)
+
+    @override_settings(IMAGES_ASYNC_RENDITIONS=True)
+    def test_image_srcset_async_uses_predicted_sizes(self):
+        result = self.render('{% image_srcset image_obj widths="200,400" %}')
+
+        self.assertIn('width="400"', result)
+        self.assertIn('height="200"', result)
+        self.assertEqual(self.image.renditions.count(), 0)
+        self.assertEqual(self.image.rendition_jobs.count(), 2)
+
+    def test_image_srcset_no_widths(self):
+        with self.assertRaises(template.TemplateSyntaxError):
+            self.render('{% image_srcset image_obj widths="" %}')
+
+    def test_picture(self):
+        result = self.render('{% picture image_obj widths="200,400" formats="png,jpeg" sizes="50vw" %}')
+
+        self.assertHTMLEqual(
+            result,
+            '<picture>'
+            '<source type="image/png" srcset="{0} 200w, {1} 400w" sizes="50vw">'
+            '<img src="{3}" srcset="{2} 200w, {3} 400w" width="400" height="200" alt="Test image" sizes="50vw">'
+            '</picture>'.format(
+                self.get_url('width-200|format-png'), self.get_url('width-400|format-png'),
+                self.get_url('width-200|format-jpeg'), self.get_url('width-400|format-jpeg'),
+            )
+        )
+
+    def test_picture_without_formats(self):
+        result = self.render('{% picture image_obj widths="200" %}')
+
+        self.assertHTMLEqual(
+            result,
+            '<picture><img src="{0}" srcset="{0} 200w" width="200" height="100" alt="Test image"></picture>'.format(
+                self.get_url('width-200'))
+        )
+
+    def test_invalid_widths(self):
+        for widths in ['200,abc', '200,-100', '0', '200.5']:
+            with self.assertRaises(template.TemplateSyntaxError):
+                self.render('{% image_srcset image_obj widths="' + widths + '" %}')
+            with self.assertRaises(template.TemplateSyntaxError):
+                self.render('{% picture image_obj widths="' + widths + '" %}')
+
+        self.assertEqual(self.image.renditions.count(), 0)
+
+    def test_picture_invalid_formats(self):
+        for formats in ['auto,png', 'png,bmp']:
+            with self.assertRaises(template.TemplateSyntaxError):
+                self.render('{% picture image_obj widths="200" formats="' + formats + '" %}')
+
+        # nothing is generated before the formats are checked
+        self.assertEqual(self.image.renditions.count(), 0)
+
+    def test_no_image(self):
+        result = template.Template('{% load images_tags %}{% image_srcset image_obj widths="200" %}').render(
+            template.Context({'image_obj': None}))
+
+        self.assertEqual(result, '')
@@ -0,0 +1,145 @@
+from django.test import TestCase, override_settings
+
+from images.filter import get_filter
+from images.models import Image
+from images.rect import Rect
+from images.utils import generate_signature, get_rendition_version, verify_signature
+from images.views import generate_image_url
+from tests.data import get_temporary_image
+
+
+class TestSignatures(TestCase):
+    def test_verify(self):
+        signature = generate_signature(1, 'width-100')
+
+        self.assertTrue(verify_signature(signature, 1, 'width-100'))
+        self.assertFalse(verify_signature(signature, 2, 'width-100'))
+        self.assertFalse(verify_signature(signature, 1, 'width-200'))
+
+    def test_verify_version(self):
+        signature = generate_signature(1, 'width-100', 'abc')
+
+        self.assertTrue(verify_signature(signature, 1, 'width-100', 'abc'))
+        self.assertFalse(verify_signature(signature, 1, 'width-100', 'abd'))
+        self.assertFalse(verify_signature(signature, 1, 'width-100'))
+
+    def test_depends_on_secret_key(self):
+        signature = generate_signature(1, 'width-100')
+
+        with override_settings(SECRET_KEY='another'):
+            self.assertFalse(verify_signature(signature, 1, 'width-100'))
+
+
+@override_settings(IMAGES_DEFAULT_FILTER_SPECS=[], IMAGES_THUMBNAIL_FILTER_SPEC=None)
+class TestServeView(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(
+            title="Test image",
+            file=get_temporary_image(),
+        )
+
+    def test_generate_image_url(self):
+        url = generate_image_url(self.image, 'format-png|width-100')
+        version = get_rendition_version(self.image, get_filter('width-100|format-png'))
+
+        self.assertEqual(url, '/images/{}/{}/{}/width-100%7Cformat-png/'.format(
+            generate_signature(self.image.pk, 'width-100|format-png', version), self.image.pk, version))
+
+    def test_focal_point_changes_url(self):
+        url = generate_image_url(self.image, 'fill-50x50')
+
+        self.image.set_focal_point(Rect(10, 10, 50, 50))
+        self.image.save()
+        self.image.refresh_from_db()
+        new_url = generate_image_url(self.image, 'fill-50x50')
+
+        self.assertNotEqual(new_url, url)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(new_url).status_code, 200)
+
+    def test_focal_point_does_not_change_url_of_filter_not_varying_with_it(self):
+        url = generate_image_url(self.image, 'width-100')
+
+        self.image.set_focal_point(Rect(10, 10, 50, 50))
+        self.image.save()
+
+        self.assertEqual(generate_image_url(self.image, 'width-100'), url)
+
+    def test_new_file_changes_url(self):
+        url = generate_image_url(self.image, 'width-100')
+
+        self.image.file = get_temporary_image(colour='black')
+        self.image.save()
+
+        self.assertNotEqual(generate_image_url(self.image, 'width-100'), url)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_serves_rendition(self):
+        response = self.client.get(generate_image_url(self.image, 'width-100'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=2592000', response['Cache-Control'])
+        self.assertTrue(response.has_header('ETag'))
+        self.assertEqual(self.image.renditions.get().filter_spec, 'width-100')
+        self.assertEqual(b''.join(response.streaming_content), self.image.renditions.get().file.read())
+
+    def test_not_modified(self):
+        url = generate_image_url(self.image, 'width-100')
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(IMAGES_SERVE_CACHE_MAX_AGE=60)
+    def test_max_age_setting(self):
+        response = self.client.get(generate_image_url(self.image, 'width-100'))
+
+        self.assertIn('max-age=60', response['Cache-Control'])
+
+    def test_format_auto_url(self):
+        self.assertIn('/width-100%7Cformat-auto/', generate_image_url(self.image, 'format-auto|width-100'))
+        self.assertIn('/format-auto/', generate_image_url(self.image, 'format-auto'))
+        self.assertIn('/width-100%7Cformat-png/', generate_image_url(self.image, 'format-auto|width-100|format-png'))
+
+    def test_format_auto(self):
+        url = generate_image_url(self.image, 'width-100|format-auto')
+
+        webp = self.client.get(url, HTTP_ACCEPT='image/webp,*/*')
+        original = self.client.get(url, HTTP_ACCEPT='*/*')
+
+        self.assertEqual(webp['Content-Type'], 'image/webp')
+        self.assertEqual(original['Content-Type'], 'image/png')
+        self.assertIn('Accept', webp['Vary'])
+        self.assertEqual(
+            sorted(self.image.renditions.values_list('filter_spec', flat=True)),
+            ['width-100', 'width-100|format-webp']
+        )
+
+    def test_bad_signature(self):
+        version = get_rendition_version(self.image, get_filter('width-100'))
+        response = self.client.get('/images/{}/{}/{}/width-100/'.format(
+            generate_signature(self.image.pk, 'width-200', version), self.image.pk, version))
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.image.renditions.exists())
+
+    def test_invalid_filter_spec(self):
+        response = self.client.get('/images/{}/{}/v/nonsense/'.format(
+            generate_signature(self.image.pk, 'nonsense', 'v'), self.image.pk))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_missing_image(self):
+        response = self.client.get('/images/{}/999/v/width-100/'.format(generate_signature(999, 'width-100', 'v')))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_missing_source_file(self):
+        self.image.file.storage.delete(self.image.file.name)
+
+        response = self.client.get(generate_image_url(self.image, 'width-100'))
+
+        self.assertEqual(response.status_code, 410)